@@ -1,9 +1,16 @@
 # admin.py
 
+import time
 from functools import wraps
-from flask import Blueprint, render_template, redirect, url_for, session, flash, current_app
-from database import get_db  # Importa a função get_db
-from auth import login_required  # Importa o decorador de login
+from flask import Blueprint, render_template, redirect, url_for, session, flash, current_app, jsonify, g, request
+from database import get_db, estatisticas_pool, estatisticas_replicas, somente_leitura  # Importa a função get_db
+from auth import login_required, obter_identidade, invalidar_identidade  # Importa o decorador de login
+from metricas import resumo_acessos
+from imagens import excluir_fotos, remover_arquivos
+from tarefas import obter_fila, profundidade_fila
+from emails import obter_envio, profundidade_caixa
+from perfil_sql import obter_perfil
+from cache_paginas import invalidar_paginas
 
 # Cria um Blueprint para as rotas de administração
 bp = Blueprint('admin', __name__, url_prefix='/admin')
@@ -19,9 +26,10 @@ def admin_required(f):
         if 'usuario_id' not in session:
             flash('Você precisa estar logado para acessar esta página.', 'info')
             return redirect(url_for('auth.login'))
-        db = get_db()
-        user = db.execute('SELECT tipo_usuario FROM usuarios WHERE id = ?',
-                          (session['usuario_id'],)).fetchone()
+        # Lida do banco, não do cache por worker: um admin removido ou rebaixado em
+        # outro worker perde o acesso na hora
+        user = obter_identidade(session['usuario_id'], atual=True)
+        g.usuario = user
         if not user or user['tipo_usuario'] != 'admin':
             flash(
                 'Acesso não autorizado. Apenas administradores podem acessar esta página.', 'danger')
@@ -30,69 +38,185 @@ def admin_required(f):
         return f(*args, **kwargs)
     return wrapped
 
+# ----- ESTATÍSTICAS E PAGINAÇÃO DO PAINEL -----
+
+# Retrato dos contadores do painel: (expira_em, dados). Vale ADMIN_STATS_TTL segundos
+# e é descartado quando uma ação do admin neste worker altera usuários ou imóveis.
+_stats_cache = None
+
+# Colunas aceitas em ?usuarios_ordem= e ?imoveis_ordem= (nome na URL -> expressão SQL)
+ORDENS_USUARIOS = {
+    'id': 'id', 'nome': 'nome', 'email': 'email', 'tipo': 'tipo_usuario',
+}
+ORDENS_IMOVEIS = {
+    'id': 'imoveis.id', 'tipo': 'imoveis.tipo', 'endereco': 'imoveis.endereco',
+    'valor': 'imoveis.valor', 'dono': 'usuarios.nome', 'status': 'imoveis.ativo',
+}
+
+# Consultas do painel (também usadas por verificar_indices.py)
+SQL_ESTATISTICAS = """
+    SELECT
+        (SELECT COUNT(*) FROM usuarios) AS total_usuarios,
+        (SELECT COUNT(*) FROM imoveis) AS total_imoveis,
+        (SELECT COUNT(*) FROM imoveis WHERE ativo = 1) AS ativos,
+        (SELECT COUNT(*) FROM usuarios WHERE solicitacao_exclusao = 1) AS exclusoes_pendentes,
+        (SELECT COALESCE(MAX(count), 0) FROM click_counts
+         WHERE event_name = 'contact_anunciante_click') AS contact_anunciante_clicks
+"""
+SQL_SOLICITACOES_EXCLUSAO = 'SELECT id, nome, email, telefone FROM usuarios WHERE solicitacao_exclusao = 1'
+SQL_EXCLUIR_IMOVEIS_DO_USUARIO = 'DELETE FROM imoveis WHERE usuario_id = ? RETURNING id'
+
+def invalidar_estatisticas():
+    global _stats_cache
+    _stats_cache = None
+
+def obter_estatisticas(db):
+    """
+    Todos os contadores do painel numa única consulta, guardados por ADMIN_STATS_TTL segundos.
+    """
+    global _stats_cache
+    agora = time.monotonic()
+    cache = _stats_cache
+    if cache and cache[0] > agora:
+        return cache[1]
+
+    row = db.execute(SQL_ESTATISTICAS).fetchone()
+    stats = dict(row)
+    stats['inativos'] = stats['total_imoveis'] - stats['ativos']
+    _stats_cache = (agora + current_app.config['ADMIN_STATS_TTL'], stats)
+    return stats
+
+def _ler_paginacao(prefixo, ordens, total):
+    """
+    Lê página, coluna e direção de ordenação de uma tabela do painel (ex.: usuarios_pagina).
+    """
+    por_pagina = current_app.config['ADMIN_POR_PAGINA']
+    paginas = max(1, -(-total // por_pagina))
+    pagina = request.args.get(f'{prefixo}_pagina', 1, type=int)
+    pagina = min(max(pagina, 1), paginas)
+    ordem = request.args.get(f'{prefixo}_ordem', 'id')
+    if ordem not in ordens:
+        ordem = 'id'
+    direcao = 'desc' if request.args.get(f'{prefixo}_dir') == 'desc' else 'asc'
+    return {
+        'pagina': pagina, 'paginas': paginas, 'ordem': ordem, 'dir': direcao,
+        'limite': por_pagina, 'offset': (pagina - 1) * por_pagina,
+    }
+
 # ----- ROTAS DE ADMINISTRAÇÃO -----
 
 @bp.route('/')
+@somente_leitura
 @login_required
 @admin_required
 def admin():
     """
     Página do painel de administração.
-    Exibe estatísticas e listas de usuários e imóveis.
+    Exibe estatísticas e listas paginadas de usuários e imóveis.
     """
     db = get_db()
 
-    # Total de usuários
+    # Total de usuários, imóveis (ativos e inativos), exclusões pendentes e cliques
+    stats = obter_estatisticas(db)
+
+    # Página atual de usuários
+    pag_usuarios = _ler_paginacao('usuarios', ORDENS_USUARIOS, stats['total_usuarios'])
     usuarios = db.execute(
-        'SELECT id, nome, email, telefone, tipo_usuario FROM usuarios'
+        f"""
+        SELECT id, nome, email, telefone, tipo_usuario FROM usuarios
+        ORDER BY {ORDENS_USUARIOS[pag_usuarios['ordem']]} {pag_usuarios['dir']}, id
+        LIMIT ? OFFSET ?
+        """, (pag_usuarios['limite'], pag_usuarios['offset'])
     ).fetchall()
-    total_usuarios = len(usuarios)
 
-    # Total de imóveis, ativos e inativos
-    total_imoveis = db.execute('SELECT COUNT(*) FROM imoveis').fetchone()[0]
-    ativos = db.execute(
-        'SELECT COUNT(*) FROM imoveis WHERE ativo = 1'
-    ).fetchone()[0]
-    inativos = total_imoveis - ativos
-
-    # Lista completa de imóveis com nome do dono
+    # Página atual de imóveis com nome do dono
+    pag_imoveis = _ler_paginacao('imoveis', ORDENS_IMOVEIS, stats['total_imoveis'])
     imoveis = db.execute(
-        '''
-        SELECT imoveis.*, usuarios.nome AS dono_nome
+        f"""
+        SELECT imoveis.id, imoveis.tipo, imoveis.endereco, imoveis.valor, imoveis.ativo,
+               usuarios.nome AS dono_nome
         FROM imoveis
         JOIN usuarios ON imoveis.usuario_id = usuarios.id
-        '''
+        ORDER BY {ORDENS_IMOVEIS[pag_imoveis['ordem']]} {pag_imoveis['dir']}, imoveis.id
+        LIMIT ? OFFSET ?
+        """, (pag_imoveis['limite'], pag_imoveis['offset'])
     ).fetchall()
 
     # Busca por solicitações de exclusão pendentes (solicitacao_exclusao = 1)
-    solicitacoes_pendentes = db.execute(
-        'SELECT id, nome, email, telefone FROM usuarios WHERE solicitacao_exclusao = 1'
-    ).fetchall()
+    solicitacoes_pendentes = []
+    if stats['exclusoes_pendentes']:
+        solicitacoes_pendentes = db.execute(SQL_SOLICITACOES_EXCLUSAO).fetchall()
 
-    # Busca a contagem de cliques no botão "Falar com anunciante"
-    # COALESCE garante que, se a linha não existir (ainda não houve cliques), ele retorne 0.
-    contact_anunciante_clicks_row = db.execute(
-        "SELECT count FROM click_counts WHERE event_name = 'contact_anunciante_click'"
-    ).fetchone()
-    contact_anunciante_clicks = contact_anunciante_clicks_row[
-        'count'] if contact_anunciante_clicks_row else 0
-
-    acessos = getattr(current_app, 'acessos', 0)
+    # Acessos já consolidados por hora/dia/rota (metricas.py)
+    resumo = resumo_acessos(db, bool(current_app.config.get('DATABASE_URL')))
 
     return render_template(
         'admin.html',
         usuarios=usuarios,
-        total_usuarios=total_usuarios,
-        total_imoveis=total_imoveis,
-        ativos=ativos,
-        inativos=inativos,
-        acessos=acessos,
+        pag_usuarios=pag_usuarios,
+        total_usuarios=stats['total_usuarios'],
+        total_imoveis=stats['total_imoveis'],
+        ativos=stats['ativos'],
+        inativos=stats['inativos'],
+        acessos=resumo['pagina_inicial'],
+        acessos_resumo=resumo,
         imoveis=imoveis,
+        pag_imoveis=pag_imoveis,
         solicitacoes_pendentes=solicitacoes_pendentes,
         # Passa a contagem de cliques para o template
-        contact_anunciante_clicks=contact_anunciante_clicks
+        contact_anunciante_clicks=stats['contact_anunciante_clicks']
+    )
+
+@bp.route('/pool')
+@login_required
+@admin_required
+def admin_pool():
+    """
+    Estatísticas do pool de conexões PostgreSQL do worker que atendeu a requisição
+    (e dos pools das réplicas de leitura, se houver).
+    """
+    estatisticas = estatisticas_pool() or {}
+    replicas = estatisticas_replicas()
+    if replicas:
+        estatisticas['replicas'] = replicas
+    return jsonify(estatisticas)
+
+@bp.route('/tarefas')
+@login_required
+@admin_required
+def admin_tarefas():
+    """
+    Tamanho da fila de tarefas (todos os workers) e o consumidor do worker que atendeu.
+    """
+    fila = obter_fila(current_app._get_current_object())
+    return jsonify(
+        fila=profundidade_fila(get_db()),
+        worker=fila.estatisticas() if fila else {},
+    )
+
+@bp.route('/emails')
+@login_required
+@admin_required
+def admin_emails():
+    """
+    Tamanho da caixa de saída de e-mails (todos os workers) e o envio do worker que atendeu.
+    """
+    envio = obter_envio(current_app._get_current_object())
+    return jsonify(
+        caixa=profundidade_caixa(get_db()),
+        worker=envio.estatisticas() if envio else {},
     )
 
+@bp.route('/consultas')
+@login_required
+@admin_required
+def admin_consultas():
+    """
+    Perfil das consultas SQL de todos os workers: as que mais somam tempo, as requisições
+    que mais gastaram em SQL, as consultas lentas (com plano) e os possíveis N+1.
+    """
+    return jsonify(obter_perfil(current_app._get_current_object()).relatorio())
+
 # Rotas para gerenciar solicitações de exclusão de conta
 
 @bp.route('/aceitar_exclusao/<int:user_id>', methods=['POST'])
@@ -108,10 +232,15 @@ def aceitar_exclusao(user_id):
         return redirect(url_for('admin.admin'))
 
     # ATENÇÃO: Ao aceitar a exclusão, todos os imóveis associados a este usuário serão DELETADOS.
-    db.execute('DELETE FROM imoveis WHERE usuario_id = ?', (user_id,))
+    excluidos = db.execute(SQL_EXCLUIR_IMOVEIS_DO_USUARIO, (user_id,)).fetchall()
+    orfas = excluir_fotos(db, [r['id'] for r in excluidos])
 
     db.execute('DELETE FROM usuarios WHERE id = ?', (user_id,))
+    invalidar_paginas(db, 'imoveis', f'usuario:{user_id}')
     db.commit()
+    remover_arquivos(orfas)
+    invalidar_identidade(user_id)
+    invalidar_estatisticas()
 
     flash(
         f'Solicitação de exclusão para o usuário ID {user_id} aprovada e conta excluída.', 'success')
@@ -137,6 +266,7 @@ def negar_exclusao(user_id):
         (user_id,)
     )
     db.commit()
+    invalidar_estatisticas()
     flash(
         f'Solicitação de exclusão para o usuário ID {user_id} negada.', 'info')
     # TODO: Lógica para enviar e-mail de negação aqui.
@@ -157,7 +287,9 @@ def admin_toggle_anuncio(id):
 
     novo_status = 0 if imovel['ativo'] else 1
     db.execute('UPDATE imoveis SET ativo = ? WHERE id = ?', (novo_status, id))
+    invalidar_paginas(db, 'imoveis', f'imovel:{id}')
     db.commit()
+    invalidar_estatisticas()
     flash(
         f'Status do anúncio alterado para {"ativo" if novo_status else "inativo"} com sucesso!', 'success')
     return redirect(url_for('admin.admin'))
@@ -168,9 +300,14 @@ def admin_toggle_anuncio(id):
 @admin_required
 def admin_excluir_imovel(id):
     db = get_db()
-    cursor = db.execute('DELETE FROM imoveis WHERE id = ?', (id,))
+    excluidos = db.execute('DELETE FROM imoveis WHERE id = ? RETURNING id', (id,)).fetchall()
+    orfas = excluir_fotos(db, [r['id'] for r in excluidos])
+    if excluidos:
+        invalidar_paginas(db, 'imoveis', f'imovel:{id}')
     db.commit()
-    if cursor.rowcount > 0:
+    remover_arquivos(orfas)
+    invalidar_estatisticas()
+    if excluidos:
         flash('Imóvel excluído com sucesso pelo administrador.', 'success')
     else:
         flash('Imóvel não encontrado.', 'danger')
@@ -186,8 +323,16 @@ def excluir_usuario(id):
         return redirect(url_for('admin.admin'))
 
     db = get_db()
+    # Os imóveis do usuário saem junto (no PostgreSQL o ON DELETE CASCADE faria isso,
+    # mas aqui também liberamos as fotos deles)
+    excluidos = db.execute(SQL_EXCLUIR_IMOVEIS_DO_USUARIO, (id,)).fetchall()
+    orfas = excluir_fotos(db, [r['id'] for r in excluidos])
     cursor = db.execute('DELETE FROM usuarios WHERE id = ?', (id,))
+    invalidar_paginas(db, 'imoveis', f'usuario:{id}')
     db.commit()
+    remover_arquivos(orfas)
+    invalidar_identidade(id)
+    invalidar_estatisticas()
     if cursor.rowcount > 0:
         flash("Usuário excluído com sucesso pelo administrador.", 'success')
     else:
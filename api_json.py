@@ -0,0 +1,114 @@
+# api_json.py
+# Respostas da API JSON pública: serialização com orjson (se instalado), cursores opacos
+# de paginação e gzip, inclusive nas respostas enviadas aos poucos (streaming).
+
+import base64
+import binascii
+import gzip
+import json
+import zlib
+from functools import wraps
+
+from flask import current_app, make_response, request
+
+try:
+    import orjson  # Opcional: sem ele a serialização usa o json da biblioteca padrão
+except ImportError:
+    orjson = None
+
+# Nível do gzip: comprime quase tanto quanto o 9 gastando bem menos CPU por requisição
+NIVEL_GZIP = 6
+
+
+def para_json(obj):
+    """
+    Serializa em bytes UTF-8, sem espaços.
+    """
+    if orjson:
+        return orjson.dumps(obj)
+    return json.dumps(obj, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+
+
+def de_json(dados):
+    if orjson:
+        return orjson.loads(dados)
+    return json.loads(dados)
+
+
+# ----- CURSORES -----
+
+def codificar_cursor(posicao):
+    """
+    Cursor da próxima página: a posição do último item ({'apos_valor': ..., 'apos_id': ...})
+    em base64 para URL. O cliente só devolve o texto, sem depender do formato.
+    """
+    return base64.urlsafe_b64encode(para_json(posicao)).rstrip(b'=').decode('ascii')
+
+
+def ler_cursor(cursor, chaves):
+    """
+    Posição guardada no cursor, com só as `chaves` esperadas e valores numéricos.
+    Retorna None se o cursor for inválido.
+    """
+    try:
+        posicao = de_json(base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)))
+    except (ValueError, binascii.Error):
+        return None
+    if not isinstance(posicao, dict) or not set(posicao) <= set(chaves):
+        return None
+    if not all(isinstance(v, (int, float)) and not isinstance(v, bool) for v in posicao.values()):
+        return None
+    return posicao
+
+
+# ----- GZIP -----
+
+def _comprimir_partes(partes):
+    compressor = zlib.compressobj(NIVEL_GZIP, zlib.DEFLATED, 16 + zlib.MAX_WBITS)  # Formato gzip
+    try:
+        for parte in partes:
+            dados = compressor.compress(parte)
+            if dados:
+                yield dados
+        yield compressor.flush()
+    finally:
+        # Fecha o gerador da rota (e o contexto da requisição) mesmo se o cliente desistir
+        if hasattr(partes, 'close'):
+            partes.close()
+
+
+def _enfraquecer_etag(response):
+    etag, fraca = response.get_etag()
+    if etag and not fraca:
+        response.set_etag(etag, weak=True)
+
+
+def comprimir_gzip(view):
+    """
+    Decorador das rotas da API: comprime a resposta com gzip se o cliente aceitar. Vai
+    por fora de cache_publico, então o cache guarda o JSON puro e o 304 continua valendo;
+    para quem aceita gzip a ETag vira fraca (W/"..."), como fazem os proxies, também no 304.
+    """
+    @wraps(view)
+    def wrapped(*args, **kwargs):
+        response = make_response(view(*args, **kwargs))
+        response.vary.add('Accept-Encoding')
+        if not request.accept_encodings['gzip'] or response.status_code not in (200, 304):
+            return response
+        # Para quem aceita gzip a ETag é sempre fraca, comprimida ou não (abaixo de
+        # API_GZIP_MINIMO): o 304, que não tem corpo para saber o tamanho, devolve a
+        # mesma ETag que o cliente recebeu no 200
+        _enfraquecer_etag(response)
+        if response.status_code != 200 or 'Content-Encoding' in response.headers:
+            return response
+        if response.is_streamed:
+            response.response = _comprimir_partes(response.response)
+            response.headers.pop('Content-Length', None)
+        else:
+            corpo = response.get_data()
+            if len(corpo) < current_app.config['API_GZIP_MINIMO']:
+                return response
+            response.set_data(gzip.compress(corpo, NIVEL_GZIP))
+        response.headers['Content-Encoding'] = 'gzip'
+        return response
+    return wrapped
@@ -1,16 +1,40 @@
 # app.py (Arquivo principal da aplicação)
 
-from flask import Flask, render_template, g, flash, session, jsonify, request, current_app # current_app adicionado
+import hmac
+import logging
+import time
+
+from flask import Flask, render_template, g, session, jsonify, request, abort
 # Importa funções do módulo database
-from database import close_db, inicializar_banco, get_db # get_db adicionado
+from database import close_db, inicializar_banco, marcar_escrita
 # Importa os blueprints
-from auth import bp as auth_bp
+from auth import bp as auth_bp, obter_identidade
 from properties import bp as properties_bp
 from admin import bp as admin_bp
 from config import Config # Importa a classe de configuração
+from cliques import obter_agregador # Agregador de cliques do /track_click
+from metricas import obter_contador # Contagem de acessos por rota
+from imagens import imagem_imovel, cache_imutavel # Helpers das fotos dos imóveis
+from tarefas import obter_fila # Fila de tarefas em segundo plano
+from emails import obter_envio # Envio da caixa de saída de e-mails
+from assets import bp as assets_bp, preparar_assets, url_for_assets # CSS/JS versionados
+from cache_paginas import cache_publico # Cache das páginas públicas para visitantes
+from telemetria import obter_telemetria # Métricas do Prometheus em /metrics
+from perfil_sql import obter_perfil # Perfil das consultas SQL
+from logs import caminho_para_log, configurar_logs, novo_request_id # Logs em JSON sem I/O na requisição
 
 app = Flask(__name__)
 app.config.from_object(Config) # Carrega as configurações da classe Config
+configurar_logs(app) # Antes de tudo que possa registrar mensagens
+
+log_acesso = logging.getLogger('acesso')
+
+# Helper {{ imagem_imovel(nome, uso) }} disponível em todos os templates
+app.jinja_env.globals['imagem_imovel'] = imagem_imovel
+
+# Nos templates, url_for('static', ...) de CSS/JS aponta para a versão com hash (assets.py)
+app.jinja_env.globals['url_for'] = url_for_assets
+preparar_assets(app)
 
 # Registra as funções de teardown do app context
 app.teardown_appcontext(close_db)
@@ -19,9 +43,7 @@ app.teardown_appcontext(close_db)
 app.register_blueprint(auth_bp)
 app.register_blueprint(properties_bp)
 app.register_blueprint(admin_bp)
-
-# Variável global para contagem de acessos (exemplo)
-app.acessos = 0
+app.register_blueprint(assets_bp)
 
 @app.route('/track_click', methods=['POST'])
 def track_click():
@@ -30,38 +52,28 @@ def track_click():
         event_name = data.get('event_name') # Pega o nome do evento
 
         if event_name:
-            db = get_db() # Obtém a conexão com o banco de dados
-            
-            # NOVO: Crie um cursor a partir da conexão
-            if current_app.config.get('DATABASE_URL'):
-                cur = db.cursor() 
-            else:
-                cur = db
-
-            param_placeholder = "%s" if current_app.config.get('DATABASE_URL') else "?"
-
-            try:
-                if current_app.config.get('DATABASE_URL'): # PostgreSQL
-                    cur.execute( # Use cur.execute
-                        """
-                        INSERT INTO click_counts (event_name, count) VALUES (%s, %s)
-                        ON CONFLICT (event_name) DO UPDATE SET count = click_counts.count + 1
-                        """,
-                        (event_name, 1) # No PostgreSQL, insere 1 ou incrementa 1
-                    )
-                else: # SQLite
-                    cur.execute( # Use cur.execute
-                        'INSERT OR REPLACE INTO click_counts (event_name, count) VALUES (?, COALESCE((SELECT count FROM click_counts WHERE event_name = ?), 0) + 1)',
-                        (event_name, event_name)
-                    )
-                db.commit() # Salva as mudanças
-                return jsonify(success=True, message=f"Clique para '{event_name}' rastreado com sucesso"), 200
-            except Exception as e:
-                db.rollback() # Reverte em caso de erro
-                print(f"Erro ao rastrear clique: {e}")
-                return jsonify(success=False, message=f"Erro ao rastrear clique: {e}"), 500
+            # O clique é somado em memória e gravado em lote em click_counts (ver cliques.py),
+            # então a requisição não espera pelo banco
+            obter_agregador(app).registrar(event_name)
+            return jsonify(success=True, message=f"Clique para '{event_name}' rastreado com sucesso"), 200
     return jsonify(success=False, message="Requisição inválida"), 400
 
+@app.route('/metrics')
+def metricas_prometheus():
+    """
+    Métricas de todos os workers no formato de texto do Prometheus (ver telemetria.py).
+    Sem TELEMETRIA_TOKEN configurado a rota não existe (404).
+    """
+    token = app.config.get('TELEMETRIA_TOKEN')
+    if not token:
+        abort(404)
+    if not hmac.compare_digest(request.headers.get('Authorization', ''), f'Bearer {token}'):
+        abort(401)
+    return obter_telemetria(app).exportar(), 200, {
+        'Content-Type': 'text/plain; version=0.0.4; charset=utf-8',
+        'Cache-Control': 'no-store',
+    }
+
 # ----- CONTEXTO GLOBAL (mantido aqui para ser global para toda a aplicação) -----
 # Este context_processor é global para todas as rotas de todos os blueprints
 
@@ -69,29 +81,20 @@ def track_click():
 def inject_usuario():
     """
     Injeta informações do usuário logado em todos os templates.
+    Usa a identidade já carregada em load_logged_in_user, sem consultar o banco.
     """
-    usuario_nome = tipo_usuario = None
-    # Usa g.get para evitar KeyError se não estiver setado
-    user_id = g.get('usuario_id')
-    if user_id:
-        db = get_db()
-        # NOVO: Crie um cursor a partir da conexão para PostgreSQL (com DictCursor) ou use a conexão direta para SQLite
-        if current_app.config.get('DATABASE_URL'):
-            import psycopg2.extras # Importado aqui para evitar circular import se database.py for usar current_app
-            cur = db.cursor(cursor_factory=psycopg2.extras.DictCursor)
-        else: # Para SQLite
-            cur = db # A conexão SQLite tem execute() diretamente ou age como um cursor
-
-        param_placeholder = "%s" if current_app.config.get('DATABASE_URL') else "?"
-        
-        cur.execute( # Use cur.execute
-            f'SELECT nome, tipo_usuario FROM usuarios WHERE id = {param_placeholder}', (user_id,)
-        )
-        row = cur.fetchone()
-        if row:
-            usuario_nome = row['nome']
-            tipo_usuario = row['tipo_usuario']
-    return dict(usuario_nome=usuario_nome, tipo_usuario=tipo_usuario)
+    usuario = g.get('usuario')
+    if usuario:
+        return dict(usuario_nome=usuario['nome'], tipo_usuario=usuario['tipo_usuario'])
+    return dict(usuario_nome=None, tipo_usuario=None)
+
+# Início da medição da requisição: registrado antes de todos os outros before_request,
+# para que o tempo deles entre na latência. O request_id acompanha os logs da requisição
+
+@app.before_request
+def iniciar_medicao():
+    g.inicio_requisicao = time.perf_counter()
+    g.request_id = novo_request_id(request.headers.get('X-Request-ID'))
 
 # Antes de cada requisição, tenta obter o usuário logado e armazená-lo em 'g'
 
@@ -100,20 +103,89 @@ def load_logged_in_user():
     user_id = session.get('usuario_id')
     if user_id is None:
         g.usuario_id = None
+        g.usuario = None
     else:
         g.usuario_id = user_id # Armazena o ID do usuário em g para fácil acesso
+        # Identidade (nome, tipo_usuario) carregada uma única vez por requisição, via cache
+        g.usuario = obter_identidade(user_id)
+
+# Inicia o consumidor da fila de tarefas deste worker (só cria as threads no primeiro acesso),
+# para que tarefas deixadas por um worker anterior sejam retomadas mesmo sem uploads novos
+
+@app.before_request
+def iniciar_fila_tarefas():
+    obter_fila(app)
+
+# Idem para o envio da caixa de saída de e-mails
+
+@app.before_request
+def iniciar_envio_emails():
+    obter_envio(app)
+
+# Telemetria da requisição. Os after_request rodam na ordem inversa do registro, então
+# este, registrado primeiro, é o último e mede também os demais
+
+@app.after_request
+def medir_requisicao(response):
+    inicio = g.get('inicio_requisicao')
+    if inicio is not None:
+        duracao = time.perf_counter() - inicio
+        obter_telemetria(app).registrar_requisicao(
+            request.endpoint, request.method, response.status_code, duracao,
+            response.content_length, g.get('db_espera'), g.get('db_consultas', 0))
+        if app.config['LOGS_ACESSO']:
+            log_acesso.info('%s %s %s', request.method, caminho_para_log(), response.status_code,
+                            extra={'status': response.status_code, 'duracao_ms': round(duracao * 1000, 2),
+                                   'bytes': response.content_length, 'consultas': g.get('db_consultas', 0)})
+        response.headers['X-Request-ID'] = g.request_id
+    return response
+
+# Fecha o perfil SQL da requisição: possíveis N+1 e as requisições que mais gastaram em SQL
+
+@app.after_request
+def analisar_consultas(response):
+    if 'perfil_sql' in g:
+        obter_perfil(app).finalizar_requisicao(request.endpoint, caminho_para_log())
+    return response
+
+# Leitura das próprias escritas: quem acabou de alterar algo lê do primário por alguns
+# segundos, não de uma réplica que ainda não recebeu a alteração
+
+@app.after_request
+def lembrar_escrita(response):
+    if request.method not in ('GET', 'HEAD', 'OPTIONS') and 'db' in g:
+        marcar_escrita()
+    return response
+
+# Depois de cada página servida com sucesso (ou confirmada com 304), conta um acesso para a rota
+
+@app.after_request
+def contar_acesso(response):
+    if request.method == 'GET' and response.status_code in (200, 304) \
+            and request.endpoint and request.endpoint not in ('static', 'assets.servir', 'metricas_prometheus'):
+        obter_contador(app).registrar(request.endpoint)
+    return response
+
+# Fotos endereçadas por conteúdo nunca mudam: o navegador pode guardá-las para sempre
+
+@app.after_request
+def cache_fotos(response):
+    if request.endpoint == 'static':
+        cache_imutavel(response, request.view_args.get('filename', ''))
+    return response
 
 # ----- ROTAS DE PÁGINAS BÁSICAS -----
 
 @app.route('/')
+@cache_publico()
 def index():
     """
-    Roda da página inicial. Incrementa o contador de acessos.
+    Roda da página inicial. Os acessos são contados em contar_acesso (metricas.py).
     """
-    app.acessos += 1
     return render_template('index.html')
 
 @app.route('/sobre')
+@cache_publico()
 def sobre():
     """
     Roda da página "Sobre".
@@ -121,6 +193,7 @@ def sobre():
     return render_template('sobre.html')
 
 @app.route('/termos')
+@cache_publico()
 def termos():
     """
     Roda da página "Termos de Uso".
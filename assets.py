@@ -0,0 +1,220 @@
+# assets.py
+# CSS/JS versionados: junta os arquivos de cada página em pacotes, minifica, grava com o
+# hash do conteúdo no nome (static/dist/) junto das versões .gz e .br, e registra tudo
+# num manifesto usado pelo url_for dos templates.
+
+import gzip
+import hashlib
+import json
+import logging
+import mimetypes
+import os
+import re
+import threading
+
+from flask import Blueprint, current_app, request, send_from_directory, url_for
+
+from imagens import marcar_imutavel
+
+try:
+    import brotli  # Opcional: sem ele só são geradas as versões .gz
+except ImportError:
+    brotli = None
+
+log = logging.getLogger(__name__)
+
+bp = Blueprint('assets', __name__)
+
+# Pasta de saída, dentro de static/
+PASTA_DIST = 'dist'
+MANIFESTO = 'manifest.json'
+
+# Pacotes: nome usado no template -> arquivos de static/ concatenados, nesta ordem.
+# Todo arquivo de static/css e static/js também ganha a sua versão individual.
+PACOTES = {
+    # Base de todas as páginas (base.html e pesquisa.html)
+    'pacotes/base.css': ('css/style.css', 'css/flash_messages.css'),
+    # Detalhes do imóvel
+    'pacotes/apt.css': ('css/apt.css', 'css/map.css'),
+    'pacotes/apt.js': ('js/map.js', 'js/gallery.js', 'js/script.js'),
+}
+PASTAS_FONTE = ('css', 'js')
+
+# Strings do CSS/JS, que a minificação não pode alterar
+_STRINGS = re.compile(r'("(?:\\.|[^"\\\n])*"|\'(?:\\.|[^\'\\\n])*\')')
+_COMENTARIO_CSS = re.compile(r'("(?:\\.|[^"\\\n])*"|\'(?:\\.|[^\'\\\n])*\')|/\*.*?\*/', re.S)
+
+
+def _minificar_css(texto):
+    texto = _COMENTARIO_CSS.sub(lambda m: m.group(1) or '', texto)
+    partes = _STRINGS.split(texto)
+    for i in range(0, len(partes), 2):  # Posições pares: fora das strings
+        trecho = re.sub(r'\s+', ' ', partes[i])
+        trecho = re.sub(r'\s*([{};,])\s*', r'\1', trecho)
+        partes[i] = re.sub(r':\s+', ':', trecho)
+    return ''.join(partes).replace(';}', '}').strip()
+
+
+def _minificar_js(texto):
+    """
+    Minificação conservadora (sem dependências): tira indentação, linhas vazias e
+    linhas só de comentário. As quebras de linha ficam, por causa da inserção
+    automática de ponto e vírgula. O grosso da economia vem do gzip/brotli.
+    """
+    linhas = (linha.strip() for linha in texto.splitlines())
+    return '\n'.join(l for l in linhas if l and not l.startswith('//'))
+
+
+def _minificar(nome, texto):
+    return _minificar_css(texto) if nome.endswith('.css') else _minificar_js(texto)
+
+
+def _fontes(pasta_static):
+    """
+    Retorna {nome no template: [arquivos de origem]} de tudo o que é construído.
+    """
+    fontes = {}
+    for pasta in PASTAS_FONTE:
+        for nome in sorted(os.listdir(os.path.join(pasta_static, pasta))):
+            if nome.endswith('.' + pasta):
+                fontes[f'{pasta}/{nome}'] = [f'{pasta}/{nome}']
+    fontes.update({nome: list(arquivos) for nome, arquivos in PACOTES.items()})
+    return fontes
+
+
+def _gravar(caminho, dados):
+    """
+    Grava num temporário e renomeia: quem estiver servindo o arquivo nunca o vê pela metade.
+    """
+    temporario = f'{caminho}.{os.getpid()}.tmp'
+    with open(temporario, 'wb') as f:
+        f.write(dados)
+    os.replace(temporario, caminho)
+
+
+def construir(pasta_static):
+    """
+    Gera static/dist/ e o manifesto. Arquivos com o mesmo conteúdo mantêm o mesmo
+    nome entre builds, então só os que mudaram invalidam o cache dos navegadores.
+    Retorna o manifesto ({nome no template: caminho dentro de dist/}).
+    """
+    dist = os.path.join(pasta_static, PASTA_DIST)
+    manifesto = {}
+    for nome, arquivos in _fontes(pasta_static).items():
+        textos = []
+        for arquivo in arquivos:
+            with open(os.path.join(pasta_static, arquivo), encoding='utf-8') as f:
+                textos.append(_minificar(arquivo, f.read()))
+        # ';' entre arquivos JS: um arquivo sem ; no fim não "gruda" no próximo
+        dados = (';\n' if nome.endswith('.js') else '\n').join(textos).encode('utf-8')
+
+        base, extensao = os.path.splitext(nome)
+        versionado = f'{base}.{hashlib.sha256(dados).hexdigest()[:12]}{extensao}'
+        destino = os.path.join(dist, versionado)
+        if not os.path.exists(destino):
+            os.makedirs(os.path.dirname(destino), exist_ok=True)
+            _gravar(destino, dados)
+            _gravar(destino + '.gz', gzip.compress(dados, 9, mtime=0))
+            if brotli:
+                _gravar(destino + '.br', brotli.compress(dados, quality=11))
+        manifesto[nome] = versionado
+
+    os.makedirs(dist, exist_ok=True)
+    _gravar(os.path.join(dist, MANIFESTO), json.dumps(manifesto, indent=2, sort_keys=True).encode('utf-8'))
+    return manifesto
+
+
+def limpar(pasta_static, manifesto):
+    """
+    Apaga de dist/ as versões que não estão mais no manifesto. Retorna quantas.
+    """
+    dist = os.path.join(pasta_static, PASTA_DIST)
+    manter = {MANIFESTO} | {v + sufixo for v in manifesto.values() for sufixo in ('', '.gz', '.br')}
+    removidos = 0
+    for raiz, _, arquivos in os.walk(dist):
+        for arquivo in arquivos:
+            relativo = os.path.relpath(os.path.join(raiz, arquivo), dist).replace(os.sep, '/')
+            if relativo not in manter:
+                os.remove(os.path.join(raiz, arquivo))
+                removidos += 1
+    return removidos
+
+
+# ----- MANIFESTO E url_for -----
+
+_manifesto = {}
+_manifesto_mtime = None  # Última modificação das fontes no momento do build (modo debug)
+_manifesto_lock = threading.Lock()
+
+def _ultima_modificacao(pasta_static):
+    return max(
+        os.path.getmtime(os.path.join(pasta_static, arquivo))
+        for arquivos in _fontes(pasta_static).values() for arquivo in arquivos
+    )
+
+def preparar_assets(app):
+    """
+    Chamado na inicialização: constrói os pacotes (ASSETS_CONSTRUIR) ou só carrega o
+    manifesto gerado no deploy por construir_assets.py.
+    """
+    global _manifesto, _manifesto_mtime
+    pasta_static = app.static_folder
+    try:
+        if app.config['ASSETS_CONSTRUIR']:
+            _manifesto_mtime = _ultima_modificacao(pasta_static)
+            _manifesto = construir(pasta_static)
+        else:
+            with open(os.path.join(pasta_static, PASTA_DIST, MANIFESTO), encoding='utf-8') as f:
+                _manifesto = json.load(f)
+    except Exception:
+        # Sem manifesto os arquivos individuais continuam sendo servidos por /static
+        log.exception("Erro ao preparar os arquivos estáticos")
+        _manifesto = {}
+
+def _atualizar_em_debug():
+    """
+    No servidor de desenvolvimento, refaz os pacotes quando um CSS/JS é editado.
+    """
+    global _manifesto, _manifesto_mtime
+    pasta_static = current_app.static_folder
+    mtime = _ultima_modificacao(pasta_static)
+    if mtime != _manifesto_mtime:
+        with _manifesto_lock:
+            if mtime != _manifesto_mtime:
+                _manifesto = construir(pasta_static)
+                _manifesto_mtime = mtime
+
+def url_for_assets(endpoint, **values):
+    """
+    url_for dos templates: url_for('static', filename='css/apt.css') aponta para a
+    versão com hash em /static/dist/, servida com cache imutável. Nomes de PACOTES
+    (ex.: 'pacotes/apt.js') só existem por aqui. O resto segue para o url_for do Flask.
+    """
+    if endpoint == 'static' and 'filename' in values:
+        if current_app.debug and current_app.config['ASSETS_CONSTRUIR']:
+            _atualizar_em_debug()
+        versionado = _manifesto.get(values['filename'])
+        if versionado:
+            values['filename'] = versionado
+            endpoint = 'assets.servir'
+    return url_for(endpoint, **values)
+
+
+# ----- ENTREGA -----
+
+@bp.route('/static/dist/<path:filename>')
+def servir(filename):
+    """
+    Entrega a versão pré-comprimida (.br ou .gz) que o navegador aceitar.
+    """
+    pasta = os.path.join(current_app.static_folder, PASTA_DIST)
+    mimetype = mimetypes.guess_type(filename)[0]
+    for codificacao, sufixo in (('br', '.br'), ('gzip', '.gz')):
+        if request.accept_encodings[codificacao] and os.path.isfile(os.path.join(pasta, filename + sufixo)):
+            response = send_from_directory(pasta, filename + sufixo, mimetype=mimetype)
+            response.headers['Content-Encoding'] = codificacao
+            break
+    else:
+        response = send_from_directory(pasta, filename, mimetype=mimetype)
+    response.vary.add('Accept-Encoding')
+    return marcar_imutavel(response)
@@ -2,66 +2,99 @@
 
 from functools import wraps
 from flask import Blueprint, render_template, request, redirect, url_for, session, g, flash, current_app # Adicionado current_app
+import logging
 import sqlite3 # Importado para capturar sqlite3.IntegrityError e sqlite3.Error
-import uuid # Adicionado para gerar tokens únicos
-from datetime import datetime, timedelta # Adicionado para controlar a expiração do token
+import hashlib
+import hmac
+import threading
+import time
 import psycopg2 # Importado para capturar psycopg2.IntegrityError e psycopg2.Error
 import psycopg2.extras # Importado para usar DictCursor com PostgreSQL
-
-# NOVO: Imports para SendGrid
-import sendgrid
-from sendgrid.helpers.mail import Mail, Email, To, Content
+from itsdangerous import URLSafeTimedSerializer, BadData # Tokens assinados de redefinição de senha
 
 from database import get_db # Importa a função get_db do novo módulo
+from cache_paginas import invalidar_paginas
+from emails import enfileirar_email, acordar_envio
+
+log = logging.getLogger(__name__)
 
 # Cria um Blueprint para as rotas de autenticação
 bp = Blueprint('auth', __name__, url_prefix='/')
 
 # --- Funções de Ajuda ---
 
-# Função para envio de e-mail com SendGrid
-def enviar_email_reset_senha(user_email, reset_link):
+# E-mail com o link de redefinição de senha. Só entra na caixa de saída (emails.py),
+# na transação de `db`: o envio acontece em segundo plano, fora da requisição
+def enviar_email_reset_senha(db, user_email, reset_link):
+    subject = "Redefinição de Senha para Republic"
+
+    # Conteúdo do e-mail em HTML
+    html_content = f"""
+    <!DOCTYPE html>
+    <html>
+    <head>
+        <title>Redefinição de Senha</title>
+    </head>
+    <body>
+        <p>Olá,</p>
+        <p>Recebemos uma solicitação para redefinir a senha da sua conta na Republic.</p>
+        <p>Clique no link abaixo para prosseguir com a redefinição:</p>
+        <p><a href="{reset_link}" style="display: inline-block; padding: 10px 20px; background-color: #007bff; color: #ffffff; text-decoration: none; border-radius: 5px;">Redefinir Senha Agora</a></p>
+        <p>Este link é válido por 1 hora.</p>
+        <p>Se você não solicitou esta redefinição, por favor, ignore este e-mail.</p>
+        <p>Obrigado,<br>A equipe Republic</p>
+    </body>
+    </html>
+    """
+    enfileirar_email(db, user_email, subject, html_content)
+
+# ----- TOKENS DE REDEFINIÇÃO DE SENHA -----
+# O token é assinado com a SECRET_KEY e carrega o id do usuário, a hora da emissão e uma
+# impressão do e-mail e da senha atuais. Conferir assinatura e validade não consulta o
+# banco; trocar a senha (ou o e-mail) muda a impressão, e isso torna o link de uso único.
+
+def _serializador_reset():
+    return URLSafeTimedSerializer(current_app.config['SECRET_KEY'], salt='redefinir-senha')
+
+def _impressao_conta(email, senha):
+    """
+    HMAC (com a SECRET_KEY) do e-mail e da senha: o token não revela nada da senha.
+    """
+    chave = current_app.config['SECRET_KEY'].encode('utf-8')
+    return hmac.new(chave, f'{email}\0{senha}'.encode('utf-8'), hashlib.sha256).hexdigest()[:32]
+
+def gerar_token_reset(user):
+    """
+    Token do link de redefinição para o usuário (id, email e senha atuais).
+    """
+    return _serializador_reset().dumps({'id': user['id'], 'conta': _impressao_conta(user['email'], user['senha'])})
+
+def ler_token_reset(token):
+    """
+    Dados do token ({'id', 'conta'}) se a assinatura confere e ele ainda está no prazo
+    (RESET_SENHA_VALIDADE); senão None.
+    """
     try:
-        sg = sendgrid.SendGridAPIClient(current_app.config['SENDGRID_API_KEY'])
-        from_email = Email(current_app.config['MAIL_DEFAULT_SENDER'])
-        to_email = To(user_email)
-        subject = "Redefinição de Senha para Republic"
-        
-        # Conteúdo do e-mail em HTML
-        html_content = f"""
-        <!DOCTYPE html>
-        <html>
-        <head>
-            <title>Redefinição de Senha</title>
-        </head>
-        <body>
-            <p>Olá,</p>
-            <p>Recebemos uma solicitação para redefinir a senha da sua conta na Republic.</p>
-            <p>Clique no link abaixo para prosseguir com a redefinição:</p>
-            <p><a href="{reset_link}" style="display: inline-block; padding: 10px 20px; background-color: #007bff; color: #ffffff; text-decoration: none; border-radius: 5px;">Redefinir Senha Agora</a></p>
-            <p>Este link é válido por 1 hora.</p>
-            <p>Se você não solicitou esta redefinição, por favor, ignore este e-mail.</p>
-            <p>Obrigado,<br>A equipe Republic</p>
-        </body>
-        </html>
-        """
-        content = Content("text/html", html_content)
-        
-        message = Mail(from_email, to_email, subject, html_content=html_content)
-        
-        response = sg.client.mail.send.post(request_body=message.get())
-        
-        print(f"E-mail de redefinição enviado para {user_email}. Status Code: {response.status_code}")
-        print(response.body) # Pode ser útil para depuração
-        print(response.headers) # Pode ser útil para depuração
-        
-        if response.status_code >= 200 and response.status_code < 300:
-            return True
-        else:
-            return False # Indicar falha
-    except Exception as e:
-        print(f"Erro ao enviar e-mail de redefinição: {e}")
-        return False # Indicar falha
+        dados = _serializador_reset().loads(token, max_age=current_app.config['RESET_SENHA_VALIDADE'])
+    except BadData:
+        return None
+    if not isinstance(dados, dict) or not isinstance(dados.get('id'), int) or not dados.get('conta'):
+        return None
+    return dados
+
+def token_reset_confere(dados, user):
+    """
+    O token foi emitido para a conta como ela está agora (senha e e-mail não mudaram).
+    """
+    return user is not None and hmac.compare_digest(dados['conta'], _impressao_conta(user['email'], user['senha']))
+
+# ----- CONSULTAS -----
+# Consultas de usuários feitas a cada login, página com usuário logado e redefinição
+# de senha; {ph} é o marcador de parâmetro do banco. Também usadas por verificar_indices.py.
+SQL_IDENTIDADE = 'SELECT id, nome, tipo_usuario FROM usuarios WHERE id = {ph}'
+SQL_LOGIN = 'SELECT id FROM usuarios WHERE email = {ph} AND senha = {ph}'
+SQL_CONTA_POR_EMAIL = 'SELECT id, email, senha FROM usuarios WHERE email = {ph}'
+SQL_CONTA_POR_ID = 'SELECT id, email, senha FROM usuarios WHERE id = {ph}'
 
 # ----- DECORATOR LOGIN -----
 
@@ -79,33 +112,56 @@ def login_required(f):
         return f(*args, **kwargs)
     return wrapped
 
-# ----- CONTEXTO GLOBAL -----
+# ----- IDENTIDADE DO USUÁRIO LOGADO -----
+
+# Cache entre requisições (por worker) de id -> (expira_em, identidade).
+# Evita reler nome e tipo_usuario de `usuarios` em toda página de um usuário logado.
+# Cada worker tem o seu: uma alteração invalida o cache do worker que a processou e os
+# demais enxergam o novo valor em no máximo USUARIO_CACHE_TTL segundos. Por isso serve
+# só para exibir (nome, menus): decisões de acesso usam obter_identidade(..., atual=True).
+_cache_identidades = {}
+_cache_lock = threading.Lock()
 
-@bp.context_processor
-def inject_usuario():
+def obter_identidade(user_id, atual=False):
     """
-    Injeta informações do usuário logado em todos os templates.
+    Retorna {'id', 'nome', 'tipo_usuario'} do usuário, usando o cache quando possível.
+    Com atual=True lê sempre do banco (e atualiza o cache), para checar permissões.
+    Retorna None se o usuário não existe mais.
     """
-    usuario_nome = tipo_usuario = None
-    user_id = session.get('usuario_id')
-    if user_id:
-        db = get_db()
-        # NOVO: Crie um cursor a partir da conexão para PostgreSQL (com DictCursor) ou use a conexão direta para SQLite
-        if current_app.config.get('DATABASE_URL'):
-            cur = db.cursor(cursor_factory=psycopg2.extras.DictCursor)
-        else: # Para SQLite
-            cur = db # A conexão SQLite tem execute() diretamente ou age como um cursor
+    agora = time.monotonic()
+    if not atual:
+        with _cache_lock:
+            item = _cache_identidades.get(user_id)
+        if item and item[0] > agora:
+            return item[1]
 
-        param_placeholder = "%s" if current_app.config.get('DATABASE_URL') else "?"
-        
-        cur.execute( # Use cur.execute
-            f'SELECT nome, tipo_usuario FROM usuarios WHERE id = {param_placeholder}', (user_id,)
-        )
-        row = cur.fetchone()
-        if row:
-            usuario_nome = row['nome']
-            tipo_usuario = row['tipo_usuario']
-    return dict(usuario_nome=usuario_nome, tipo_usuario=tipo_usuario)
+    db = get_db()
+    cur = db.cursor()
+    param_placeholder = "%s" if current_app.config.get('DATABASE_URL') else "?"
+    cur.execute(SQL_IDENTIDADE.format(ph=param_placeholder), (user_id,))
+    row = cur.fetchone()
+    if not row:
+        invalidar_identidade(user_id)
+        return None
+
+    identidade = {'id': row['id'], 'nome': row['nome'], 'tipo_usuario': row['tipo_usuario']}
+    with _cache_lock:
+        if len(_cache_identidades) >= current_app.config['USUARIO_CACHE_MAX']:
+            # Remove as entradas vencidas; se não bastar, recomeça o cache do zero
+            for chave in [k for k, v in _cache_identidades.items() if v[0] <= agora]:
+                del _cache_identidades[chave]
+            if len(_cache_identidades) >= current_app.config['USUARIO_CACHE_MAX']:
+                _cache_identidades.clear()
+        _cache_identidades[user_id] = (agora + current_app.config['USUARIO_CACHE_TTL'], identidade)
+    return identidade
+
+def invalidar_identidade(user_id):
+    """
+    Remove o usuário do cache. Deve ser chamada sempre que nome, tipo_usuario
+    ou a própria existência do usuário mudar.
+    """
+    with _cache_lock:
+        _cache_identidades.pop(user_id, None)
 
 # ----- ROTAS DE AUTENTICAÇÃO E CADASTRO -----
 
@@ -143,7 +199,7 @@ def cadastro():
             db.rollback() # Reverte a transação em caso de erro de integridade
         except Exception as e: # Captura outros erros de banco de dados
             flash(f'Ocorreu um erro no cadastro: {e}', 'danger')
-            print(f"Erro ao cadastrar usuário: {e}") # Log para depuração
+            log.exception("Erro ao cadastrar usuário")
             db.rollback() # Reverte a transação em caso de outros erros
     return render_template('cadastro.html')
 
@@ -161,13 +217,10 @@ def login():
         if current_app.config.get('DATABASE_URL'):
             cur = db.cursor(cursor_factory=psycopg2.extras.DictCursor)
         else:
-            cur = db
+            cur = db.cursor() # A conexão SQLite não tem fetchone(), o cursor tem
 
         param_placeholder = "%s" if current_app.config.get('DATABASE_URL') else "?"
-        cur.execute( # Use cur.execute
-            f'SELECT id FROM usuarios WHERE email = {param_placeholder} AND senha = {param_placeholder}', (
-                email, senha)
-        )
+        cur.execute(SQL_LOGIN.format(ph=param_placeholder), (email, senha)) # Use cur.execute
         user = cur.fetchone()
         if user:
             session['usuario_id'] = user['id']
@@ -213,7 +266,10 @@ def perfil():
                 f'UPDATE usuarios SET nome = {param_placeholder}, email = {param_placeholder}, senha = {param_placeholder}, telefone = {param_placeholder} WHERE id = {param_placeholder}',
                 (nome, email, senha, telefone, user_id)
             )
+            # Nome e telefone aparecem nas páginas dos imóveis do usuário
+            invalidar_paginas(db, f'usuario:{user_id}')
             db.commit()
+            invalidar_identidade(user_id)
             flash('Suas informações foram atualizadas com sucesso!', 'success')
             return redirect(url_for('auth.perfil'))
         except (sqlite3.IntegrityError, psycopg2.IntegrityError) as e:
@@ -221,7 +277,7 @@ def perfil():
             db.rollback()
         except Exception as e:
             flash(f'Ocorreu um erro ao atualizar: {e}', 'danger')
-            print(f"Erro ao atualizar perfil: {e}") # Log para depuração
+            log.exception("Erro ao atualizar perfil")
             db.rollback()
 
     # Busca os dados atuais do usuário para exibir no formulário
@@ -273,55 +329,41 @@ def esqueci_senha():
             cur = db
 
         param_placeholder = "%s" if current_app.config.get('DATABASE_URL') else "?"
-        user = cur.execute(f'SELECT id, email FROM usuarios WHERE email = {param_placeholder}', (email,)).fetchone() # Use cur.execute
+        user = cur.execute(SQL_CONTA_POR_EMAIL.format(ph=param_placeholder), (email,)).fetchone() # Use cur.execute
 
         if user:
-            # Gerar um token único e com expiração
-            token = str(uuid.uuid4())
-            expiration = datetime.now() + timedelta(hours=1) # Token válido por 1 hora
-
-            # Armazenar o token no banco de dados (precisa de uma tabela 'tokens'!)
-            # NOVO: Crie um cursor separado para a inserção de token (não precisa de DictCursor)
-            if current_app.config.get('DATABASE_URL'):
-                insert_cur = db.cursor() 
-            else:
-                insert_cur = db
-
-            insert_cur.execute( # Use insert_cur.execute
-                f'INSERT INTO tokens (user_id, token, expiration) VALUES ({param_placeholder}, {param_placeholder}, {param_placeholder})',
-                (user['id'], token, expiration)
-            )
-            db.commit()
+            # Token assinado e com prazo (RESET_SENHA_VALIDADE): nada é gravado no banco
+            token = gerar_token_reset(user)
 
             # Construir o link de redefinição
             reset_link = url_for('auth.resetar_senha', token=token, _external=True)
 
-            # Enviar e-mail com o link de redefinição
-            if enviar_email_reset_senha(user['email'], reset_link):
-                flash('Um link para redefinir sua senha foi enviado para seu e-mail (se ele estiver cadastrado).', 'info')
-            else:
-                flash('Ocorreu um erro ao enviar o e-mail de redefinição. Tente novamente mais tarde.', 'danger')
-        else:
-            # Não diga ao usuário que o e-mail não foi encontrado por segurança
-            flash('Um link para redefinir sua senha foi enviado para seu e-mail (se ele estiver cadastrado).', 'info')
+            enviar_email_reset_senha(db, user['email'], reset_link)
+            db.commit()
+            acordar_envio()
+
+        # Mesma mensagem com ou sem cadastro: não diga ao usuário que o e-mail não foi encontrado
+        flash('Um link para redefinir sua senha foi enviado para seu e-mail (se ele estiver cadastrado).', 'info')
     return render_template('esqueci_senha.html')
 
 # NOVO: Rota para a página de redefinição de senha (com token)
 @bp.route('/resetar_senha/<token>', methods=['GET', 'POST'])
 def resetar_senha(token):
-    db = get_db()
-    # NOVO: Crie um cursor para buscar o token (com DictCursor para SELECT)
-    if current_app.config.get('DATABASE_URL'):
-        cur = db.cursor(cursor_factory=psycopg2.extras.DictCursor)
-    else:
-        cur = db
-
-    param_placeholder = "%s" if current_app.config.get('DATABASE_URL') else "?"
-    
-    # Buscar o token no banco de dados
-    t = cur.execute(f'SELECT user_id, expiration FROM tokens WHERE token = {param_placeholder}', (token,)).fetchone() # Use cur.execute
+    # Assinatura e prazo são conferidos sem consultar o banco
+    dados = ler_token_reset(token)
+    user = None
+    if dados:
+        db = get_db()
+        # NOVO: Crie um cursor para buscar o usuário (com DictCursor para SELECT)
+        if current_app.config.get('DATABASE_URL'):
+            cur = db.cursor(cursor_factory=psycopg2.extras.DictCursor)
+        else:
+            cur = db.cursor()
+        param_placeholder = "%s" if current_app.config.get('DATABASE_URL') else "?"
+        cur.execute(SQL_CONTA_POR_ID.format(ph=param_placeholder), (dados['id'],))
+        user = cur.fetchone()
 
-    if not t or t['expiration'] < datetime.now():
+    if not dados or not token_reset_confere(dados, user):
         flash('Link de redefinição de senha inválido ou expirado.', 'danger')
         return redirect(url_for('auth.esqueci_senha'))
 
@@ -333,20 +375,16 @@ def resetar_senha(token):
             flash('As senhas não coincidem.', 'danger')
             return render_template('resetar_senha.html', token=token) # Passa o token de volta para o form
 
-        # NOVO: Crie um cursor para as atualizações/deleções (sem DictCursor)
-        if current_app.config.get('DATABASE_URL'):
-            update_cur = db.cursor()
-        else:
-            update_cur = db
-
-        # Atualizar a senha do usuário
-        update_cur.execute( # Use update_cur.execute
-            f'UPDATE usuarios SET senha = {param_placeholder} WHERE id = {param_placeholder}',
-            (nova_senha, t['user_id'])
+        # Atualizar a senha do usuário. A condição na senha antiga faz de dois envios
+        # simultâneos do mesmo link um só; depois da troca o token deixa de conferir
+        cur.execute(
+            f'UPDATE usuarios SET senha = {param_placeholder} WHERE id = {param_placeholder} AND senha = {param_placeholder}',
+            (nova_senha, user['id'], user['senha'])
         )
-        # Invalidar o token usado (removendo-o do banco de dados)
-        update_cur.execute(f'DELETE FROM tokens WHERE token = {param_placeholder}', (token,)) # Use update_cur.execute
         db.commit()
+        if cur.rowcount != 1:
+            flash('Link de redefinição de senha inválido ou expirado.', 'danger')
+            return redirect(url_for('auth.esqueci_senha'))
 
         flash('Sua senha foi redefinida com sucesso! Por favor, faça login.', 'success')
         return redirect(url_for('auth.login'))
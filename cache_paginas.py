@@ -0,0 +1,276 @@
+# cache_paginas.py
+# Cache das páginas públicas para visitantes não logados, com ETag/Last-Modified e GET
+# condicional, e invalidação por etiquetas ('imoveis', 'imovel:<id>', 'usuario:<id>', ...).
+
+import atexit
+import hashlib
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime, timezone
+from functools import wraps
+
+from flask import current_app, g, make_response, request, session
+
+from database import get_db, marcar_invalidacao
+
+log = logging.getLogger(__name__)
+
+# Invalidações mais antigas que isso já foram lidas por todos os workers e podem ser apagadas
+RETENCAO_INVALIDACOES = 3600
+# Janela relida a cada sincronização. Cobre transações que pegaram um id menor mas
+# fizeram commit depois de outras (ids do SERIAL não aparecem em ordem de commit).
+JANELA_SINCRONIZACAO = 60
+
+# Invalidações recentes, lidas por cada worker a cada sincronização (também em verificar_indices.py)
+SQL_INVALIDACOES = 'SELECT id, etiqueta, criada_em FROM invalidacoes_cache WHERE criada_em >= {ph}'
+
+
+class CachePaginas:
+    """
+    Páginas renderizadas, guardadas por worker (LRU com no máximo `max_entradas`).
+
+    - Cada página guarda as etiquetas do que ela mostra. Quem altera um imóvel chama
+      invalidar_paginas(), que apaga na hora as páginas do próprio worker e registra as
+      etiquetas em invalidacoes_cache, na mesma transação da alteração.
+    - Uma thread lê as invalidações novas a cada `intervalo` segundos e apaga as páginas
+      correspondentes neste worker. Servir do cache (inclusive o 304) não usa o banco.
+    - `ttl` limita a idade das páginas, inclusive as sem etiqueta (sobre, termos).
+    """
+
+    def __init__(self, app, max_entradas=500, ttl=300, intervalo=2.0):
+        self.app = app
+        self.max_entradas = max_entradas
+        self.ttl = ttl
+        self.intervalo = intervalo
+
+        self._lock = threading.Lock()
+        self._entradas = OrderedDict()  # chave -> entrada (dict), da menos para a mais usada
+        self._por_etiqueta = {}  # etiqueta -> {chaves}
+        self._geracao = 0  # Muda a cada invalidação: páginas renderizadas antes dela não são guardadas
+        self._vistas = {}  # id da invalidação -> criada_em (já aplicadas neste worker)
+        self._ultima_limpeza = 0.0
+        self._stats = {'acertos': 0, 'nao_modificadas': 0, 'faltas': 0, 'invalidadas': 0}
+        self._parar = threading.Event()
+        self._thread = threading.Thread(target=self._executar, name='cache-paginas', daemon=True)
+        self._thread.start()
+
+    # ----- Entradas -----
+
+    @property
+    def geracao(self):
+        return self._geracao
+
+    def obter(self, chave):
+        agora = time.monotonic()
+        with self._lock:
+            entrada = self._entradas.get(chave)
+            if entrada is None or entrada['expira_em'] <= agora:
+                if entrada is not None:
+                    self._remover(chave)
+                self._stats['faltas'] += 1
+                return None
+            self._entradas.move_to_end(chave)
+            self._stats['acertos'] += 1
+            return entrada
+
+    def guardar(self, chave, entrada, etiquetas, geracao):
+        """
+        Guarda a página, a não ser que alguma invalidação tenha chegado enquanto ela era
+        renderizada (o conteúdo pode ser anterior à alteração).
+        """
+        entrada['etiquetas'] = frozenset(etiquetas)
+        entrada['expira_em'] = time.monotonic() + self.ttl
+        with self._lock:
+            if geracao != self._geracao:
+                return
+            if chave in self._entradas:
+                self._remover(chave)
+            while len(self._entradas) >= self.max_entradas:
+                self._remover(next(iter(self._entradas)))
+            self._entradas[chave] = entrada
+            for etiqueta in entrada['etiquetas']:
+                self._por_etiqueta.setdefault(etiqueta, set()).add(chave)
+
+    def _remover(self, chave):
+        """
+        Deve ser chamado com o lock.
+        """
+        entrada = self._entradas.pop(chave)
+        for etiqueta in entrada['etiquetas']:
+            chaves = self._por_etiqueta.get(etiqueta)
+            if chaves is not None:
+                chaves.discard(chave)
+                if not chaves:
+                    del self._por_etiqueta[etiqueta]
+
+    def descartar(self, etiquetas):
+        marcar_invalidacao()  # As páginas refeitas a seguir leem do primário, não de uma réplica atrasada
+        with self._lock:
+            self._geracao += 1
+            for etiqueta in etiquetas:
+                for chave in list(self._por_etiqueta.get(etiqueta, ())):
+                    self._remover(chave)
+                    self._stats['invalidadas'] += 1
+
+    def contar_nao_modificada(self):
+        with self._lock:
+            self._stats['nao_modificadas'] += 1
+
+    # ----- Invalidações dos outros workers -----
+
+    def _executar(self):
+        while not self._parar.wait(self.intervalo):
+            self.sincronizar()
+
+    def sincronizar(self):
+        ph = "%s" if self.app.config.get('DATABASE_URL') else "?"
+        agora = time.time()
+        try:
+            with self.app.app_context():
+                db = get_db()
+                cur = db.cursor()
+                cur.execute(SQL_INVALIDACOES.format(ph=ph), (agora - JANELA_SINCRONIZACAO,))
+                novas = [r for r in cur.fetchall() if r['id'] not in self._vistas]
+                if agora - self._ultima_limpeza >= RETENCAO_INVALIDACOES / 4:
+                    cur.execute(f'DELETE FROM invalidacoes_cache WHERE criada_em < {ph}',
+                                (agora - RETENCAO_INVALIDACOES,))
+                    self._ultima_limpeza = agora
+                db.commit()
+        except Exception:
+            log.exception("Erro ao sincronizar o cache de páginas")
+            return
+        if novas:
+            self.descartar({r['etiqueta'] for r in novas})
+            self._vistas.update((r['id'], r['criada_em']) for r in novas)
+        limite = agora - 2 * JANELA_SINCRONIZACAO
+        for id_, criada_em in list(self._vistas.items()):
+            if criada_em < limite:
+                del self._vistas[id_]
+
+    def encerrar(self):
+        self._parar.set()
+
+    def estatisticas(self):
+        with self._lock:
+            stats = dict(self._stats)
+            stats['entradas'] = len(self._entradas)
+        return stats
+
+
+# Um cache por processo: após o fork, cada worker do gunicorn cria o seu
+_cache = None
+_cache_pid = None
+_cache_lock = threading.Lock()
+
+def obter_cache(app):
+    """
+    Retorna o cache de páginas deste processo, criando-o no primeiro uso.
+    """
+    global _cache, _cache_pid
+    if _cache is None or _cache_pid != os.getpid():
+        with _cache_lock:
+            if _cache is None or _cache_pid != os.getpid():
+                _cache = CachePaginas(
+                    app,
+                    max_entradas=app.config['PAGINAS_CACHE_MAX'],
+                    ttl=app.config['PAGINAS_CACHE_TTL'],
+                    intervalo=app.config['PAGINAS_CACHE_SINCRONIZAR'],
+                )
+                _cache_pid = os.getpid()
+                atexit.register(_cache.encerrar)
+    return _cache
+
+
+# ----- USO NAS ROTAS -----
+
+def _chave(parametros):
+    """
+    Caminho + só os parâmetros que mudam a página, em ordem fixa e sem valores vazios,
+    para que ?utm_source=... ou campos do formulário deixados em branco não criem cópias.
+    """
+    args = tuple(
+        (nome, tuple(v for v in request.args.getlist(nome) if v))
+        for nome in sorted(parametros)
+    )
+    return request.path, tuple(a for a in args if a[1])
+
+def _responder(entrada):
+    response = current_app.response_class(entrada['corpo'], mimetype=entrada['mimetype'])
+    response.set_etag(entrada['etag'])
+    response.last_modified = entrada['modificada_em']
+    # O navegador pode guardar, mas confirma com If-None-Match antes de usar
+    response.cache_control.no_cache = True
+    return response.make_conditional(request)
+
+def cache_publico(parametros=(), anonima=False):
+    """
+    Decorador das páginas públicas. Para visitantes não logados a página é servida do
+    cache (ou com 304, se o navegador já tem a mesma versão); `parametros` são os
+    nomes da query string que alteram a página. A rota indica com etiquetar() do que
+    a página depende. Com anonima=True (respostas JSON que não mostram nada do usuário
+    nem mensagens flash) o cache vale também para quem está logado.
+    """
+    def decorador(view):
+        @wraps(view)
+        def wrapped(*args, **kwargs):
+            app = current_app._get_current_object()
+            pessoal = not anonima and (g.get('usuario_id') or '_flashes' in session)
+            if (request.method != 'GET' or pessoal
+                    or app.debug or app.config['PAGINAS_CACHE_TTL'] <= 0):
+                return view(*args, **kwargs)
+
+            cache = obter_cache(app)
+            chave = _chave(parametros)
+            entrada = cache.obter(chave)
+            if entrada is None:
+                geracao = cache.geracao
+                g.etiquetas_cache = set()
+                response = make_response(view(*args, **kwargs))
+                # Só páginas completas, montadas inteiras (não as enviadas aos poucos) e
+                # sem efeito na sessão (ex.: uma mensagem flash)
+                if (response.status_code != 200 or response.direct_passthrough
+                        or response.is_streamed or session.modified):
+                    return response
+                corpo = response.get_data()
+                entrada = {
+                    'corpo': corpo,
+                    'mimetype': response.mimetype,
+                    'etag': hashlib.sha256(corpo).hexdigest()[:32],
+                    'modificada_em': datetime.now(timezone.utc).replace(microsecond=0),
+                }
+                cache.guardar(chave, entrada, g.etiquetas_cache, geracao)
+                situacao = 'MISS'
+            else:
+                situacao = 'HIT'
+
+            response = _responder(entrada)
+            if response.status_code == 304:
+                cache.contar_nao_modificada()
+            response.headers['X-Cache'] = situacao
+            return response
+        return wrapped
+    return decorador
+
+def etiquetar(*etiquetas):
+    """
+    Chamado pela rota: a página em cache é descartada quando uma destas etiquetas
+    for invalidada.
+    """
+    if 'etiquetas_cache' in g:
+        g.etiquetas_cache.update(etiquetas)
+
+def invalidar_paginas(db, *etiquetas):
+    """
+    Descarta as páginas com estas etiquetas em todos os workers. Registra a invalidação
+    na transação de `db` (sem commit): chame antes do commit da alteração.
+    """
+    ph = "%s" if current_app.config.get('DATABASE_URL') else "?"
+    agora = time.time()
+    db.cursor().executemany(
+        f'INSERT INTO invalidacoes_cache (etiqueta, criada_em) VALUES ({ph}, {ph})',
+        [(etiqueta, agora) for etiqueta in etiquetas]
+    )
+    obter_cache(current_app._get_current_object()).descartar(etiquetas)
@@ -0,0 +1,129 @@
+# cliques.py
+# Agregador de cliques com gravação em lote (write-behind) para a rota /track_click.
+
+import atexit
+import logging
+import os
+import threading
+
+from database import get_db
+
+log = logging.getLogger(__name__)
+
+
+class AgregadorCliques:
+    """
+    Acumula cliques em memória e grava os incrementos em lote em click_counts.
+
+    - registrar() é O(1): só soma 1 no contador do evento.
+    - Uma thread grava os contadores acumulados a cada `intervalo` segundos, ou antes
+      disso quando `max_pendentes` cliques se acumulam.
+    - A gravação é um UPSERT aditivo (count = count + n), então workers diferentes do
+      gunicorn podem gravar ao mesmo tempo sem perder incrementos.
+    - Se o worker morrer sem encerrar normalmente, perde no máximo os cliques ainda
+      não gravados: os do último intervalo, limitados a max_pendentes (até 10x isso
+      enquanto o banco estiver recusando as gravações; acima disso os cliques são descartados).
+    """
+
+    def __init__(self, app, intervalo=5.0, max_pendentes=100):
+        self.app = app
+        self.intervalo = intervalo
+        self.max_pendentes = max_pendentes
+
+        self._lock = threading.Lock()
+        self._pendentes = {}  # event_name -> incremento ainda não gravado
+        self._total_pendente = 0
+        self._descartados = 0
+        self._acordar = threading.Event()
+        self._parar = threading.Event()
+        self._thread = threading.Thread(target=self._executar, name='agregador-cliques', daemon=True)
+        self._thread.start()
+
+    def registrar(self, event_name, quantidade=1):
+        with self._lock:
+            if self._total_pendente >= self.max_pendentes * 10:
+                # O banco não está aceitando as gravações; não deixamos a memória crescer sem limite
+                self._descartados += quantidade
+                return
+            self._pendentes[event_name] = self._pendentes.get(event_name, 0) + quantidade
+            self._total_pendente += quantidade
+            cheio = self._total_pendente >= self.max_pendentes
+        if cheio:
+            self._acordar.set()
+
+    def _executar(self):
+        while not self._parar.is_set():
+            self._acordar.wait(self.intervalo)
+            self._acordar.clear()
+            self.gravar()
+
+    def gravar(self):
+        """
+        Grava todos os incrementos pendentes numa única transação.
+        Em caso de erro, os incrementos voltam para a fila da próxima tentativa.
+        """
+        with self._lock:
+            if not self._pendentes:
+                return
+            lote, self._pendentes = self._pendentes, {}
+            self._total_pendente = 0
+
+        try:
+            with self.app.app_context():
+                db = get_db()
+                param_placeholder = "%s" if self.app.config.get('DATABASE_URL') else "?"
+                cur = db.cursor()
+                cur.executemany(
+                    f"""
+                    INSERT INTO click_counts (event_name, count) VALUES ({param_placeholder}, {param_placeholder})
+                    ON CONFLICT (event_name) DO UPDATE SET count = click_counts.count + excluded.count
+                    """,
+                    sorted(lote.items())  # Ordem fixa evita deadlock entre workers no PostgreSQL
+                )
+                db.commit()
+        except Exception:
+            log.exception("Erro ao gravar cliques")
+            with self._lock:
+                for event_name, quantidade in lote.items():
+                    self._pendentes[event_name] = self._pendentes.get(event_name, 0) + quantidade
+                    self._total_pendente += quantidade
+
+    def encerrar(self):
+        """
+        Para a thread e grava o que estiver pendente. Chamado na saída do processo.
+        """
+        self._parar.set()
+        self._acordar.set()
+        self._thread.join(timeout=self.intervalo)
+        self.gravar()
+
+    def estatisticas(self):
+        with self._lock:
+            return {
+                'pendentes': self._total_pendente,
+                'eventos_pendentes': len(self._pendentes),
+                'descartados': self._descartados,
+            }
+
+
+# Um agregador por processo: após o fork, cada worker do gunicorn cria o seu
+_agregador = None
+_agregador_pid = None
+_agregador_lock = threading.Lock()
+
+def obter_agregador(app):
+    """
+    Retorna o agregador de cliques deste processo, criando-o no primeiro uso.
+    """
+    global _agregador, _agregador_pid
+    if _agregador is None or _agregador_pid != os.getpid():
+        with _agregador_lock:
+            if _agregador is None or _agregador_pid != os.getpid():
+                _agregador = AgregadorCliques(
+                    app,
+                    intervalo=app.config['CLIQUES_FLUSH_INTERVALO'],
+                    max_pendentes=app.config['CLIQUES_FLUSH_MAX'],
+                )
+                _agregador_pid = os.getpid()
+                atexit.register(_agregador.encerrar)
+    return _agregador
@@ -15,4 +15,147 @@ class Config:
     # DATABASE_URL será definida no Render para produção (PostgreSQL)
     DATABASE_URL = os.environ.get('DATABASE_URL')
     # DATABASE é o caminho local para o SQLite (apenas para desenvolvimento)
-    DATABASE = 'instance/banco.db'
\ No newline at end of file
+    DATABASE = os.environ.get('DATABASE', 'instance/banco.db')
+
+    # --- Pool de conexões PostgreSQL (um pool por worker do gunicorn) ---
+    DB_POOL_MIN = int(os.environ.get('DB_POOL_MIN', 1))
+    DB_POOL_MAX = int(os.environ.get('DB_POOL_MAX', 10))
+    # Segundos que uma requisição espera por uma conexão livre antes de falhar
+    DB_POOL_TIMEOUT = float(os.environ.get('DB_POOL_TIMEOUT', 5))
+    # Conexões são recicladas após esse número de empréstimos ou essa idade (segundos)
+    DB_POOL_MAX_USOS = int(os.environ.get('DB_POOL_MAX_USOS', 500))
+    DB_POOL_MAX_IDADE = int(os.environ.get('DB_POOL_MAX_IDADE', 1800))
+    # Conexões ociosas há mais que isso (segundos) são testadas com SELECT 1 no empréstimo
+    DB_POOL_PING_APOS = int(os.environ.get('DB_POOL_PING_APOS', 30))
+
+    # --- Réplicas de leitura (só com DATABASE_URL) ---
+    # URLs separadas por vírgula; as rotas @somente_leitura leem delas, as escritas vão ao primário
+    DATABASE_REPLICA_URLS = os.environ.get('DATABASE_REPLICA_URLS')
+    # Segundos em que o usuário lê do primário após uma escrita sua (atraso da replicação)
+    DB_REPLICA_JANELA = float(os.environ.get('DB_REPLICA_JANELA', 5))
+    # Segundos que uma réplica que falhou fica fora do rodízio
+    DB_REPLICA_PAUSA = float(os.environ.get('DB_REPLICA_PAUSA', 30))
+    # Espera por uma conexão livre na réplica; depois disso a leitura vai ao primário
+    DB_REPLICA_TIMEOUT = float(os.environ.get('DB_REPLICA_TIMEOUT', 0.5))
+
+    # --- Cache da identidade (nome, tipo_usuario) do usuário logado ---
+    USUARIO_CACHE_TTL = int(os.environ.get('USUARIO_CACHE_TTL', 60))
+    USUARIO_CACHE_MAX = 10000
+
+    # --- Redefinição de senha ---
+    # Validade, em segundos, do link enviado por e-mail (token assinado, não fica no banco)
+    RESET_SENHA_VALIDADE = 3600
+
+    # --- Contagem de cliques (/track_click) ---
+    # Os cliques são acumulados em memória e gravados em lote a cada CLIQUES_FLUSH_INTERVALO
+    # segundos, ou antes quando CLIQUES_FLUSH_MAX cliques se acumulam
+    CLIQUES_FLUSH_INTERVALO = float(os.environ.get('CLIQUES_FLUSH_INTERVALO', 5))
+    CLIQUES_FLUSH_MAX = int(os.environ.get('CLIQUES_FLUSH_MAX', 100))
+
+    # --- Contagem de acessos por rota (metricas.py) ---
+    # Intervalo, em segundos, entre as consolidações dos contadores nos baldes do banco
+    METRICAS_INTERVALO = float(os.environ.get('METRICAS_INTERVALO', 60))
+
+    # --- Logs em JSON, escritos por uma thread de cada processo (logs.py) ---
+    LOGS_NIVEL = os.environ.get('LOGS_NIVEL', 'INFO').upper()
+    # 'stdout', 'stderr' ou o caminho de um arquivo
+    LOGS_SAIDA = os.environ.get('LOGS_SAIDA', 'stderr')
+    # Registros em memória esperando a escrita; com a fila cheia, os novos são descartados
+    LOGS_FILA = int(os.environ.get('LOGS_FILA', 10000))
+    # Uma linha por requisição (rota, status, duração)
+    LOGS_ACESSO = os.environ.get('LOGS_ACESSO', '1') == '1'
+    # Mensagens DEBUG: fração mantida e máximo por segundo para cada texto de mensagem
+    LOGS_DEBUG_AMOSTRA = float(os.environ.get('LOGS_DEBUG_AMOSTRA', 1.0))
+    LOGS_DEBUG_POR_SEGUNDO = int(os.environ.get('LOGS_DEBUG_POR_SEGUNDO', 10))
+
+    # --- Métricas no formato do Prometheus em /metrics (telemetria.py) ---
+    # Pasta compartilhada pelos workers do gunicorn: cada um grava ali o seu retrato
+    TELEMETRIA_PASTA = os.environ.get('TELEMETRIA_PASTA', 'instance/telemetria')
+    # Intervalo, em segundos, entre as gravações do retrato de cada worker
+    TELEMETRIA_INTERVALO = float(os.environ.get('TELEMETRIA_INTERVALO', 5))
+    # /metrics exige o cabeçalho "Authorization: Bearer <token>"; sem token, responde 404
+    TELEMETRIA_TOKEN = os.environ.get('TELEMETRIA_TOKEN')
+
+    # --- Perfil das consultas SQL (perfil_sql.py) ---
+    # Pasta compartilhada pelos workers, como TELEMETRIA_PASTA
+    PERFIL_SQL_PASTA = os.environ.get('PERFIL_SQL_PASTA', 'instance/perfil_sql')
+    PERFIL_SQL_INTERVALO = float(os.environ.get('PERFIL_SQL_INTERVALO', 10))
+    # Consultas a partir deste tempo vão para o registro de lentas, com o plano do EXPLAIN
+    PERFIL_SQL_LENTA_MS = float(os.environ.get('PERFIL_SQL_LENTA_MS', 100))
+    # Intervalo mínimo, em segundos, entre dois EXPLAIN da mesma consulta lenta
+    PERFIL_SQL_EXPLICAR_A_CADA = float(os.environ.get('PERFIL_SQL_EXPLICAR_A_CADA', 300))
+    # Mesma consulta repetida tantas vezes numa requisição: possível N+1
+    PERFIL_SQL_N_MAIS_1 = int(os.environ.get('PERFIL_SQL_N_MAIS_1', 10))
+    # Tamanho das listas do relatório (consultas, requisições, lentas, N+1)
+    PERFIL_SQL_TOP = int(os.environ.get('PERFIL_SQL_TOP', 20))
+
+    # --- Fila de tarefas em segundo plano (tarefas.py) ---
+    # Threads que processam tarefas em cada worker. Com 0 o processo web só enfileira,
+    # e as tarefas ficam para o processar_tarefas.py rodando como processo separado
+    TAREFAS_TRABALHADORES = int(os.environ.get('TAREFAS_TRABALHADORES', 2))
+    # Segundos entre as consultas por tarefas novas (enfileirar no mesmo worker acorda na hora)
+    TAREFAS_INTERVALO = float(os.environ.get('TAREFAS_INTERVALO', 5))
+    # Tentativas antes de marcar a tarefa como 'falhou'; a espera entre elas dobra a cada falha
+    TAREFAS_MAX_TENTATIVAS = 5
+    TAREFAS_ESPERA_BASE = 10
+    # Tarefas em 'processando' há mais que isso (segundos) voltam para a fila (worker morreu)
+    TAREFAS_TRAVADA_APOS = 600
+
+    # --- Caixa de saída de e-mails (emails.py) ---
+    # Transporte usado no envio: 'sendgrid', 'smtp' ou 'arquivo' (grava .eml em EMAIL_PASTA)
+    EMAIL_TRANSPORTE = os.environ.get('EMAIL_TRANSPORTE', 'sendgrid')
+    EMAIL_PASTA = os.environ.get('EMAIL_PASTA', os.path.join('instance', 'emails'))
+    EMAIL_SMTP_HOST = os.environ.get('EMAIL_SMTP_HOST', 'localhost')
+    EMAIL_SMTP_PORTA = int(os.environ.get('EMAIL_SMTP_PORTA', 1025))
+    EMAIL_SMTP_USUARIO = os.environ.get('EMAIL_SMTP_USUARIO')
+    EMAIL_SMTP_SENHA = os.environ.get('EMAIL_SMTP_SENHA')
+    EMAIL_SMTP_TLS = os.environ.get('EMAIL_SMTP_TLS', '0') == '1'
+    # Envia a partir dos workers web. Desligue (EMAILS_ENVIAR=0) se o processar_emails.py
+    # rodar como processo separado; aí as requisições só gravam na caixa de saída
+    EMAILS_ENVIAR = os.environ.get('EMAILS_ENVIAR', '1') != '0'
+    # E-mails entregues ao transporte de uma vez e teto por minuto, por processo
+    EMAILS_LOTE = 20
+    EMAILS_POR_MINUTO = int(os.environ.get('EMAILS_POR_MINUTO', 120))
+    # Segundos entre as consultas por e-mails novos (enfileirar no mesmo worker acorda na hora)
+    EMAILS_INTERVALO = float(os.environ.get('EMAILS_INTERVALO', 5))
+    # Tentativas antes de marcar o e-mail como 'falhou'; a espera entre elas dobra a cada falha
+    EMAILS_MAX_TENTATIVAS = 6
+    EMAILS_ESPERA_BASE = 30
+    # E-mails em 'enviando' há mais que isso (segundos) voltam para a fila (worker morreu)
+    EMAILS_TRAVADO_APOS = 300
+
+    # --- CSS/JS versionados (assets.py) ---
+    # Gera static/dist/ na inicialização. Desligue (ASSETS_CONSTRUIR=0) se o deploy já
+    # rodar construir_assets.py; aí o app só lê o manifesto
+    ASSETS_CONSTRUIR = os.environ.get('ASSETS_CONSTRUIR', '1') != '0'
+
+    # --- Cache das páginas públicas para visitantes (cache_paginas.py) ---
+    # Páginas guardadas por worker e idade máxima de cada uma (0 desliga o cache)
+    PAGINAS_CACHE_MAX = int(os.environ.get('PAGINAS_CACHE_MAX', 500))
+    PAGINAS_CACHE_TTL = int(os.environ.get('PAGINAS_CACHE_TTL', 300))
+    # Segundos entre as leituras das invalidações feitas pelos outros workers
+    PAGINAS_CACHE_SINCRONIZAR = float(os.environ.get('PAGINAS_CACHE_SINCRONIZAR', 2))
+
+    # --- Painel administrativo ---
+    ADMIN_POR_PAGINA = 25
+    # Segundos em que os contadores do painel são servidos do cache
+    ADMIN_STATS_TTL = int(os.environ.get('ADMIN_STATS_TTL', 30))
+
+    # --- Configurações da Pesquisa de Imóveis ---
+    # Quantidade de imóveis por página em /pesquisa e o teto aceito via ?limite=
+    PESQUISA_POR_PAGINA = 24
+    PESQUISA_MAX_POR_PAGINA = 60
+    # Busca por proximidade (?perto= / ?lat=&lng=): raio padrão e máximo, em km, e o teto
+    # de imóveis por resposta de /api/imoveis/proximos
+    PESQUISA_RAIO_PADRAO = 2
+    PESQUISA_RAIO_MAX = 20
+    PESQUISA_MAX_PROXIMOS = 200
+
+    # --- API JSON pública de pesquisa (/api/imoveis) ---
+    # Teto de imóveis por página aceito via ?limite=
+    API_MAX_POR_PAGINA = 500
+    # Páginas até esse tamanho são montadas inteiras, guardadas no cache de páginas e
+    # levam ETag; maiores são enviadas aos poucos (streaming), sem ETag
+    API_STREAMING_ACIMA = 100
+    # Respostas menores que isso (bytes) não são comprimidas com gzip
+    API_GZIP_MINIMO = 1024
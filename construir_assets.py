@@ -0,0 +1,23 @@
+# construir_assets.py
+# Gera os CSS/JS versionados (static/dist/) e o manifesto, para rodar no build do deploy.
+# Com isso os workers podem subir com ASSETS_CONSTRUIR=0 e só ler o manifesto.
+#
+# Uso:
+#   python construir_assets.py           -> gera dist/ e o manifesto
+#   python construir_assets.py --limpar  -> também apaga as versões antigas de dist/
+import os
+import sys
+
+from flask import Flask
+
+from assets import construir, limpar, PASTA_DIST
+
+if __name__ == '__main__':
+    # Só precisamos da pasta static: não importa o app (nem abre o banco)
+    pasta_static = Flask(__name__).static_folder
+    manifesto = construir(pasta_static)
+    for nome, versionado in sorted(manifesto.items()):
+        tamanho = os.path.getsize(os.path.join(pasta_static, PASTA_DIST, versionado))
+        print(f"{nome:28} -> {PASTA_DIST}/{versionado} ({tamanho} bytes)")
+    if '--limpar' in sys.argv:
+        print(f"{limpar(pasta_static, manifesto)} arquivo(s) antigo(s) removido(s).")
@@ -1,44 +1,446 @@
 # database.py
 
+import itertools
+import logging
 import sqlite3
 import os
-import psycopg2 # Importa o driver PostgreSQL
-import psycopg2.extras # Para acessar colunas como dicionários (DictCursor)
-from flask import g, current_app
+import threading
+import time
+from datetime import datetime
+from flask import g, current_app, has_request_context, request, session
+from pool import PoolConexoes, PoolEsgotadoError # Pool de conexões PostgreSQL
+from perfil_sql import ConexaoPerfilada, obter_perfil # Tempo de cada consulta (perfil SQL)
+from geo import distancia_km, geohash
+from extras import mascara_dos_textos
+
+log = logging.getLogger(__name__)
+
+# Pool de conexões PostgreSQL do processo atual. Guardamos o PID junto para que um
+# worker criado por fork (gunicorn --preload) não reaproveite os sockets do processo pai.
+_pool = None
+_pool_pid = None
+_pool_lock = threading.Lock()
+
+def obter_pool():
+    """
+    Retorna o pool de conexões PostgreSQL deste processo, criando-o no primeiro uso.
+    """
+    global _pool, _pool_pid
+    if _pool is None or _pool_pid != os.getpid():
+        with _pool_lock:
+            if _pool is None or _pool_pid != os.getpid():
+                config = current_app.config
+                _pool = PoolConexoes(
+                    config['DATABASE_URL'],
+                    min_conexoes=config['DB_POOL_MIN'],
+                    max_conexoes=config['DB_POOL_MAX'],
+                    timeout=config['DB_POOL_TIMEOUT'],
+                    max_usos=config['DB_POOL_MAX_USOS'],
+                    max_idade=config['DB_POOL_MAX_IDADE'],
+                    ping_apos=config['DB_POOL_PING_APOS'],
+                )
+                _pool_pid = os.getpid()
+    return _pool
+
+def estatisticas_pool():
+    """
+    Estatísticas do pool deste worker (None se o pool ainda não existe ou se usamos SQLite).
+    """
+    if _pool is None or _pool_pid != os.getpid():
+        return None
+    return _pool.estatisticas()
+
+# ----- RÉPLICAS DE LEITURA -----
+# Com DATABASE_REPLICA_URLS, as rotas marcadas com @somente_leitura leem de uma réplica.
+# Cada réplica tem o seu pool neste processo; uma réplica que falha fica de fora por
+# DB_REPLICA_PAUSA segundos, e sem nenhuma disponível a leitura volta para o primário.
+_replicas = None
+_replicas_pid = None
+_replicas_lock = threading.Lock()
+_rodizio = itertools.count()  # Rodízio entre as réplicas
+
+# Última invalidação de páginas vista por este worker (cache_paginas.py)
+_invalidado_em = float('-inf')
+
+def somente_leitura(view):
+    """
+    Decorador das rotas que só leem o banco: com réplicas configuradas, o get_db das
+    requisições GET/HEAD delas empresta uma conexão de réplica.
+    """
+    view.somente_leitura = True
+    return view
+
+def obter_replicas():
+    """
+    Réplicas deste processo ([{'nome', 'pool', 'indisponivel_ate'}]), criadas no primeiro uso.
+    """
+    global _replicas, _replicas_pid
+    if _replicas is None or _replicas_pid != os.getpid():
+        with _replicas_lock:
+            if _replicas is None or _replicas_pid != os.getpid():
+                config = current_app.config
+                urls = [u.strip() for u in (config.get('DATABASE_REPLICA_URLS') or '').split(',') if u.strip()]
+                _replicas = [
+                    {
+                        'nome': f'replica{i}',
+                        # min_conexoes=0: uma réplica fora do ar não impede o worker de subir
+                        'pool': PoolConexoes(
+                            url,
+                            min_conexoes=0,
+                            max_conexoes=config['DB_POOL_MAX'],
+                            timeout=config['DB_REPLICA_TIMEOUT'],
+                            max_usos=config['DB_POOL_MAX_USOS'],
+                            max_idade=config['DB_POOL_MAX_IDADE'],
+                            ping_apos=config['DB_POOL_PING_APOS'],
+                        ),
+                        'indisponivel_ate': 0.0,
+                    }
+                    for i, url in enumerate(urls)
+                ]
+                _replicas_pid = os.getpid()
+    return _replicas
+
+def estatisticas_replicas():
+    """
+    Estatísticas dos pools das réplicas deste worker (lista vazia sem réplicas).
+    """
+    if _replicas is None or _replicas_pid != os.getpid():
+        return []
+    agora = time.monotonic()
+    return [dict(r['pool'].estatisticas(), nome=r['nome'], disponivel=r['indisponivel_ate'] <= agora)
+            for r in _replicas]
+
+def marcar_escrita():
+    """
+    Leitura das próprias escritas: o usuário que acabou de alterar algo lê do primário
+    pelos próximos DB_REPLICA_JANELA segundos (as réplicas podem estar atrasadas).
+    Fica na sessão, então vale em qualquer worker. Visitantes sem login não são
+    marcados, para não ganharem um cookie de sessão (o que desligaria o cache de páginas).
+    """
+    if current_app.config.get('DATABASE_REPLICA_URLS') and session.get('usuario_id'):
+        session['escrita_em'] = int(time.time())
+
+def marcar_invalidacao():
+    """
+    Chamado quando o cache de páginas descarta páginas: as próximas leituras deste worker
+    vão ao primário por DB_REPLICA_JANELA segundos, para que a página refeita já tenha a
+    alteração (uma réplica atrasada a deixaria velha no cache).
+    """
+    global _invalidado_em
+    _invalidado_em = time.monotonic()
+
+def _usar_replica():
+    config = current_app.config
+    if not config.get('DATABASE_REPLICA_URLS') or not has_request_context():
+        return False
+    if request.method not in ('GET', 'HEAD'):
+        return False
+    if not getattr(current_app.view_functions.get(request.endpoint), 'somente_leitura', False):
+        return False
+    janela = config['DB_REPLICA_JANELA']
+    if time.monotonic() - _invalidado_em < janela:
+        return False
+    escrita_em = session.get('escrita_em')
+    return not (escrita_em and time.time() - escrita_em < janela)
+
+def _emprestar_replica():
+    """
+    (pool, conexão) da próxima réplica disponível, ou None se todas falharem.
+    """
+    replicas = obter_replicas()
+    inicio = next(_rodizio)
+    for i in range(len(replicas)):
+        replica = replicas[(inicio + i) % len(replicas)]
+        if replica['indisponivel_ate'] > time.monotonic():
+            continue
+        try:
+            return replica['pool'], replica['pool'].obter()
+        except PoolEsgotadoError:
+            continue  # Só ocupada: tenta a próxima sem tirá-la do rodízio
+        except Exception:
+            replica['indisponivel_ate'] = time.monotonic() + current_app.config['DB_REPLICA_PAUSA']
+            log.warning("Réplica %s indisponível; fora do rodízio por %s s", replica['nome'],
+                        current_app.config['DB_REPLICA_PAUSA'], exc_info=True)
+    return None
 
 def get_db():
     """
     Obtém uma conexão com o banco de dados.
     Usa PostgreSQL em produção (se DATABASE_URL estiver definido) ou SQLite em desenvolvimento.
+    No PostgreSQL a conexão é emprestada do pool do worker e devolvida em close_db; nas
+    rotas @somente_leitura, com réplicas configuradas, vem do pool de uma réplica.
+    A conexão vem dentro de ConexaoPerfilada, que mede cada consulta (perfil_sql.py);
+    o tempo para obtê-la fica em g.db_espera, para a telemetria.
     """
     if 'db' not in g:
+        inicio = time.perf_counter()
         db_url = current_app.config.get('DATABASE_URL')
 
         if db_url: # Ambiente de Produção (Render) - Usar PostgreSQL
+            emprestimo = _emprestar_replica() if _usar_replica() else None
             try:
-                g.db = psycopg2.connect(db_url)
-                # O cursor DictCursor permite acessar os resultados como dicionários (row['nome'])
-                g.db.cursor_factory = psycopg2.extras.DictCursor
-                print("Conectado ao PostgreSQL.")
+                # O pool já entrega conexões com cursor_factory = DictCursor
+                g.db_pool, g.db = emprestimo or (obter_pool(), obter_pool().obter())
             except Exception as e:
-                print(f"Erro ao conectar ao PostgreSQL: {e}")
+                log.exception("Erro ao conectar ao PostgreSQL")
                 # Em produção, um erro de DB é crítico, é melhor levantar a exceção
                 raise ConnectionError(f"Não foi possível conectar ao banco de dados PostgreSQL: {e}")
         else: # Ambiente de Desenvolvimento (Local) - Usar SQLite
             os.makedirs(os.path.dirname(current_app.config['DATABASE']), exist_ok=True)
             g.db = sqlite3.connect(current_app.config['DATABASE'])
             g.db.row_factory = sqlite3.Row # Permite acessar colunas por nome
-            print("Conectado ao SQLite.")
+            # Distância usada pela busca por proximidade (no PostgreSQL vem do earthdistance)
+            g.db.create_function('distancia_km', 4, distancia_km, deterministic=True)
+            log.debug("Conectado ao SQLite.")
+        g.db = ConexaoPerfilada(g.db, obter_perfil(current_app), bool(db_url))
+        g.db_espera = time.perf_counter() - inicio
     return g.db
 
 def close_db(e=None):
     """
-    Fecha a conexão com o banco de dados no final da requisição.
+    Libera a conexão com o banco de dados no final da requisição.
+    No PostgreSQL ela volta para o pool de onde veio; no SQLite é fechada.
     """
     db = g.pop('db', None)
     if db is not None:
-        db.close()
-        print("Conexão com o banco de dados fechada.")
+        db = db.conexao  # A conexão original, sem o perfil SQL
+        pool = g.pop('db_pool', None)
+        if pool is not None:
+            pool.devolver(db)  # Ao pool de onde veio (primário ou réplica)
+        else:
+            db.close()
+            log.debug("Conexão com o banco de dados fechada.")
+
+# Índices gerenciados pela aplicação: (nome, tabela, colunas, condição do índice parcial).
+# A mesma definição serve para SQLite e PostgreSQL; inicializar_banco cria os que faltarem.
+INDICES = (
+    # Pesquisa: imóveis ativos ordenados por valor (paginação por chave valor, id)
+    ('idx_imoveis_ativos_valor', 'imoveis', 'valor, id', 'ativo = 1'),
+    # Painel admin: contagem de ativos/inativos
+    ('idx_imoveis_ativo', 'imoveis', 'ativo', None),
+    # Meus imóveis e todos os UPDATE/DELETE restritos ao dono
+    ('idx_imoveis_usuario', 'imoveis', 'usuario_id, id', None),
+    # Painel admin: solicitações de exclusão pendentes
+    ('idx_usuarios_exclusao_pendente', 'usuarios', 'id', 'solicitacao_exclusao = 1'),
+    # Tokens de redefinição de senha (token já possui índice pelo UNIQUE)
+    ('idx_tokens_expiration', 'tokens', 'expiration', None),
+    ('idx_tokens_user', 'tokens', 'user_id', None),
+    # Painel admin: séries de acessos das últimas horas/dias, somadas entre rotas
+    ('idx_acessos_hora_hora', 'acessos_hora', 'hora', None),
+    ('idx_acessos_dia_dia', 'acessos_dia', 'dia', None),
+    # Fila de tarefas: próxima tarefa pendente e tarefas presas em 'processando'
+    ('idx_tarefas_pendentes', 'tarefas', 'disponivel_em, id', "estado = 'pendente'"),
+    ('idx_tarefas_processando', 'tarefas', 'iniciada_em', "estado = 'processando'"),
+    # Caixa de saída de e-mails: próximos pendentes e e-mails presos em 'enviando'
+    ('idx_emails_pendentes', 'emails', 'disponivel_em, id', "estado = 'pendente'"),
+    ('idx_emails_enviando', 'emails', 'iniciado_em', "estado = 'enviando'"),
+    # Cache de páginas: invalidações recentes (lidas a cada poucos segundos por worker)
+    ('idx_invalidacoes_cache_criada', 'invalidacoes_cache', 'criada_em', None),
+)
+
+def limpar_tokens_expirados(cursor, postgres):
+    """
+    Os links de redefinição de senha agora são tokens assinados (auth.gerar_token_reset)
+    e nada mais é gravado em tokens: só restam as linhas de links antigos, apagadas
+    aqui depois de expirarem (pelo índice idx_tokens_expiration).
+    """
+    ph = "%s" if postgres else "?"
+    cursor.execute(f'DELETE FROM tokens WHERE expiration < {ph}', (datetime.now(),))
+
+def criar_indices(cursor):
+    """
+    Cria os índices de INDICES que ainda não existem.
+    """
+    for nome, tabela, colunas, condicao in INDICES:
+        sql = f'CREATE INDEX IF NOT EXISTS {nome} ON {tabela} ({colunas})'
+        if condicao:
+            sql += f' WHERE {condicao}'
+        cursor.execute(sql)
+
+# Colunas de imoveis cobertas pela busca textual da pesquisa
+COLUNAS_BUSCA = ('endereco', 'bairro', 'complemento', 'descricao', 'outros')
+
+def migrar_extras_e_fotos(cursor, postgres):
+    """
+    Converte bancos do formato antigo, em que imoveis.inclusos e imoveis.imagem eram
+    textos separados por vírgula: os extras viram a máscara imoveis.extras (extras.py;
+    textos que não são extras conhecidos vão para 'outros') e as fotos viram linhas
+    de fotos, na mesma ordem. As colunas antigas são removidas no fim, na mesma
+    transação, então a conversão roda uma vez só.
+    """
+    ph = "%s" if postgres else "?"
+    if postgres:
+        cursor.execute("""
+            SELECT column_name FROM information_schema.columns
+            WHERE table_schema = current_schema() AND table_name = 'imoveis'
+        """)
+        colunas = {r[0] for r in cursor.fetchall()}
+    else:
+        colunas = {r[1] for r in cursor.execute('PRAGMA table_info(imoveis)').fetchall()}
+    if 'extras' not in colunas:
+        cursor.execute('ALTER TABLE imoveis ADD COLUMN extras INTEGER NOT NULL DEFAULT 0')
+    if 'inclusos' not in colunas and 'imagem' not in colunas:
+        return
+
+    inclusos = 'inclusos' if 'inclusos' in colunas else 'NULL'
+    imagem = 'imagem' if 'imagem' in colunas else 'NULL'
+    cursor.execute(f'SELECT id, {inclusos}, {imagem}, outros FROM imoveis')
+    imoveis = []
+    fotos = []
+    for imovel_id, texto_inclusos, texto_imagem, outros in cursor.fetchall():
+        mascara, desconhecidos = mascara_dos_textos((texto_inclusos or '').split(','))
+        if desconhecidos:
+            outros = ', '.join(filter(None, [outros, *desconhecidos]))
+        imoveis.append((mascara, outros, imovel_id))
+        # default.jpg era gravado quando o anúncio não tinha foto; agora é só a falta de linhas
+        nomes = [n for n in (texto_imagem or '').split(',') if n and n != 'default.jpg']
+        fotos.extend((imovel_id, posicao, nome) for posicao, nome in enumerate(nomes))
+    cursor.executemany(f'UPDATE imoveis SET extras = {ph}, outros = {ph} WHERE id = {ph}', imoveis)
+    cursor.executemany(f'INSERT INTO fotos (imovel_id, posicao, caminho) VALUES ({ph}, {ph}, {ph})', fotos)
+    for coluna in ('inclusos', 'imagem'):
+        if coluna in colunas:
+            cursor.execute(f'ALTER TABLE imoveis DROP COLUMN {coluna}')
+    log.info("%d imóvel(is) convertido(s) para extras/fotos.", len(imoveis))
+
+def criar_busca_textual(cursor, postgres):
+    """
+    Índice de texto completo da pesquisa, sem diferenciar acentos ("Parnaíba" = "parnaiba").
+    - PostgreSQL: coluna imoveis.busca (tsvector gerado, com pesos por campo) e índice GIN,
+      usando a configuração portugues_sem_acento (unaccent + stemmer do português).
+    - SQLite: tabela FTS5 imoveis_busca sobre imoveis, mantida por triggers, ranqueada
+      por bm25 com pesos na mesma proporção (A = 1.0, B = 0.4, C = 0.2 do ts_rank).
+    """
+    if postgres:
+        cursor.execute('CREATE EXTENSION IF NOT EXISTS unaccent')
+        cursor.execute("""
+            DO $$ BEGIN
+                IF NOT EXISTS (SELECT 1 FROM pg_ts_config WHERE cfgname = 'portugues_sem_acento') THEN
+                    CREATE TEXT SEARCH CONFIGURATION portugues_sem_acento (COPY = portuguese);
+                    ALTER TEXT SEARCH CONFIGURATION portugues_sem_acento
+                        ALTER MAPPING FOR hword, hword_part, word WITH unaccent, portuguese_stem;
+                END IF;
+            END $$
+        """)
+        # Endereço e bairro pesam mais que complemento, que pesa mais que descrição e extras
+        cursor.execute("""
+            ALTER TABLE imoveis ADD COLUMN IF NOT EXISTS busca tsvector GENERATED ALWAYS AS (
+                setweight(to_tsvector('portugues_sem_acento', coalesce(endereco, '')), 'A') ||
+                setweight(to_tsvector('portugues_sem_acento', coalesce(bairro, '')), 'A') ||
+                setweight(to_tsvector('portugues_sem_acento', coalesce(complemento, '')), 'B') ||
+                setweight(to_tsvector('portugues_sem_acento', coalesce(descricao, '')), 'C') ||
+                setweight(to_tsvector('portugues_sem_acento', coalesce(outros, '')), 'C')
+            ) STORED
+        """)
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_imoveis_busca ON imoveis USING GIN (busca)')
+        return
+
+    colunas = ', '.join(COLUNAS_BUSCA)
+    novos = ', '.join(f'new.{c}' for c in COLUNAS_BUSCA)
+    antigos = ', '.join(f'old.{c}' for c in COLUNAS_BUSCA)
+    existia = cursor.execute(
+        "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'imoveis_busca'").fetchone()
+    cursor.execute(f"""
+        CREATE VIRTUAL TABLE IF NOT EXISTS imoveis_busca USING fts5(
+            {colunas}, content='imoveis', content_rowid='id',
+            tokenize='unicode61 remove_diacritics 2'
+        )
+    """)
+    cursor.execute(f"""
+        CREATE TRIGGER IF NOT EXISTS imoveis_busca_insert AFTER INSERT ON imoveis BEGIN
+            INSERT INTO imoveis_busca (rowid, {colunas}) VALUES (new.id, {novos});
+        END
+    """)
+    cursor.execute(f"""
+        CREATE TRIGGER IF NOT EXISTS imoveis_busca_delete AFTER DELETE ON imoveis BEGIN
+            INSERT INTO imoveis_busca (imoveis_busca, rowid, {colunas}) VALUES ('delete', old.id, {antigos});
+        END
+    """)
+    # Só reindexa quando um campo do texto muda (ativar/desativar anúncio não mexe no índice)
+    cursor.execute(f"""
+        CREATE TRIGGER IF NOT EXISTS imoveis_busca_update AFTER UPDATE OF {colunas} ON imoveis BEGIN
+            INSERT INTO imoveis_busca (imoveis_busca, rowid, {colunas}) VALUES ('delete', old.id, {antigos});
+            INSERT INTO imoveis_busca (rowid, {colunas}) VALUES (new.id, {novos});
+        END
+    """)
+    if not existia:
+        # Tabela nova num banco que já tinha imóveis: indexa todos de uma vez
+        cursor.execute("INSERT INTO imoveis_busca (imoveis_busca) VALUES ('rebuild')")
+        cursor.execute("INSERT INTO imoveis_busca (imoveis_busca, rank) VALUES ('rank', 'bm25(10.0, 10.0, 4.0, 2.0, 2.0)')")
+
+def preencher_geohash(cursor, postgres):
+    """
+    Calcula imoveis.geohash dos imóveis com coordenadas e sem geohash.
+    """
+    ph = "%s" if postgres else "?"
+    cursor.execute('SELECT id, latitude, longitude FROM imoveis '
+                   'WHERE geohash IS NULL AND latitude IS NOT NULL AND longitude IS NOT NULL')
+    pendentes = [(geohash(r[1], r[2]), r[0]) for r in cursor.fetchall()]
+    if pendentes:
+        cursor.executemany(f'UPDATE imoveis SET geohash = {ph} WHERE id = {ph}', pendentes)
+
+def criar_busca_geografica(cursor, postgres):
+    """
+    Índice espacial da busca por proximidade sobre imoveis.latitude/longitude.
+    - PostgreSQL: extensões cube e earthdistance e índice GiST em ll_to_earth(latitude, longitude).
+    - SQLite: tabela R*Tree imoveis_geo (um ponto por imóvel com coordenadas), mantida por triggers.
+    - Nos dois: imoveis.geohash (geo.geohash), a grade usada pelo mapa de imóveis, com
+      um índice que cobre a consulta dos tiles. Quem grava latitude/longitude grava o
+      geohash junto; os que faltarem são preenchidos aqui.
+    Bancos criados antes das colunas latitude/longitude/geohash as ganham aqui.
+    """
+    criar_indice_mapa = """
+        CREATE INDEX IF NOT EXISTS idx_imoveis_mapa ON imoveis (geohash, latitude, longitude, valor, id)
+        WHERE ativo = 1 AND geohash IS NOT NULL
+    """
+    if postgres:
+        cursor.execute('ALTER TABLE imoveis ADD COLUMN IF NOT EXISTS latitude REAL')
+        cursor.execute('ALTER TABLE imoveis ADD COLUMN IF NOT EXISTS longitude REAL')
+        cursor.execute('ALTER TABLE imoveis ADD COLUMN IF NOT EXISTS geohash BIGINT')
+        cursor.execute(criar_indice_mapa)
+        preencher_geohash(cursor, postgres)
+        cursor.execute('CREATE EXTENSION IF NOT EXISTS cube')
+        cursor.execute('CREATE EXTENSION IF NOT EXISTS earthdistance')
+        cursor.execute("""
+            CREATE INDEX IF NOT EXISTS idx_imoveis_geo ON imoveis
+            USING GIST (ll_to_earth(latitude, longitude))
+            WHERE latitude IS NOT NULL AND longitude IS NOT NULL
+        """)
+        return
+
+    colunas = {r[1] for r in cursor.execute('PRAGMA table_info(imoveis)').fetchall()}
+    for coluna, tipo in (('latitude', 'REAL'), ('longitude', 'REAL'), ('geohash', 'INTEGER')):
+        if coluna not in colunas:
+            cursor.execute(f'ALTER TABLE imoveis ADD COLUMN {coluna} {tipo}')
+    cursor.execute(criar_indice_mapa)
+    preencher_geohash(cursor, postgres)
+    existia = cursor.execute(
+        "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'imoveis_geo'").fetchone()
+    cursor.execute(
+        'CREATE VIRTUAL TABLE IF NOT EXISTS imoveis_geo USING rtree(id, min_lat, max_lat, min_lon, max_lon)')
+    cursor.execute("""
+        CREATE TRIGGER IF NOT EXISTS imoveis_geo_insert AFTER INSERT ON imoveis
+        WHEN new.latitude IS NOT NULL AND new.longitude IS NOT NULL BEGIN
+            INSERT INTO imoveis_geo VALUES (new.id, new.latitude, new.latitude, new.longitude, new.longitude);
+        END
+    """)
+    cursor.execute("""
+        CREATE TRIGGER IF NOT EXISTS imoveis_geo_delete AFTER DELETE ON imoveis BEGIN
+            DELETE FROM imoveis_geo WHERE id = old.id;
+        END
+    """)
+    cursor.execute("""
+        CREATE TRIGGER IF NOT EXISTS imoveis_geo_update AFTER UPDATE OF latitude, longitude ON imoveis BEGIN
+            DELETE FROM imoveis_geo WHERE id = old.id;
+            INSERT INTO imoveis_geo SELECT new.id, new.latitude, new.latitude, new.longitude, new.longitude
+            WHERE new.latitude IS NOT NULL AND new.longitude IS NOT NULL;
+        END
+    """)
+    if not existia:
+        cursor.execute("""
+            INSERT INTO imoveis_geo
+            SELECT id, latitude, latitude, longitude, longitude FROM imoveis
+            WHERE latitude IS NOT NULL AND longitude IS NOT NULL
+        """)
 
 def inicializar_banco():
     """
@@ -51,7 +453,7 @@ def inicializar_banco():
         if db_url: # PostgreSQL
             conn = get_db() # Obtém a conexão com o PostgreSQL
             cursor = conn.cursor()
-            print("Inicializando banco de dados PostgreSQL...")
+            log.info("Inicializando banco de dados PostgreSQL...")
             
             # Tabela usuarios
             cursor.execute('''
@@ -71,10 +473,10 @@ def inicializar_banco():
                     id SERIAL PRIMARY KEY,
                     endereco TEXT, bairro TEXT, numero TEXT, cep TEXT,
                     complemento TEXT, valor REAL, quartos INTEGER,
-                    banheiros INTEGER, inclusos TEXT, outros TEXT,
-                    descricao TEXT, imagem TEXT, tipo TEXT,
+                    banheiros INTEGER, extras INTEGER NOT NULL DEFAULT 0, outros TEXT,
+                    descricao TEXT, tipo TEXT,
                     usuario_id INTEGER, ativo INTEGER DEFAULT 1,
-                    latitude REAL, longitude REAL,
+                    latitude REAL, longitude REAL, geohash BIGINT,
                     FOREIGN KEY (usuario_id) REFERENCES usuarios (id) ON DELETE CASCADE
                 )
             ''')
@@ -86,18 +488,110 @@ def inicializar_banco():
                     count INTEGER DEFAULT 0
                 )
             ''')
+            # Tabela tokens (redefinição de senha)
+            cursor.execute('''
+                CREATE TABLE IF NOT EXISTS tokens (
+                    id SERIAL PRIMARY KEY,
+                    user_id INTEGER NOT NULL,
+                    token TEXT NOT NULL UNIQUE,
+                    expiration TIMESTAMP NOT NULL,
+                    FOREIGN KEY (user_id) REFERENCES usuarios (id) ON DELETE CASCADE
+                )
+            ''')
+            # Tabelas de acessos por rota, consolidados por hora, por dia e no total (metricas.py)
+            cursor.execute('''
+                CREATE TABLE IF NOT EXISTS acessos_hora (
+                    rota TEXT NOT NULL,
+                    hora TIMESTAMP NOT NULL,
+                    total INTEGER NOT NULL DEFAULT 0,
+                    PRIMARY KEY (rota, hora)
+                )
+            ''')
+            cursor.execute('''
+                CREATE TABLE IF NOT EXISTS acessos_dia (
+                    rota TEXT NOT NULL,
+                    dia DATE NOT NULL,
+                    total INTEGER NOT NULL DEFAULT 0,
+                    PRIMARY KEY (rota, dia)
+                )
+            ''')
+            cursor.execute('''
+                CREATE TABLE IF NOT EXISTS acessos_total (
+                    rota TEXT PRIMARY KEY,
+                    total INTEGER NOT NULL DEFAULT 0
+                )
+            ''')
+            # Fotos de cada imóvel, na ordem da galeria. Sem FOREIGN KEY: saem junto com o
+            # imóvel por imagens.excluir_fotos, que também desconta as referências em imagens
+            cursor.execute('''
+                CREATE TABLE IF NOT EXISTS fotos (
+                    imovel_id INTEGER NOT NULL,
+                    posicao INTEGER NOT NULL,
+                    caminho TEXT NOT NULL,
+                    PRIMARY KEY (imovel_id, posicao)
+                )
+            ''')
+            # Fotos do armazenamento por conteúdo e quantos imóveis usam cada uma (imagens.py)
+            cursor.execute('''
+                CREATE TABLE IF NOT EXISTS imagens (
+                    caminho TEXT PRIMARY KEY,
+                    referencias INTEGER NOT NULL DEFAULT 0
+                )
+            ''')
+            # Fila de tarefas em segundo plano (tarefas.py). Horários em segundos (epoch).
+            cursor.execute('''
+                CREATE TABLE IF NOT EXISTS tarefas (
+                    id SERIAL PRIMARY KEY,
+                    tipo TEXT NOT NULL,
+                    carga TEXT NOT NULL,
+                    estado TEXT NOT NULL DEFAULT 'pendente',
+                    tentativas INTEGER NOT NULL DEFAULT 0,
+                    disponivel_em DOUBLE PRECISION NOT NULL,
+                    iniciada_em DOUBLE PRECISION,
+                    criada_em DOUBLE PRECISION NOT NULL,
+                    erro TEXT
+                )
+            ''')
+            # Caixa de saída de e-mails (emails.py). Horários em segundos (epoch).
+            cursor.execute('''
+                CREATE TABLE IF NOT EXISTS emails (
+                    id SERIAL PRIMARY KEY,
+                    destinatario TEXT NOT NULL,
+                    assunto TEXT NOT NULL,
+                    html TEXT NOT NULL,
+                    estado TEXT NOT NULL DEFAULT 'pendente',
+                    tentativas INTEGER NOT NULL DEFAULT 0,
+                    disponivel_em DOUBLE PRECISION NOT NULL,
+                    iniciado_em DOUBLE PRECISION,
+                    criado_em DOUBLE PRECISION NOT NULL,
+                    erro TEXT
+                )
+            ''')
+            # Invalidações do cache de páginas, lidas por todos os workers (cache_paginas.py)
+            cursor.execute('''
+                CREATE TABLE IF NOT EXISTS invalidacoes_cache (
+                    id SERIAL PRIMARY KEY,
+                    etiqueta TEXT NOT NULL,
+                    criada_em DOUBLE PRECISION NOT NULL
+                )
+            ''')
+            migrar_extras_e_fotos(cursor, postgres=True)
+            criar_indices(cursor)
+            limpar_tokens_expirados(cursor, postgres=True)
+            criar_busca_textual(cursor, postgres=True)
+            criar_busca_geografica(cursor, postgres=True)
             # Garante que o evento 'contact_anunciante_click' existe na tabela click_counts (PostgreSQL)
             cursor.execute("""
                 INSERT INTO click_counts (event_name, count) VALUES (%s, %s)
                 ON CONFLICT (event_name) DO NOTHING;
             """, ('contact_anunciante_click', 0))
 
-            print("Banco de dados PostgreSQL inicializado com sucesso.")
+            log.info("Banco de dados PostgreSQL inicializado com sucesso.")
 
         else: # SQLite
             conn = get_db() # Obtém a conexão com o SQLite
             cursor = conn.cursor()
-            print("Inicializando banco de dados SQLite...")
+            log.info("Inicializando banco de dados SQLite...")
 
             # Tabela usuarios
             cursor.execute('''
@@ -117,10 +611,10 @@ def inicializar_banco():
                     id INTEGER PRIMARY KEY AUTOINCREMENT,
                     endereco TEXT, bairro TEXT, numero TEXT, cep TEXT,
                     complemento TEXT, valor REAL, quartos INTEGER,
-                    banheiros INTEGER, inclusos TEXT, outros TEXT,
-                    descricao TEXT, imagem TEXT, tipo TEXT,
+                    banheiros INTEGER, extras INTEGER NOT NULL DEFAULT 0, outros TEXT,
+                    descricao TEXT, tipo TEXT,
                     usuario_id INTEGER, ativo INTEGER DEFAULT 1,
-                    latitude REAL, longitude REAL,
+                    latitude REAL, longitude REAL, geohash INTEGER,
                     FOREIGN KEY (usuario_id) REFERENCES usuarios (id)
                 )
             ''')
@@ -132,20 +626,112 @@ def inicializar_banco():
                     count INTEGER DEFAULT 0
                 )
             ''')
+            # Tabela tokens (redefinição de senha)
+            cursor.execute('''
+                CREATE TABLE IF NOT EXISTS tokens (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    user_id INTEGER NOT NULL,
+                    token TEXT NOT NULL UNIQUE,
+                    expiration DATETIME NOT NULL,
+                    FOREIGN KEY (user_id) REFERENCES usuarios (id) ON DELETE CASCADE
+                )
+            ''')
+            # Tabelas de acessos por rota, consolidados por hora, por dia e no total (metricas.py)
+            cursor.execute('''
+                CREATE TABLE IF NOT EXISTS acessos_hora (
+                    rota TEXT NOT NULL,
+                    hora DATETIME NOT NULL,
+                    total INTEGER NOT NULL DEFAULT 0,
+                    PRIMARY KEY (rota, hora)
+                )
+            ''')
+            cursor.execute('''
+                CREATE TABLE IF NOT EXISTS acessos_dia (
+                    rota TEXT NOT NULL,
+                    dia DATE NOT NULL,
+                    total INTEGER NOT NULL DEFAULT 0,
+                    PRIMARY KEY (rota, dia)
+                )
+            ''')
+            cursor.execute('''
+                CREATE TABLE IF NOT EXISTS acessos_total (
+                    rota TEXT PRIMARY KEY,
+                    total INTEGER NOT NULL DEFAULT 0
+                )
+            ''')
+            # Fotos de cada imóvel, na ordem da galeria. Sem FOREIGN KEY: saem junto com o
+            # imóvel por imagens.excluir_fotos, que também desconta as referências em imagens
+            cursor.execute('''
+                CREATE TABLE IF NOT EXISTS fotos (
+                    imovel_id INTEGER NOT NULL,
+                    posicao INTEGER NOT NULL,
+                    caminho TEXT NOT NULL,
+                    PRIMARY KEY (imovel_id, posicao)
+                )
+            ''')
+            # Fotos do armazenamento por conteúdo e quantos imóveis usam cada uma (imagens.py)
+            cursor.execute('''
+                CREATE TABLE IF NOT EXISTS imagens (
+                    caminho TEXT PRIMARY KEY,
+                    referencias INTEGER NOT NULL DEFAULT 0
+                )
+            ''')
+            # Fila de tarefas em segundo plano (tarefas.py). Horários em segundos (epoch).
+            cursor.execute('''
+                CREATE TABLE IF NOT EXISTS tarefas (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    tipo TEXT NOT NULL,
+                    carga TEXT NOT NULL,
+                    estado TEXT NOT NULL DEFAULT 'pendente',
+                    tentativas INTEGER NOT NULL DEFAULT 0,
+                    disponivel_em REAL NOT NULL,
+                    iniciada_em REAL,
+                    criada_em REAL NOT NULL,
+                    erro TEXT
+                )
+            ''')
+            # Caixa de saída de e-mails (emails.py). Horários em segundos (epoch).
+            cursor.execute('''
+                CREATE TABLE IF NOT EXISTS emails (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    destinatario TEXT NOT NULL,
+                    assunto TEXT NOT NULL,
+                    html TEXT NOT NULL,
+                    estado TEXT NOT NULL DEFAULT 'pendente',
+                    tentativas INTEGER NOT NULL DEFAULT 0,
+                    disponivel_em REAL NOT NULL,
+                    iniciado_em REAL,
+                    criado_em REAL NOT NULL,
+                    erro TEXT
+                )
+            ''')
+            # Invalidações do cache de páginas, lidas por todos os workers (cache_paginas.py)
+            cursor.execute('''
+                CREATE TABLE IF NOT EXISTS invalidacoes_cache (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    etiqueta TEXT NOT NULL,
+                    criada_em REAL NOT NULL
+                )
+            ''')
+            migrar_extras_e_fotos(cursor, postgres=False)
+            criar_indices(cursor)
+            limpar_tokens_expirados(cursor, postgres=False)
+            criar_busca_textual(cursor, postgres=False)
+            criar_busca_geografica(cursor, postgres=False)
             # Garante que o evento 'contact_anunciante_click' existe na tabela click_counts (SQLite)
             cursor.execute("INSERT OR IGNORE INTO click_counts (event_name, count) VALUES (?, ?)", ('contact_anunciante_click', 0))
             
-            print("Banco de dados SQLite inicializado com sucesso.")
+            log.info("Banco de dados SQLite inicializado com sucesso.")
         
         conn.commit() # Confirma as mudanças no banco de dados
     except Exception as e:
-        print(f"ERRO ao inicializar o banco de dados: {e}")
+        log.exception("ERRO ao inicializar o banco de dados")
         if conn:
             try:
                 conn.rollback() # Tenta reverter qualquer mudança em caso de erro
-                print("Transação do banco de dados revertida.")
+                log.info("Transação do banco de dados revertida.")
             except Exception as rb_e:
-                print(f"Erro durante o rollback: {rb_e}")
+                log.error("Erro durante o rollback: %s", rb_e)
         raise e # Re-levanta a exceção para que o problema seja visível
     finally:
         # Se a conexão foi aberta especificamente para a inicialização (não pela g), feche-a
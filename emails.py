@@ -0,0 +1,379 @@
+# emails.py
+# Caixa de saída de e-mails: a requisição só grava o e-mail na tabela emails, na mesma
+# transação do que o gerou, e uma thread de cada worker (ou o processar_emails.py) envia
+# em lotes pelo transporte configurado (SendGrid, SMTP ou arquivos .eml).
+
+import atexit
+import logging
+import os
+import smtplib
+import threading
+import time
+from email.message import EmailMessage
+
+from flask import current_app
+
+from database import get_db
+
+try:
+    import sendgrid  # Só é necessário com EMAIL_TRANSPORTE = 'sendgrid'
+    from sendgrid.helpers.mail import Mail
+except ImportError:
+    sendgrid = None
+
+log = logging.getLogger(__name__)
+
+
+def enfileirar_email(db, destinatario, assunto, html):
+    """
+    Coloca um e-mail na caixa de saída. Não faz commit: o e-mail só sai se a transação
+    de quem o criou for confirmada. Depois do commit, chame acordar_envio().
+    """
+    ph = "%s" if current_app.config.get('DATABASE_URL') else "?"
+    agora = time.time()
+    db.cursor().execute(
+        f'INSERT INTO emails (destinatario, assunto, html, disponivel_em, criado_em) '
+        f'VALUES ({ph}, {ph}, {ph}, {ph}, {ph})',
+        (destinatario, assunto, html, agora, agora)
+    )
+
+
+# ----- TRANSPORTES -----
+
+class TransporteSendGrid:
+    """
+    Envia pela API HTTP do SendGrid (uma chamada por e-mail, com o mesmo cliente no lote).
+    """
+
+    def __init__(self, config):
+        if sendgrid is None:
+            raise RuntimeError("EMAIL_TRANSPORTE = 'sendgrid' requer o pacote sendgrid")
+        self.cliente = sendgrid.SendGridAPIClient(config['SENDGRID_API_KEY'])
+        self.remetente = config['MAIL_DEFAULT_SENDER']
+
+    def enviar(self, emails):
+        erros = {}
+        for email in emails:
+            try:
+                mensagem = Mail(self.remetente, email['destinatario'], email['assunto'],
+                                html_content=email['html'])
+                resposta = self.cliente.send(mensagem)
+                if not 200 <= resposta.status_code < 300:
+                    erros[email['id']] = f"SendGrid respondeu {resposta.status_code}"
+            except Exception as e:
+                erros[email['id']] = str(e)
+        return erros
+
+
+class TransporteSMTP:
+    """
+    Envia por SMTP, com uma conexão por lote. Serve também para um servidor SMTP de
+    teste local (ex.: EMAIL_SMTP_HOST=localhost, EMAIL_SMTP_PORTA=1025).
+    """
+
+    def __init__(self, config):
+        self.host = config['EMAIL_SMTP_HOST']
+        self.porta = config['EMAIL_SMTP_PORTA']
+        self.usuario = config['EMAIL_SMTP_USUARIO']
+        self.senha = config['EMAIL_SMTP_SENHA']
+        self.tls = config['EMAIL_SMTP_TLS']
+        self.remetente = config['MAIL_DEFAULT_SENDER']
+
+    def enviar(self, emails):
+        erros = {}
+        try:
+            with smtplib.SMTP(self.host, self.porta, timeout=30) as smtp:
+                if self.tls:
+                    smtp.starttls()
+                if self.usuario:
+                    smtp.login(self.usuario, self.senha)
+                for email in emails:
+                    try:
+                        smtp.send_message(_mensagem(self.remetente, email))
+                    except smtplib.SMTPException as e:
+                        erros[email['id']] = str(e)
+        except (OSError, smtplib.SMTPException) as e:
+            # Sem conexão: nenhum e-mail do lote que ainda não saiu foi enviado
+            for email in emails:
+                erros.setdefault(email['id'], str(e))
+        return erros
+
+
+class TransporteArquivo:
+    """
+    Grava cada e-mail como um arquivo .eml em EMAIL_PASTA, sem enviar nada.
+    Para desenvolvimento e testes.
+    """
+
+    def __init__(self, config):
+        self.pasta = config['EMAIL_PASTA']
+        self.remetente = config['MAIL_DEFAULT_SENDER']
+        os.makedirs(self.pasta, exist_ok=True)
+
+    def enviar(self, emails):
+        for email in emails:
+            caminho = os.path.join(self.pasta, f"{time.strftime('%Y%m%d-%H%M%S')}-{email['id']}.eml")
+            with open(caminho, 'wb') as f:
+                f.write(bytes(_mensagem(self.remetente, email)))
+        return {}
+
+
+# EMAIL_TRANSPORTE -> classe. Um transporte recebe a config do app e tem enviar(emails),
+# que retorna {id: mensagem de erro} dos e-mails que não saíram.
+TRANSPORTES = {
+    'sendgrid': TransporteSendGrid,
+    'smtp': TransporteSMTP,
+    'arquivo': TransporteArquivo,
+}
+
+
+def _mensagem(remetente, email):
+    mensagem = EmailMessage()
+    mensagem['From'] = remetente
+    mensagem['To'] = email['destinatario']
+    mensagem['Subject'] = email['assunto']
+    mensagem.set_content(email['html'], subtype='html')
+    return mensagem
+
+
+# ----- ENVIO -----
+
+def _sql_reservar(postgres):
+    """
+    UPDATE que reserva um lote de e-mails disponíveis (parâmetros: agora, agora, quantidade).
+    Também usado por verificar_indices.py.
+    """
+    ph = "%s" if postgres else "?"
+    return f"""
+        UPDATE emails SET estado = 'enviando', iniciado_em = {ph}, tentativas = tentativas + 1
+        WHERE id IN (
+            SELECT id FROM emails WHERE estado = 'pendente' AND disponivel_em <= {ph}
+            ORDER BY disponivel_em, id LIMIT {ph}{' FOR UPDATE SKIP LOCKED' if postgres else ''}
+        )
+        RETURNING id, destinatario, assunto, html, tentativas
+    """
+
+
+class EnvioEmails:
+    """
+    Esvazia a caixa de saída com uma thread.
+
+    - Reserva até `lote` e-mails por vez (UPDATE ... RETURNING, com FOR UPDATE SKIP LOCKED
+      no PostgreSQL, então vários workers podem enviar da mesma tabela) e os entrega ao
+      transporte de uma vez.
+    - No máximo `por_minuto` e-mails por minuto neste processo (balde de fichas: um lote
+      só reserva as fichas disponíveis).
+    - E-mails enviados são apagados. Em caso de erro o e-mail volta para a fila após
+      espera_base * 2^(tentativas - 1) segundos; depois de `max_tentativas` fica como
+      'falhou', com a mensagem de erro, até ser repetido (processar_emails.py --repetir-falhas).
+    - E-mails em 'enviando' há mais de `travado_apos` segundos voltam para a fila. Um
+      processo que morre entre enviar e apagar pode fazer um e-mail sair duas vezes.
+    """
+
+    def __init__(self, app, transporte, lote=20, por_minuto=120, intervalo=5.0,
+                 max_tentativas=6, espera_base=30, travado_apos=300):
+        self.app = app
+        self.transporte = transporte
+        self.lote = lote
+        self.por_minuto = por_minuto
+        self.intervalo = intervalo
+        self.max_tentativas = max_tentativas
+        self.espera_base = espera_base
+        self.travado_apos = travado_apos
+
+        self._fichas = float(lote)
+        self._fichas_em = time.monotonic()
+        self._lock = threading.Lock()
+        self._stats = {'enviados': 0, 'erros': 0, 'falhas_definitivas': 0}
+        self._acordar = threading.Event()
+        self._parar = threading.Event()
+        self._thread = threading.Thread(target=self._executar, name='envio-emails', daemon=True)
+        self._thread.start()
+
+    def acordar(self):
+        self._acordar.set()
+
+    def _executar(self):
+        while not self._parar.is_set():
+            self._recuperar_travados()
+            while not self._parar.is_set():
+                fichas = self._fichas_disponiveis()
+                if fichas < 1:
+                    # Espera a próxima ficha (ou o encerramento) e tenta de novo
+                    self._parar.wait(60 / self.por_minuto)
+                    continue
+                emails = self._reservar(min(self.lote, int(fichas)))
+                if not emails:
+                    break
+                self._fichas -= len(emails)
+                self._entregar(emails)
+            self._acordar.wait(self.intervalo)
+            self._acordar.clear()
+
+    def _fichas_disponiveis(self):
+        agora = time.monotonic()
+        self._fichas = min(float(self.lote), self._fichas + (agora - self._fichas_em) * self.por_minuto / 60)
+        self._fichas_em = agora
+        return self._fichas
+
+    def _reservar(self, quantidade):
+        """
+        Marca até `quantidade` e-mails disponíveis como 'enviando' e os retorna.
+        """
+        postgres = bool(self.app.config.get('DATABASE_URL'))
+        agora = time.time()
+        try:
+            with self.app.app_context():
+                db = get_db()
+                cur = db.cursor()
+                cur.execute(_sql_reservar(postgres), (agora, agora, quantidade))
+                emails = [dict(linha) for linha in cur.fetchall()]
+                db.commit()
+                return emails
+        except Exception:
+            log.exception("Erro ao reservar e-mails")
+            return []
+
+    def _recuperar_travados(self):
+        ph = "%s" if self.app.config.get('DATABASE_URL') else "?"
+        agora = time.time()
+        try:
+            with self.app.app_context():
+                db = get_db()
+                db.cursor().execute(
+                    f"""
+                    UPDATE emails SET estado = 'pendente', disponivel_em = {ph}
+                    WHERE estado = 'enviando' AND iniciado_em < {ph}
+                    """, (agora, agora - self.travado_apos)
+                )
+                db.commit()
+        except Exception:
+            log.exception("Erro ao recuperar e-mails travados")
+
+    def _entregar(self, emails):
+        try:
+            erros = self.transporte.enviar(emails)
+        except Exception as e:
+            erros = {email['id']: str(e) for email in emails}
+        ph = "%s" if self.app.config.get('DATABASE_URL') else "?"
+        enviados = [email['id'] for email in emails if email['id'] not in erros]
+        agora = time.time()
+        falhas = 0
+        try:
+            with self.app.app_context():
+                db = get_db()
+                cur = db.cursor()
+                if enviados:
+                    cur.execute(f"DELETE FROM emails WHERE id IN ({', '.join([ph] * len(enviados))})", enviados)
+                for email in emails:
+                    if email['id'] not in erros:
+                        continue
+                    erro = erros[email['id']]
+                    log.warning("Erro ao enviar o e-mail %s, tentativa %s: %s", email['id'], email['tentativas'], erro)
+                    if email['tentativas'] >= self.max_tentativas:
+                        cur.execute(f"UPDATE emails SET estado = 'falhou', erro = {ph} WHERE id = {ph}",
+                                    (erro, email['id']))
+                        falhas += 1
+                    else:
+                        espera = self.espera_base * 2 ** (email['tentativas'] - 1)
+                        cur.execute(
+                            f"UPDATE emails SET estado = 'pendente', disponivel_em = {ph}, erro = {ph} WHERE id = {ph}",
+                            (agora + espera, erro, email['id'])
+                        )
+                db.commit()
+        except Exception:
+            # Os e-mails ficam em 'enviando' e são recuperados depois
+            log.exception("Erro ao registrar o envio dos e-mails")
+            return
+        with self._lock:
+            self._stats['enviados'] += len(enviados)
+            self._stats['erros'] += len(erros) - falhas
+            self._stats['falhas_definitivas'] += falhas
+
+    def encerrar(self):
+        """
+        Para de reservar e-mails e espera o lote em andamento. Chamado na saída do processo.
+        """
+        self._parar.set()
+        self._acordar.set()
+        self._thread.join(timeout=self.intervalo + 30)
+
+    def estatisticas(self):
+        with self._lock:
+            stats = dict(self._stats)
+        stats['transporte'] = type(self.transporte).__name__
+        return stats
+
+
+def profundidade_caixa(db):
+    """
+    Quantidade de e-mails em cada estado e a idade (segundos) do pendente mais antigo.
+    """
+    cur = db.cursor()
+    cur.execute('SELECT estado, COUNT(*) AS total FROM emails GROUP BY estado')
+    caixa = {'pendente': 0, 'enviando': 0, 'falhou': 0}
+    caixa.update({r['estado']: r['total'] for r in cur.fetchall()})
+    cur.execute("SELECT MIN(criado_em) AS criado_em FROM emails WHERE estado = 'pendente'")
+    mais_antigo = cur.fetchone()['criado_em']
+    caixa['espera_max'] = round(time.time() - mais_antigo, 1) if mais_antigo else 0.0
+    return caixa
+
+
+def repetir_falhas(db, postgres):
+    """
+    Devolve à fila os e-mails que esgotaram as tentativas. Retorna quantos foram.
+    """
+    ph = "%s" if postgres else "?"
+    cur = db.cursor()
+    cur.execute(
+        f"UPDATE emails SET estado = 'pendente', tentativas = 0, disponivel_em = {ph} WHERE estado = 'falhou'",
+        (time.time(),)
+    )
+    db.commit()
+    return cur.rowcount
+
+
+def criar_envio(app):
+    """
+    EnvioEmails com o transporte e os limites da configuração.
+    """
+    transporte = TRANSPORTES[app.config['EMAIL_TRANSPORTE']](app.config)
+    return EnvioEmails(
+        app, transporte,
+        lote=app.config['EMAILS_LOTE'],
+        por_minuto=app.config['EMAILS_POR_MINUTO'],
+        intervalo=app.config['EMAILS_INTERVALO'],
+        max_tentativas=app.config['EMAILS_MAX_TENTATIVAS'],
+        espera_base=app.config['EMAILS_ESPERA_BASE'],
+        travado_apos=app.config['EMAILS_TRAVADO_APOS'],
+    )
+
+
+# Um envio por processo: após o fork, cada worker do gunicorn cria o seu
+_envio = None
+_envio_pid = None
+_envio_lock = threading.Lock()
+
+def obter_envio(app):
+    """
+    Retorna o envio de e-mails deste processo, criando-o no primeiro uso.
+    Com EMAILS_ENVIAR desligado o processo não envia e retorna None.
+    """
+    global _envio, _envio_pid
+    if not app.config['EMAILS_ENVIAR']:
+        return None
+    if _envio is None or _envio_pid != os.getpid():
+        with _envio_lock:
+            if _envio is None or _envio_pid != os.getpid():
+                _envio = criar_envio(app)
+                _envio_pid = os.getpid()
+                atexit.register(_envio.encerrar)
+    return _envio
+
+def acordar_envio():
+    """
+    Avisa o envio deste worker que há e-mails novos (use depois do commit).
+    """
+    envio = obter_envio(current_app._get_current_object())
+    if envio:
+        envio.acordar()
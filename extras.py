@@ -0,0 +1,54 @@
+# extras.py
+# O que está incluso no aluguel (água, luz, ...), guardado em imoveis.extras como máscara
+# de bits: filtrar por "internet e garagem" vira (extras & 36) = 36, sem LIKE sobre texto.
+
+# (chave usada na URL, texto do formulário e da página, bit). O bit gravado no banco
+# nunca muda: um extra novo entra no fim, com o próximo bit livre.
+EXTRAS = (
+    ('agua', 'Água', 1),
+    ('luz', 'Luz', 2),
+    ('internet', 'Internet', 4),
+    ('mobiliado', 'Mobiliado', 8),
+    ('gas', 'Gás', 16),
+    ('garagem', 'Garagem', 32),
+)
+
+_BIT_DA_CHAVE = {chave: bit for chave, _, bit in EXTRAS}
+_BIT_DO_TEXTO = {texto: bit for _, texto, bit in EXTRAS}
+
+
+def chave_valida(chave):
+    return chave in _BIT_DA_CHAVE
+
+
+def mascara_das_chaves(chaves):
+    """
+    Máscara das chaves da URL (?extras=agua&extras=luz).
+    """
+    mascara = 0
+    for chave in chaves:
+        mascara |= _BIT_DA_CHAVE[chave]
+    return mascara
+
+
+def mascara_dos_textos(textos):
+    """
+    Máscara dos textos do formulário ('Água', 'Luz', ...). Retorna (mascara, desconhecidos),
+    os textos que não são extras conhecidos.
+    """
+    mascara = 0
+    desconhecidos = []
+    for texto in textos:
+        texto = texto.strip()
+        if texto in _BIT_DO_TEXTO:
+            mascara |= _BIT_DO_TEXTO[texto]
+        elif texto:
+            desconhecidos.append(texto)
+    return mascara, desconhecidos
+
+
+def textos_da_mascara(mascara):
+    """
+    Textos dos extras marcados, na ordem do formulário.
+    """
+    return [texto for _, texto, bit in EXTRAS if (mascara or 0) & bit]
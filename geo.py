@@ -0,0 +1,123 @@
+# geo.py
+# Distâncias e caixas de coordenadas da busca por proximidade ("perto da minha universidade").
+# O índice espacial fica no banco (R*Tree no SQLite, GiST/earthdistance no PostgreSQL,
+# ver database.py); aqui só ficam as contas feitas em Python.
+
+import math
+
+RAIO_TERRA_KM = 6371.0088
+# Comprimento de um grau de latitude (e de longitude no equador)
+KM_POR_GRAU = math.pi * RAIO_TERRA_KM / 180
+
+# Pontos oferecidos no filtro "Perto de" da pesquisa: chave usada na URL -> (nome, latitude, longitude).
+# Coordenadas aproximadas da entrada de cada campus.
+PONTOS_REFERENCIA = {
+    'ufdpar': ('UFDPar - Campus Ministro Reis Velloso', -2.9052, -41.7746),
+    'uespi': ('UESPI - Campus Prof. Alexandre Alves de Oliveira', -2.9138, -41.7562),
+    'ifpi': ('IFPI - Campus Parnaíba', -2.9226, -41.7382),
+}
+
+
+def coordenadas_validas(latitude, longitude):
+    return (latitude is not None and longitude is not None
+            and -90 <= latitude <= 90 and -180 <= longitude <= 180)
+
+
+def distancia_km(lat1, lon1, lat2, lon2):
+    """
+    Distância em km pela fórmula de haversine. Registrada como função SQL no SQLite
+    (database.get_db); None se faltar alguma coordenada, como no SQL.
+    """
+    if None in (lat1, lon1, lat2, lon2):
+        return None
+    fi1, fi2 = math.radians(lat1), math.radians(lat2)
+    dfi = fi2 - fi1
+    dlambda = math.radians(lon2 - lon1)
+    a = math.sin(dfi / 2) ** 2 + math.cos(fi1) * math.cos(fi2) * math.sin(dlambda / 2) ** 2
+    return 2 * RAIO_TERRA_KM * math.asin(min(1.0, math.sqrt(a)))
+
+
+def caixa_do_raio(latitude, longitude, raio_km):
+    """
+    Menor caixa (sul, norte, oeste, leste) que contém o círculo: é o que o R*Tree
+    consegue filtrar; a distância exata é conferida depois, só nos imóveis dentro dela.
+    """
+    dlat = raio_km / KM_POR_GRAU
+    sul, norte = max(latitude - dlat, -90.0), min(latitude + dlat, 90.0)
+    # Perto dos polos o círculo pode dar a volta na Terra: aí todas as longitudes valem
+    cos_lat = math.cos(math.radians(max(abs(sul), abs(norte))))
+    if cos_lat <= 0 or raio_km / (KM_POR_GRAU * cos_lat) >= 180:
+        return sul, norte, -180.0, 180.0
+    dlon = raio_km / (KM_POR_GRAU * cos_lat)
+    return sul, norte, longitude - dlon, longitude + dlon
+
+
+def centro_da_caixa(sul, norte, oeste, leste):
+    """
+    Centro da caixa e o raio (km) do círculo que a contém, para ordenar os imóveis de
+    uma área do mapa pela distância ao centro e usar o índice do PostgreSQL (earth_box).
+    """
+    latitude, longitude = (sul + norte) / 2, (oeste + leste) / 2
+    raio = max(distancia_km(latitude, longitude, lat, lon)
+               for lat in (sul, norte) for lon in (oeste, leste))
+    return latitude, longitude, raio
+
+
+# ----- GEOHASH (índice em grade do mapa de imóveis) -----
+
+# imoveis.geohash guarda o geohash de 50 bits (10 caracteres) como inteiro: bits de
+# longitude e latitude intercalados, começando pela longitude. Os `n` primeiros bits
+# identificam a célula da grade que contém o imóvel, então agrupar por geohash >> (50 - n)
+# junta os imóveis da mesma célula, e cada célula é um intervalo contínuo de valores.
+BITS_GEOHASH = 50
+_BITS_EIXO = BITS_GEOHASH // 2
+
+
+def _intercalar(x, y):
+    codigo = 0
+    for bit in range(_BITS_EIXO - 1, -1, -1):
+        codigo = (codigo << 2) | (((x >> bit) & 1) << 1) | ((y >> bit) & 1)
+    return codigo
+
+
+def _indice(valor, minimo, maximo, bits):
+    """
+    Posição da coordenada numa grade de 2**bits divisões entre minimo e maximo.
+    """
+    return min(int((valor - minimo) / (maximo - minimo) * (1 << bits)), (1 << bits) - 1)
+
+
+def geohash(latitude, longitude):
+    """
+    Geohash inteiro do ponto, gravado em imoveis.geohash junto com latitude/longitude.
+    Retorna None se faltar alguma coordenada.
+    """
+    if latitude is None or longitude is None:
+        return None
+    return _intercalar(_indice(longitude, -180.0, 180.0, _BITS_EIXO),
+                       _indice(latitude, -90.0, 90.0, _BITS_EIXO))
+
+
+def faixas_geohash(sul, norte, oeste, leste, bits):
+    """
+    Intervalos [inicio, fim) de imoveis.geohash das células de `bits` bits (par) que
+    cobrem a caixa. Com células maiores que a caixa, são no máximo quatro.
+    """
+    eixo = bits // 2
+    livres = BITS_GEOHASH - bits
+    faixas = []
+    for x in range(_indice(oeste, -180.0, 180.0, eixo), _indice(leste, -180.0, 180.0, eixo) + 1):
+        for y in range(_indice(sul, -90.0, 90.0, eixo), _indice(norte, -90.0, 90.0, eixo) + 1):
+            celula = _intercalar(x << (_BITS_EIXO - eixo), y << (_BITS_EIXO - eixo)) >> livres
+            faixas.append((celula << livres, (celula + 1) << livres))
+    return sorted(faixas)
+
+
+def caixa_do_tile(z, x, y):
+    """
+    (sul, norte, oeste, leste) do tile x/y no zoom z (mesma numeração dos tiles do Leaflet/OSM).
+    """
+    n = 1 << z
+    def latitude(linha):
+        return math.degrees(math.atan(math.sinh(math.pi * (1 - 2 * linha / n))))
+    return latitude(y + 1), latitude(y), x / n * 360 - 180, (x + 1) / n * 360 - 180
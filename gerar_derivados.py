@@ -0,0 +1,41 @@
+# gerar_derivados.py
+# Gera os derivados (card, galeria e tela cheia em WebP e JPEG) das fotos já enviadas.
+#
+# Uso:
+#   python gerar_derivados.py           -> só as fotos que ainda não têm derivados
+#   python gerar_derivados.py --todas   -> refaz os derivados de todas as fotos
+import os
+import sys
+
+from app import app
+from imagens import PASTA_CONTEUDO, gerar_derivados, tem_derivados
+
+EXTENSOES = ('.jpg', '.jpeg', '.png', '.webp', '.avif', '.gif')
+
+
+def gerar_todos(refazer=False):
+    with app.app_context():
+        pasta = app.config['UPLOAD_FOLDER']
+        gerados = erros = 0
+        # Fotos antigas (na raiz da pasta) e as do armazenamento por conteúdo (cas/ab/...)
+        nomes = [n for n in os.listdir(pasta) if os.path.isfile(os.path.join(pasta, n))]
+        for raiz, _, arquivos in os.walk(os.path.join(pasta, PASTA_CONTEUDO)):
+            nomes += [os.path.relpath(os.path.join(raiz, n), pasta).replace(os.sep, '/') for n in arquivos]
+        for nome in sorted(nomes):
+            if not nome.lower().endswith(EXTENSOES):
+                continue
+            if not refazer and tem_derivados(nome):
+                continue
+            try:
+                gerar_derivados(nome)
+                gerados += 1
+                print(f"ok    {nome}")
+            except Exception as e:
+                erros += 1
+                print(f"ERRO  {nome}: {e}")
+        print(f"{gerados} foto(s) processada(s), {erros} erro(s).")
+        return erros
+
+
+if __name__ == '__main__':
+    sys.exit(1 if gerar_todos(refazer='--todas' in sys.argv) else 0)
@@ -0,0 +1,401 @@
+# imagens.py
+# Fotos dos imóveis: armazenamento por conteúdo (com deduplicação) e derivados
+# para card, galeria e tela cheia, em WebP e JPEG.
+
+import glob
+import hashlib
+import os
+import tempfile
+import threading
+from contextlib import contextmanager
+from datetime import datetime, timedelta, timezone
+
+from flask import current_app, url_for
+from werkzeug.utils import secure_filename
+from markupsafe import Markup, escape
+from PIL import Image, ImageOps
+
+from database import get_db
+from tarefas import tarefa
+from cache_paginas import invalidar_paginas
+
+try:
+    import fcntl  # Só em Unix: sem ele a trava do armazenamento vale só dentro do processo
+except ImportError:
+    fcntl = None
+
+# Largura máxima (px) de cada derivado. As fotos nunca são ampliadas.
+TAMANHOS = {
+    'card': 400,
+    'galeria': 1024,
+    'full': 1920,
+}
+FORMATOS = ('webp', 'jpg')
+QUALIDADE = {'webp': 80, 'jpg': 82}
+
+# Atributo `sizes` padrão para cada uso da foto nos templates
+SIZES = {
+    'card': '(max-width: 600px) 100vw, 400px',
+    'galeria': '(max-width: 1024px) 100vw, 1024px',
+    'thumb': '120px',
+}
+
+# Pasta dos derivados, dentro de UPLOAD_FOLDER
+PASTA_DERIVADOS = 'derivados'
+
+# Pasta das fotos endereçadas por conteúdo, dentro de UPLOAD_FOLDER.
+# Cada foto fica em cas/<2 primeiros hex do sha256>/<sha256>.<ext>, e esse caminho
+# relativo é o que vai para fotos.caminho. Como o nome muda quando o conteúdo muda,
+# essas URLs (e as dos seus derivados) podem ser guardadas em cache para sempre.
+PASTA_CONTEUDO = 'cas'
+EXTENSOES_IMAGEM = ('.jpg', '.jpeg', '.png', '.webp', '.avif', '.gif')
+CACHE_IMUTAVEL = 365 * 24 * 3600  # 1 ano, em segundos
+
+# Mostrada no lugar das fotos novas enquanto a fila gera os derivados (relativa a static/)
+FOTO_PROCESSANDO = 'img/processando.svg'
+
+# Fotos cujos derivados já vimos no disco (evita um stat por foto a cada página)
+_com_derivados = set()
+
+# Fotos de um imóvel e exclusão das fotos de vários (também usadas por verificar_indices.py)
+SQL_FOTOS_DO_IMOVEL = 'SELECT caminho FROM fotos WHERE imovel_id = {ph} ORDER BY posicao'
+SQL_EXCLUIR_FOTOS = 'DELETE FROM fotos WHERE imovel_id IN ({ids}) RETURNING caminho'
+
+# Trava do armazenamento por conteúdo dentro do processo (entre processos, flock)
+_trava_local = threading.Lock()
+
+
+def nome_derivado(nome, tamanho, formato):
+    """
+    Ex.: ('sala.jpg', 'card', 'webp') -> 'derivados/sala.jpg-card.webp'
+    A extensão original fica no nome para que sala.jpg e sala.png não colidam.
+    """
+    return f'{PASTA_DERIVADOS}/{nome}-{tamanho}.{formato}'
+
+
+def gerar_derivados(nome, pasta=None):
+    """
+    Gera todos os derivados da foto `nome` (já salva em UPLOAD_FOLDER).
+    A orientação do EXIF é aplicada nos pixels e os metadados não são copiados,
+    então os derivados saem sem EXIF (localização do celular, modelo da câmera etc.).
+    """
+    pasta = pasta or current_app.config['UPLOAD_FOLDER']
+    os.makedirs(os.path.dirname(os.path.join(pasta, nome_derivado(nome, 'full', 'jpg'))), exist_ok=True)
+
+    with Image.open(os.path.join(pasta, nome)) as original:
+        imagem = ImageOps.exif_transpose(original)
+        if imagem.mode not in ('RGB', 'RGBA'):
+            imagem = imagem.convert('RGBA' if 'transparency' in imagem.info else 'RGB')
+
+        for tamanho, largura in TAMANHOS.items():
+            copia = imagem.copy()
+            if copia.width > largura:
+                altura = round(copia.height * largura / copia.width)
+                copia = copia.resize((largura, altura), Image.LANCZOS)
+            for formato in FORMATOS:
+                destino = os.path.join(pasta, nome_derivado(nome, tamanho, formato))
+                if formato == 'jpg':
+                    # JPEG não tem transparência: aplica sobre fundo branco
+                    if copia.mode == 'RGBA':
+                        fundo = Image.new('RGB', copia.size, (255, 255, 255))
+                        fundo.paste(copia, mask=copia.getchannel('A'))
+                        copia_fmt = fundo
+                    else:
+                        copia_fmt = copia
+                    copia_fmt.save(destino, 'JPEG', quality=QUALIDADE['jpg'], optimize=True, progressive=True)
+                else:
+                    copia.save(destino, 'WEBP', quality=QUALIDADE['webp'], method=4)
+    _com_derivados.add(nome)
+
+
+@tarefa('derivados')
+def _tarefa_derivados(carga):
+    """
+    Tarefa enfileirada pelo cadastro de imóveis para cada foto ainda sem derivados. As
+    páginas em cache que mostravam "Processando foto..." são descartadas (o commit é
+    feito pela fila).
+    """
+    gerar_derivados(carga['imagem'])
+    invalidar_paginas(get_db(), 'imoveis', f"imagem:{carga['imagem']}")
+
+
+def tem_derivados(nome):
+    if nome in _com_derivados:
+        return True
+    pasta = current_app.config['UPLOAD_FOLDER']
+    caminho = os.path.join(pasta, nome_derivado(nome, 'full', 'jpg'))
+    if os.path.exists(caminho):
+        _com_derivados.add(nome)
+        return True
+    return False
+
+
+def _srcset(nome, formato):
+    return ', '.join(
+        f"{url_for('static', filename='img/imoveis/' + nome_derivado(nome, tamanho, formato))} {largura}w"
+        for tamanho, largura in TAMANHOS.items()
+    )
+
+
+def imagem_imovel(nome, uso='card', alt='Imagem do imóvel', **atributos):
+    """
+    Helper de template: <picture> com srcset WebP e JPEG de reserva para a foto.
+    Fotos novas aparecem como "em processamento" até a fila gerar os derivados; fotos
+    antigas ainda sem derivados (ex.: antes de rodar gerar_derivados.py) caem no original.
+    Atributos extras viram atributos do <img> (use classe='...' para class).
+    """
+    nome = nome or 'default.jpg'
+    if 'classe' in atributos:
+        atributos['class'] = atributos.pop('classe')
+    atributos.setdefault('loading', 'lazy')
+    extras = ''.join(f' {k}="{escape(v)}"' for k, v in atributos.items())
+
+    if not tem_derivados(nome):
+        if e_conteudo(nome):
+            src = url_for('static', filename=FOTO_PROCESSANDO)
+            return Markup(f'<img src="{escape(src)}" alt="Foto em processamento"{extras}>')
+        src = url_for('static', filename='img/imoveis/' + nome)
+        return Markup(f'<img src="{escape(src)}" alt="{escape(alt)}"{extras}>')
+
+    sizes = SIZES.get(uso, SIZES['card'])
+    padrao = 'card' if uso in ('card', 'thumb') else 'galeria'
+    src = url_for('static', filename='img/imoveis/' + nome_derivado(nome, padrao, 'jpg'))
+    return Markup(
+        f'<picture>'
+        f'<source type="image/webp" srcset="{escape(_srcset(nome, "webp"))}" sizes="{sizes}">'
+        f'<img src="{escape(src)}" srcset="{escape(_srcset(nome, "jpg"))}" sizes="{sizes}" '
+        f'alt="{escape(alt)}"{extras}>'
+        f'</picture>'
+    )
+
+
+def url_foto(nome, tamanho='card'):
+    """
+    URL do derivado JPEG da foto, para as respostas JSON. Segue as regras de
+    imagem_imovel para fotos ainda sem derivados.
+    """
+    nome = nome or 'default.jpg'
+    if not tem_derivados(nome):
+        if e_conteudo(nome):
+            return url_for('static', filename=FOTO_PROCESSANDO)
+        return url_for('static', filename='img/imoveis/' + nome)
+    return url_for('static', filename='img/imoveis/' + nome_derivado(nome, tamanho, 'jpg'))
+
+
+# ----- ARMAZENAMENTO POR CONTEÚDO -----
+
+def e_conteudo(nome):
+    """
+    True se `nome` é um caminho do armazenamento por conteúdo (cas/ab/<sha256>.ext).
+    """
+    return nome.startswith(PASTA_CONTEUDO + '/')
+
+def _caminho_conteudo(digest, extensao):
+    return f'{PASTA_CONTEUDO}/{digest[:2]}/{digest}{extensao}'
+
+def _extensao(nome_arquivo):
+    extensao = os.path.splitext(secure_filename(nome_arquivo or ''))[1].lower()
+    return extensao if extensao in EXTENSOES_IMAGEM else '.jpg'
+
+def receber_conteudo(origem, pasta=None):
+    """
+    Copia os bytes de `origem` (arquivo aberto em modo binário) para um temporário em
+    cas/, calculando o sha256 no caminho. Retorna (temporario, digest). Não precisa da
+    trava: o arquivo só ganha o nome final em publicar_conteudo.
+    """
+    pasta = pasta or current_app.config['UPLOAD_FOLDER']
+    os.makedirs(os.path.join(pasta, PASTA_CONTEUDO), exist_ok=True)
+    sha = hashlib.sha256()
+    fd, temporario = tempfile.mkstemp(dir=os.path.join(pasta, PASTA_CONTEUDO), suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'wb') as destino:
+            for bloco in iter(lambda: origem.read(64 * 1024), b''):
+                sha.update(bloco)
+                destino.write(bloco)
+    except BaseException:
+        os.remove(temporario)
+        raise
+    return temporario, sha.hexdigest()
+
+def publicar_conteudo(temporario, digest, nome_arquivo, pasta=None):
+    """
+    Dá ao temporário de receber_conteudo o nome derivado do sha256 (ou o descarta, se o
+    mesmo conteúdo já está gravado). Retorna (caminho relativo, True se o arquivo ainda
+    não existia). Quem vai registrar a referência deve chamá-la com trava_conteudo().
+    """
+    pasta = pasta or current_app.config['UPLOAD_FOLDER']
+    try:
+        # Mesmo conteúdo já gravado (mesmo que com outra extensão): reaproveita
+        existentes = glob.glob(os.path.join(pasta, PASTA_CONTEUDO, digest[:2], digest + '.*'))
+        if existentes:
+            return os.path.relpath(existentes[0], pasta).replace(os.sep, '/'), False
+        caminho = _caminho_conteudo(digest, _extensao(nome_arquivo))
+        final = os.path.join(pasta, caminho)
+        os.makedirs(os.path.dirname(final), exist_ok=True)
+        os.replace(temporario, final)  # Atômico: ninguém vê o arquivo pela metade
+        return caminho, True
+    finally:
+        if os.path.exists(temporario):
+            os.remove(temporario)
+
+def salvar_conteudo(origem, nome_arquivo, pasta=None):
+    """
+    Grava os bytes de `origem` com o nome derivado do seu sha256 (receber_conteudo +
+    publicar_conteudo). Retorna (caminho relativo, True se o arquivo ainda não existia).
+    Uploads idênticos caem no mesmo arquivo, que é gravado uma única vez.
+    """
+    temporario, digest = receber_conteudo(origem, pasta)
+    return publicar_conteudo(temporario, digest, nome_arquivo, pasta)
+
+@contextmanager
+def trava_conteudo(pasta=None):
+    """
+    Trava do armazenamento por conteúdo, entre threads e workers. Quem reaproveita um
+    arquivo já gravado a segura de publicar_conteudo até o commit que registra a
+    referência (a cópia e o hash do upload ficam de fora, em receber_conteudo);
+    remover_arquivos a segura enquanto confere no banco que a foto continua sem
+    referências e apaga.
+    Assim uma exclusão não apaga o arquivo que um upload simultâneo acabou de reaproveitar.
+    """
+    pasta = pasta or current_app.config['UPLOAD_FOLDER']
+    os.makedirs(os.path.join(pasta, PASTA_CONTEUDO), exist_ok=True)
+    with _trava_local, open(os.path.join(pasta, PASTA_CONTEUDO, '.trava'), 'a') as trava:
+        if fcntl:
+            fcntl.flock(trava, fcntl.LOCK_EX)
+        yield
+
+def receber_upload(arquivo):
+    """
+    Primeira parte de salvar um upload (werkzeug FileStorage): cópia e hash, fora da
+    trava. Retorna (temporario, digest, nome do arquivo) para publicar_conteudo.
+    """
+    return (*receber_conteudo(arquivo.stream), arquivo.filename)
+
+def descartar_recebidos(recebidos):
+    """
+    Apaga os temporários de receber_upload que não chegaram a ser publicados.
+    """
+    for temporario, _, _ in recebidos:
+        if os.path.exists(temporario):
+            os.remove(temporario)
+
+def registrar_imagens(db, nomes):
+    """
+    Soma uma referência para cada foto do armazenamento por conteúdo em `nomes`.
+    Deve rodar na mesma transação do INSERT/UPDATE do imóvel.
+    """
+    ph = "%s" if current_app.config.get('DATABASE_URL') else "?"
+    cur = db.cursor()
+    for nome in nomes:
+        if e_conteudo(nome):
+            cur.execute(
+                f"""
+                INSERT INTO imagens (caminho, referencias) VALUES ({ph}, 1)
+                ON CONFLICT (caminho) DO UPDATE SET referencias = imagens.referencias + 1
+                """, (nome,)
+            )
+
+def liberar_imagens(db, nomes):
+    """
+    Tira uma referência de cada foto de `nomes` (fotos dos imóveis excluídos).
+    Retorna as fotos que ficaram sem nenhum imóvel: remova-as com remover_arquivos()
+    depois do commit.
+    """
+    ph = "%s" if current_app.config.get('DATABASE_URL') else "?"
+    cur = db.cursor()
+    nomes = [n for n in nomes if e_conteudo(n)]
+    orfas = []
+    for nome in nomes:
+        cur.execute(f'UPDATE imagens SET referencias = referencias - 1 WHERE caminho = {ph}', (nome,))
+    for nome in dict.fromkeys(nomes):
+        cur.execute(f'DELETE FROM imagens WHERE caminho = {ph} AND referencias <= 0', (nome,))
+        if cur.rowcount > 0:
+            orfas.append(nome)
+    return orfas
+
+def adicionar_fotos(db, imovel_id, nomes):
+    """
+    Grava as fotos do imóvel na tabela fotos, na ordem da galeria, e soma as referências.
+    Deve rodar na mesma transação do INSERT do imóvel.
+    """
+    ph = "%s" if current_app.config.get('DATABASE_URL') else "?"
+    db.cursor().executemany(
+        f'INSERT INTO fotos (imovel_id, posicao, caminho) VALUES ({ph}, {ph}, {ph})',
+        [(imovel_id, posicao, nome) for posicao, nome in enumerate(nomes)]
+    )
+    registrar_imagens(db, nomes)
+
+def excluir_fotos(db, imovel_ids):
+    """
+    Apaga as fotos dos imóveis excluídos e tira as referências. Retorna as fotos que
+    ficaram sem nenhum imóvel (ver liberar_imagens).
+    """
+    if not imovel_ids:
+        return []
+    ph = "%s" if current_app.config.get('DATABASE_URL') else "?"
+    cur = db.cursor()
+    cur.execute(SQL_EXCLUIR_FOTOS.format(ids=', '.join([ph] * len(imovel_ids))), list(imovel_ids))
+    return liberar_imagens(db, [r[0] for r in cur.fetchall()])
+
+def fotos_do_imovel(db, imovel_id):
+    """
+    Fotos do imóvel na ordem da galeria (['default.jpg'] se não houver nenhuma).
+    """
+    ph = "%s" if current_app.config.get('DATABASE_URL') else "?"
+    cur = db.cursor()
+    cur.execute(SQL_FOTOS_DO_IMOVEL.format(ph=ph), (imovel_id,))
+    return [r[0] for r in cur.fetchall()] or ['default.jpg']
+
+def remover_arquivos(nomes, pasta=None):
+    """
+    Apaga do disco as fotos e seus derivados. Fotos do armazenamento por conteúdo que
+    voltaram a ter referência (um upload simultâneo as reaproveitou) ficam.
+    """
+    pasta = pasta or current_app.config['UPLOAD_FOLDER']
+    conteudo = [n for n in nomes if e_conteudo(n)]
+    if not conteudo:
+        _apagar_arquivos(nomes, pasta)
+        return
+    with trava_conteudo(pasta):
+        ph = "%s" if current_app.config.get('DATABASE_URL') else "?"
+        cur = get_db().cursor()
+        cur.execute(f"SELECT caminho FROM imagens WHERE caminho IN ({', '.join([ph] * len(conteudo))})",
+                    conteudo)
+        em_uso = {r[0] for r in cur.fetchall()}
+        _apagar_arquivos([n for n in nomes if n not in em_uso], pasta)
+
+def _apagar_arquivos(nomes, pasta):
+    for nome in nomes:
+        caminhos = [nome] + [nome_derivado(nome, t, f) for t in TAMANHOS for f in FORMATOS]
+        for caminho in caminhos:
+            try:
+                os.remove(os.path.join(pasta, caminho))
+            except FileNotFoundError:
+                pass
+        _com_derivados.discard(nome)
+
+def cache_imutavel(response, filename):
+    """
+    Cabeçalhos de cache "para sempre" para as fotos por conteúdo e seus derivados.
+    """
+    prefixo = 'img/imoveis/'
+    if not filename.startswith(prefixo):
+        return response
+    nome = filename[len(prefixo):]
+    if nome.startswith(PASTA_DERIVADOS + '/'):
+        nome = nome[len(PASTA_DERIVADOS) + 1:]
+    if e_conteudo(nome):
+        marcar_imutavel(response)
+    return response
+
+def marcar_imutavel(response):
+    """
+    Cache de 1 ano, sem revalidação. Só para URLs que mudam quando o conteúdo muda.
+    """
+    if response.status_code in (200, 304):
+        response.cache_control.public = True
+        response.cache_control.max_age = CACHE_IMUTAVEL
+        response.cache_control.immutable = True
+        response.cache_control.no_cache = None
+        response.expires = datetime.now(timezone.utc) + timedelta(seconds=CACHE_IMUTAVEL)
+    return response
@@ -0,0 +1,338 @@
+# imoveis_em_lote.py
+# Importação e exportação de imóveis em lote (planilhas das imobiliárias parceiras), em CSV
+# ou JSON Lines. Os arquivos são lidos e escritos aos poucos: a memória usada não cresce
+# com o tamanho do arquivo.
+#
+# Uso:
+#   python imoveis_em_lote.py importar imoveis.csv --usuario anunciante@exemplo.com
+#   python imoveis_em_lote.py importar imoveis.jsonl                 -> dono pela coluna usuario_email
+#   python imoveis_em_lote.py importar imoveis.csv --usuario ... --rejeitados rejeitados.jsonl
+#   python imoveis_em_lote.py exportar imoveis.csv [--usuario anunciante@exemplo.com]
+#   python imoveis_em_lote.py exportar imoveis.jsonl                 -> '-' escreve no terminal (JSON Lines)
+#
+# Colunas (as mesmas do formulário de cadastro): endereco, bairro, numero, cep, complemento,
+# valor, quartos, banheiros, inclusos, outros, descricao, tipo, latitude, longitude, fotos,
+# usuario_email. Em CSV, inclusos ('Água, Luz') e fotos vêm separados por vírgula; o
+# separador das colunas (',' ou ';') é detectado. valor aceita vírgula decimal, como no formulário.
+import argparse
+import csv
+import io
+import json
+import os
+import sys
+import time
+
+from app import app
+from database import get_db
+from cache_paginas import invalidar_paginas
+from extras import textos_da_mascara
+from imagens import registrar_imagens, trava_conteudo
+from properties import COLUNAS_CADASTRO, converter_imovel
+
+# Linhas gravadas por transação
+LOTE = 500
+COLUNAS_EXPORTACAO = ('id', 'usuario_email', 'tipo', 'endereco', 'numero', 'bairro', 'cep', 'complemento',
+                      'valor', 'quartos', 'banheiros', 'inclusos', 'outros', 'descricao',
+                      'latitude', 'longitude', 'ativo', 'fotos')
+
+
+def _formato(caminho, formato):
+    if formato:
+        return formato
+    return 'jsonl' if caminho == '-' or caminho.endswith(('.jsonl', '.ndjson', '.json')) else 'csv'
+
+
+def _lista(valor):
+    """
+    Lista de textos de uma célula: já lista (JSON) ou separada por vírgula (CSV).
+    """
+    if isinstance(valor, list):
+        return [str(v).strip() for v in valor if str(v).strip()]
+    return [v.strip() for v in (valor or '').split(',') if v.strip()]
+
+
+# ----- IMPORTAÇÃO -----
+
+def ler_linhas(arquivo, formato):
+    """
+    Gera (número da linha, dict) do arquivo, sem carregá-lo inteiro.
+    """
+    if formato == 'jsonl':
+        for numero, texto in enumerate(arquivo, start=1):
+            if not texto.strip():
+                continue
+            try:
+                dados = json.loads(texto)
+            except ValueError as e:
+                yield numero, e
+                continue
+            yield numero, dados if isinstance(dados, dict) else ValueError('a linha não é um objeto JSON')
+        return
+    amostra = arquivo.read(4096)
+    try:
+        dialeto = csv.Sniffer().sniff(amostra, delimiters=',;\t')
+    except csv.Error:
+        dialeto = csv.excel
+    leitor = csv.DictReader(_juntar(amostra, arquivo), dialect=dialeto)
+    for dados in leitor:
+        # Linha 1 é o cabeçalho
+        yield leitor.line_num, {k.strip(): v for k, v in dados.items() if k}
+
+
+def _juntar(amostra, arquivo):
+    """
+    Devolve ao leitor CSV o trecho lido para detectar o separador, seguido do resto.
+    """
+    yield from io.StringIO(amostra)
+    yield from arquivo
+
+
+class Donos:
+    """
+    usuario_email -> id dos anunciantes, consultado uma vez por e-mail.
+    """
+
+    def __init__(self, db, ph):
+        self.db = db
+        self.ph = ph
+        self._ids = {}
+
+    def id(self, email):
+        if email not in self._ids:
+            cur = self.db.cursor()
+            cur.execute(
+                f"SELECT id FROM usuarios WHERE email = {self.ph} AND tipo_usuario = 'anunciante'", (email,))
+            linha = cur.fetchone()
+            self._ids[email] = linha[0] if linha else None
+        return self._ids[email]
+
+
+def _fotos_validas(nomes):
+    """
+    Só caminhos de fotos que já estão em UPLOAD_FOLDER (ex.: vindos de uma exportação).
+    """
+    pasta = os.path.realpath(app.config['UPLOAD_FOLDER'])
+    for nome in nomes:
+        caminho = os.path.realpath(os.path.join(pasta, nome))
+        if not caminho.startswith(pasta + os.sep) or not os.path.isfile(caminho):
+            raise ValueError(f'foto não encontrada em {app.config["UPLOAD_FOLDER"]}: {nome!r}')
+    return nomes
+
+
+def _reservar_ids(cur, quantidade, postgres):
+    """
+    Ids dos próximos `quantidade` imóveis. Com os ids em mãos as fotos podem ser gravadas
+    junto, sem um INSERT ... RETURNING por linha.
+    """
+    if postgres:
+        cur.execute("SELECT nextval(pg_get_serial_sequence('imoveis', 'id')) FROM generate_series(1, %s)",
+                    (quantidade,))
+        return [r[0] for r in cur.fetchall()]
+    # No SQLite o lote roda com BEGIN IMMEDIATE: ninguém mais insere até o commit
+    cur.execute("""
+        SELECT MAX(ultimo) FROM (
+            SELECT seq AS ultimo FROM sqlite_sequence WHERE name = 'imoveis'
+            UNION ALL SELECT MAX(id) FROM imoveis
+        )
+    """)
+    ultimo = cur.fetchone()[0] or 0
+    return list(range(ultimo + 1, ultimo + 1 + quantidade))
+
+
+def _campo_csv(valor):
+    """
+    Um campo do CSV do COPY: NULL é vazio sem aspas, texto vai sempre entre aspas
+    (assim "" continua sendo texto vazio) e números vão como estão.
+    """
+    if valor is None:
+        return ''
+    if isinstance(valor, str):
+        return '"' + valor.replace('"', '""') + '"'
+    return str(valor)
+
+
+def _copiar(cur, tabela, colunas, linhas):
+    """
+    COPY ... FROM STDIN (PostgreSQL) de um lote. Em CSV, vazio sem aspas é NULL e "" é texto vazio.
+    """
+    # O csv.writer não tem um modo que distinga None de '' (QUOTE_NONNUMERIC põe aspas nos dois)
+    buffer = io.StringIO(''.join(','.join(map(_campo_csv, linha)) + '\n' for linha in linhas))
+    cur.copy_expert(f"COPY {tabela} ({', '.join(colunas)}) FROM STDIN WITH (FORMAT csv)", buffer)
+
+
+def gravar_lote(db, postgres, lote):
+    """
+    Grava um lote de (valores de COLUNAS_CADASTRO, usuario_id, fotos) numa transação:
+    executemany no SQLite, COPY FROM STDIN no PostgreSQL.
+    Roda com a trava do armazenamento por conteúdo (imagens.py): as fotos conferidas
+    aqui não são apagadas por uma exclusão simultânea antes do commit.
+    """
+    with trava_conteudo():
+        _gravar_lote(db, postgres, lote)
+
+
+def _gravar_lote(db, postgres, lote):
+    ph = '%s' if postgres else '?'
+    cur = db.cursor()
+    if not postgres:
+        cur.execute('BEGIN IMMEDIATE')
+    ids = _reservar_ids(cur, len(lote), postgres)
+    colunas = ('id', *COLUNAS_CADASTRO, 'usuario_id')
+    imoveis = [(id_, *valores, usuario_id) for id_, (valores, usuario_id, _) in zip(ids, lote)]
+    fotos = [(id_, posicao, nome) for id_, (_, _, nomes) in zip(ids, lote) for posicao, nome in enumerate(nomes)]
+    # Conferidas na leitura da linha, mas podem ter sido apagadas desde então
+    sumidas = {nome for _, _, nome in fotos
+               if not os.path.isfile(os.path.join(app.config['UPLOAD_FOLDER'], nome))}
+    if sumidas:
+        print(f'{len(sumidas)} foto(s) apagada(s) durante a importação ficaram de fora', file=sys.stderr)
+        fotos = [f for f in fotos if f[2] not in sumidas]
+    if postgres:
+        _copiar(cur, 'imoveis', colunas, imoveis)
+        if fotos:
+            _copiar(cur, 'fotos', ('imovel_id', 'posicao', 'caminho'), fotos)
+    else:
+        cur.executemany(
+            f"INSERT INTO imoveis ({', '.join(colunas)}) VALUES ({', '.join([ph] * len(colunas))})", imoveis)
+        cur.executemany(f'INSERT INTO fotos (imovel_id, posicao, caminho) VALUES ({ph}, {ph}, {ph})', fotos)
+    registrar_imagens(db, [nome for _, _, nome in fotos])
+    invalidar_paginas(db, 'imoveis')
+    db.commit()
+
+
+def importar(caminho, formato, email_padrao, caminho_rejeitados):
+    postgres = bool(app.config.get('DATABASE_URL'))
+    ph = '%s' if postgres else '?'
+    importados = rejeitados = 0
+    inicio = time.monotonic()
+    saida_rejeitados = open(caminho_rejeitados, 'w', encoding='utf-8') if caminho_rejeitados else None
+    entrada = sys.stdin if caminho == '-' else open(caminho, encoding='utf-8-sig', newline='')
+    try:
+        with app.app_context():
+            db = get_db()
+            if not postgres:
+                db.isolation_level = None  # Transações controladas aqui (BEGIN IMMEDIATE ... COMMIT)
+            donos = Donos(db, ph)
+            if email_padrao and donos.id(email_padrao) is None:
+                raise SystemExit(f'Anunciante não encontrado: {email_padrao}')
+
+            def rejeitar(numero, dados, erro):
+                nonlocal rejeitados
+                rejeitados += 1
+                if saida_rejeitados:
+                    saida_rejeitados.write(json.dumps(
+                        {'linha': numero, 'erro': str(erro), 'dados': dados if isinstance(dados, dict) else None},
+                        ensure_ascii=False) + '\n')
+                elif rejeitados <= 20:
+                    print(f'Linha {numero} rejeitada: {erro}', file=sys.stderr)
+
+            lote = []
+            for numero, dados in ler_linhas(entrada, formato):
+                if isinstance(dados, Exception):
+                    rejeitar(numero, None, dados)
+                    continue
+                try:
+                    email = email_padrao or (dados.get('usuario_email') or '').strip()
+                    usuario_id = donos.id(email) if email else None
+                    if usuario_id is None:
+                        raise ValueError(f'anunciante não encontrado: {email!r}' if email else 'sem usuario_email')
+                    valores = converter_imovel(dados, _lista(dados.get('inclusos')))
+                    fotos = _fotos_validas(_lista(dados.get('fotos')))
+                except ValueError as e:
+                    rejeitar(numero, dados, e)
+                    continue
+                lote.append((valores, usuario_id, fotos))
+                if len(lote) >= LOTE:
+                    gravar_lote(db, postgres, lote)
+                    importados += len(lote)
+                    lote = []
+                    print(f'{importados} imóveis importados...', file=sys.stderr)
+            if lote:
+                gravar_lote(db, postgres, lote)
+                importados += len(lote)
+    finally:
+        if entrada is not sys.stdin:
+            entrada.close()
+        if saida_rejeitados:
+            saida_rejeitados.close()
+
+    print(f'{importados} imóvel(is) importado(s) e {rejeitados} linha(s) rejeitada(s) '
+          f'em {time.monotonic() - inicio:.1f} s.')
+    if rejeitados and not caminho_rejeitados and rejeitados > 20:
+        print('Use --rejeitados ARQUIVO para ver todas as linhas rejeitadas.')
+    return rejeitados
+
+
+# ----- EXPORTAÇÃO -----
+
+def _consulta_exportacao(postgres, email):
+    ph = '%s' if postgres else '?'
+    if postgres:
+        fotos = "(SELECT string_agg(caminho, ',' ORDER BY posicao) FROM fotos WHERE fotos.imovel_id = imoveis.id)"
+    else:
+        fotos = ("(SELECT group_concat(caminho, ',') FROM "
+                 "(SELECT caminho FROM fotos WHERE fotos.imovel_id = imoveis.id ORDER BY posicao))")
+    sql = f"""
+        SELECT imoveis.id, usuarios.email AS usuario_email, imoveis.tipo, imoveis.endereco, imoveis.numero,
+               imoveis.bairro, imoveis.cep, imoveis.complemento, imoveis.valor, imoveis.quartos,
+               imoveis.banheiros, imoveis.extras, imoveis.outros, imoveis.descricao,
+               imoveis.latitude, imoveis.longitude, imoveis.ativo, {fotos} AS fotos
+        FROM imoveis LEFT JOIN usuarios ON usuarios.id = imoveis.usuario_id
+        {f'WHERE usuarios.email = {ph}' if email else ''}
+        ORDER BY imoveis.id
+    """
+    return sql, (email,) if email else ()
+
+
+def exportar(caminho, formato, email):
+    postgres = bool(app.config.get('DATABASE_URL'))
+    total = 0
+    saida = sys.stdout if caminho == '-' else open(caminho, 'w', encoding='utf-8', newline='')
+    try:
+        with app.app_context():
+            db = get_db()
+            sql, params = _consulta_exportacao(postgres, email)
+            if postgres:
+                # Cursor no servidor: as linhas chegam em blocos de itersize, não todas de uma vez
+                cur = db.cursor(name='exportar_imoveis')
+                cur.itersize = 1000
+            else:
+                cur = db.cursor()  # O SQLite já devolve as linhas conforme o cursor avança
+            cur.execute(sql, params)
+            escritor = None
+            if formato == 'csv':
+                escritor = csv.writer(saida)
+                escritor.writerow(COLUNAS_EXPORTACAO)
+            for r in cur:
+                linha = {
+                    **{c: r[c] for c in COLUNAS_EXPORTACAO if c not in ('inclusos', 'fotos')},
+                    'inclusos': textos_da_mascara(r['extras']),
+                    'fotos': (r['fotos'] or '').split(',') if r['fotos'] else [],
+                }
+                if escritor:
+                    escritor.writerow([', '.join(linha[c]) if c in ('inclusos', 'fotos') else linha[c]
+                                       for c in COLUNAS_EXPORTACAO])
+                else:
+                    saida.write(json.dumps(linha, ensure_ascii=False) + '\n')
+                total += 1
+            cur.close()
+            db.commit()
+    finally:
+        if saida is not sys.stdout:
+            saida.close()
+    print(f'{total} imóvel(is) exportado(s).', file=sys.stderr)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Importação e exportação de imóveis em lote.')
+    parser.add_argument('acao', choices=('importar', 'exportar'))
+    parser.add_argument('arquivo', help="CSV ou JSON Lines ('-' para entrada/saída padrão)")
+    parser.add_argument('--formato', choices=('csv', 'jsonl'), help='padrão: pela extensão do arquivo')
+    parser.add_argument('--usuario', metavar='EMAIL',
+                        help='importar: dono de todos os imóveis; exportar: só os imóveis dele')
+    parser.add_argument('--rejeitados', metavar='ARQUIVO', help='importar: grava as linhas rejeitadas (JSON Lines)')
+    args = parser.parse_args()
+
+    formato = _formato(args.arquivo, args.formato)
+    if args.acao == 'importar':
+        sys.exit(1 if importar(args.arquivo, formato, args.usuario, args.rejeitados) else 0)
+    exportar(args.arquivo, formato, args.usuario)
@@ -0,0 +1,213 @@
+# logs.py
+# Logs estruturados (uma linha JSON por mensagem) sem I/O nas threads das requisições:
+# o handler do logger raiz só põe o registro numa fila em memória, e uma thread
+# (QueueListener) de cada processo formata e escreve.
+#
+# Cada linha traz, quando há requisição: request_id (o X-Request-ID recebido ou um novo),
+# rota (endpoint), método, caminho e os ms decorridos desde o início da requisição.
+# Mensagens DEBUG são amostradas (LOGS_DEBUG_AMOSTRA) e limitadas por segundo para
+# cada texto de mensagem (LOGS_DEBUG_POR_SEGUNDO).
+
+import atexit
+import copy
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import random
+import sys
+import threading
+import time
+import uuid
+from datetime import datetime, timezone
+
+from flask import g, has_request_context, request
+
+_FORMATADOR = logging.Formatter()
+
+# Atributos que todo LogRecord tem: o que sobrar veio de extra={...} e vai para o JSON
+_ATRIBUTOS_PADRAO = frozenset(vars(logging.LogRecord('', 0, '', 0, '', (), None))) | {'message', 'excecao'}
+
+
+def novo_request_id(recebido=None):
+    """
+    Usa o X-Request-ID do proxy se for razoável (até 64 caracteres, sem espaços);
+    senão gera um novo.
+    """
+    if recebido and len(recebido) <= 64 and recebido.isprintable() and ' ' not in recebido:
+        return recebido
+    return uuid.uuid4().hex[:16]
+
+
+def caminho_para_log():
+    """
+    Caminho da requisição atual, com tokens da URL (/resetar_senha/<token>) mascarados.
+    """
+    token = (request.view_args or {}).get('token')
+    return request.path.replace(token, '***') if token else request.path
+
+
+class FormatoJSON(logging.Formatter):
+    """
+    Uma linha JSON por registro. Roda na thread do QueueListener.
+    """
+
+    def format(self, record):
+        linha = {
+            'ts': datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec='milliseconds'),
+            'nivel': record.levelname,
+            'logger': record.name,
+            'msg': record.getMessage(),
+            'pid': record.process,
+        }
+        for chave, valor in vars(record).items():
+            if chave not in _ATRIBUTOS_PADRAO:
+                linha[chave] = valor
+        excecao = getattr(record, 'excecao', None) or (record.exc_info and self.formatException(record.exc_info))
+        if excecao:
+            linha['excecao'] = excecao
+        return json.dumps(linha, ensure_ascii=False, default=str)
+
+
+class FiltroContexto(logging.Filter):
+    """
+    Copia os dados da requisição para o registro. Precisa rodar na thread da requisição,
+    antes de o registro ir para a fila.
+    """
+
+    def filter(self, record):
+        if has_request_context():
+            record.request_id = g.get('request_id')
+            record.rota = request.endpoint
+            record.metodo = request.method
+            record.caminho = caminho_para_log()
+            inicio = g.get('inicio_requisicao')
+            if inicio is not None and not hasattr(record, 'duracao_ms'):
+                record.duracao_ms = round((time.perf_counter() - inicio) * 1000, 2)
+        return True
+
+
+class FiltroDebug(logging.Filter):
+    """
+    Amostragem e limite por segundo das mensagens DEBUG (as dos outros níveis sempre passam).
+    O limite vale por texto de mensagem (o formato, antes dos argumentos); a primeira
+    mensagem que passa depois de um corte informa quantas foram suprimidas.
+    """
+
+    def __init__(self, amostra=1.0, por_segundo=10):
+        super().__init__()
+        self.amostra = amostra
+        self.por_segundo = por_segundo
+        self._janelas = {}  # (logger, formato) -> [início da janela, mensagens na janela, suprimidas]
+        self._lock = threading.Lock()
+
+    def filter(self, record):
+        if record.levelno > logging.DEBUG:
+            return True
+        if self.amostra < 1.0 and random.random() >= self.amostra:
+            return False
+        chave = (record.name, record.msg if isinstance(record.msg, str) else type(record.msg).__name__)
+        agora = time.monotonic()
+        with self._lock:
+            janela = self._janelas.get(chave)
+            if janela is None:
+                if len(self._janelas) >= 1000:
+                    self._janelas.clear()  # Mensagens montadas com f-string: cada texto é uma chave
+                janela = self._janelas[chave] = [agora, 0, 0]
+            elif agora - janela[0] >= 1.0:
+                if janela[2]:
+                    record.suprimidas = janela[2]
+                janela[:] = [agora, 0, 0]
+            if janela[1] >= self.por_segundo:
+                janela[2] += 1
+                return False
+            janela[1] += 1
+        return True
+
+
+class FilaLogs(logging.handlers.QueueHandler):
+    """
+    QueueHandler que nunca bloqueia: com a fila cheia o registro é descartado (e contado).
+    Após o fork (worker do gunicorn), a fila e a thread de escrita são recriadas no filho.
+    """
+
+    def __init__(self, destino, tamanho_fila=10000):
+        super().__init__(queue.Queue(tamanho_fila))
+        self.destino = destino
+        self.tamanho_fila = tamanho_fila
+        self.descartados = 0
+        self._ouvinte = None
+        self._pid = None
+        self._lock = threading.Lock()
+
+    def _iniciar(self):
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            # A fila herdada do processo pai pode ter registros dele e locks em qualquer estado
+            self.queue = queue.Queue(self.tamanho_fila)
+            self._ouvinte = logging.handlers.QueueListener(self.queue, self.destino, respect_handler_level=True)
+            self._ouvinte.start()
+            self._pid = os.getpid()
+            atexit.register(self.parar)
+
+    def prepare(self, record):
+        """
+        Junta mensagem e argumentos e transforma a exceção em texto ainda nesta thread:
+        o registro que vai para a fila não guarda referências aos objetos da requisição.
+        """
+        record = copy.copy(record)
+        record.msg = record.message = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.excecao = _FORMATADOR.formatException(record.exc_info)
+        record.exc_info = record.exc_text = None
+        return record
+
+    def enqueue(self, record):
+        if self._pid != os.getpid():
+            self._iniciar()
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.descartados += 1
+
+    def parar(self):
+        """
+        Escreve o que ainda está na fila e encerra a thread. Chamado na saída do processo.
+        """
+        if self._ouvinte is not None and self._pid == os.getpid():
+            self._ouvinte.stop()
+            self._ouvinte = None
+
+
+_fila = None
+
+def configurar_logs(app):
+    """
+    Instala a fila de logs no logger raiz (uma vez por processo; chamado em app.py).
+    """
+    global _fila
+    if _fila is not None:
+        return _fila
+    config = app.config
+    saida = config['LOGS_SAIDA']
+    if saida in ('stdout', 'stderr'):
+        destino = logging.StreamHandler(sys.stdout if saida == 'stdout' else sys.stderr)
+    else:
+        os.makedirs(os.path.dirname(saida) or '.', exist_ok=True)
+        destino = logging.handlers.WatchedFileHandler(saida, encoding='utf-8')  # Convive com o logrotate
+    destino.setFormatter(FormatoJSON())
+
+    _fila = FilaLogs(destino, tamanho_fila=config['LOGS_FILA'])
+    _fila.addFilter(FiltroDebug(config['LOGS_DEBUG_AMOSTRA'], config['LOGS_DEBUG_POR_SEGUNDO']))
+    _fila.addFilter(FiltroContexto())
+
+    raiz = logging.getLogger()
+    for handler in list(raiz.handlers):
+        raiz.removeHandler(handler)
+    raiz.addHandler(_fila)
+    raiz.setLevel(config['LOGS_NIVEL'])
+    app.logger.handlers.clear()  # O logger do Flask passa a usar a fila pelo logger raiz
+    return _fila
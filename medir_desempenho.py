@@ -0,0 +1,448 @@
+# medir_desempenho.py
+# Teste de carga: cria um banco com dados gerados (SQLite temporário ou um PostgreSQL local
+# vazio), sobe o app no gunicorn e dispara clientes simultâneos contra as rotas reais.
+# O resultado (vazão e latências p50/p95/p99 por rota) sai em JSON, para comparar commits.
+#
+# Uso:
+#   python medir_desempenho.py                           -> SQLite temporário, resultado no terminal
+#   python medir_desempenho.py --saida base.json         -> grava o resultado em JSON
+#   python medir_desempenho.py --comparar base.json      -> mostra a diferença para um resultado anterior
+#   python medir_desempenho.py --postgres postgresql://localhost/republic_carga
+#                                                        -> PostgreSQL local (o banco precisa estar vazio)
+#   python medir_desempenho.py --usuarios 2000 --imoveis 10 --clientes 32 --duracao 60 --sem-cache
+import argparse
+import http.client
+import json
+import logging
+import math
+import os
+import platform
+import random
+import shutil
+import signal
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime, timezone
+from urllib.parse import urlencode
+
+PASTA_APP = os.path.dirname(os.path.abspath(__file__))
+
+# Senha de todos os usuários gerados
+SENHA = 'carga123'
+ADMIN_EMAIL = 'admin@carga.exemplo.com'
+
+# Rotas exercitadas e o peso de cada uma na mistura (--rotas muda)
+PESOS_PADRAO = {
+    'pesquisa': 45,
+    'detalhes_imovel': 25,
+    'track_click': 15,
+    'login': 10,
+    'admin': 5,
+}
+# Status esperado de cada rota; qualquer outro conta como erro
+STATUS_ESPERADO = {'login': 302}
+
+RUAS = ('Rua Tabajara', 'Av. São Sebastião', 'Rua Almirante Gervásio Sampaio', 'Rua Riachuelo',
+        'Av. Pinheiro Machado', 'Rua Caramuru', 'Rua Monsenhor Joaquim Lopes', 'Av. Nossa Senhora de Fátima')
+BAIRROS = ('Centro', 'Piauí', 'Fátima', 'São Benedito', 'Reis Velloso', 'Nova Parnaíba', 'Pindorama', 'Dirceu')
+TIPOS = ('apartamento', 'kitnet', 'casa')
+# Centro da área onde os imóveis são espalhados (Parnaíba-PI) e o raio em graus
+CENTRO = (-2.905, -41.775)
+ESPALHAMENTO = 0.04
+
+# Buscas feitas em /pesquisa, sorteadas a cada requisição
+PESQUISAS = (
+    {},
+    {'tipo': 'kitnet'},
+    {'tipo': ['apartamento', 'casa']},
+    {'min_valor': 300, 'max_valor': 800},
+    {'quartos': 2},
+    {'extras': ['internet', 'mobiliado']},
+    {'busca': 'centro'},
+    {'busca': 'tabajara'},
+    {'perto': 'ufdpar'},
+    {'perto': 'uespi', 'raio': 1},
+)
+
+
+def ler_argumentos():
+    parser = argparse.ArgumentParser(description='Teste de carga das rotas do app.')
+    parser.add_argument('--postgres', metavar='URL', help='PostgreSQL local e vazio (padrão: SQLite temporário)')
+    parser.add_argument('--usuarios', type=int, default=500, help='usuários gerados (padrão: 500)')
+    parser.add_argument('--imoveis', type=int, default=4, help='imóveis por usuário (padrão: 4)')
+    parser.add_argument('--fotos', type=int, default=3, help='fotos por imóvel (padrão: 3)')
+    parser.add_argument('--cliques', type=int, default=50, help='eventos de clique gerados (padrão: 50)')
+    parser.add_argument('--clientes', type=int, default=16, help='clientes simultâneos (padrão: 16)')
+    parser.add_argument('--duracao', type=float, default=30, help='segundos medidos (padrão: 30)')
+    parser.add_argument('--aquecimento', type=float, default=5, help='segundos iniciais descartados (padrão: 5)')
+    parser.add_argument('--workers', type=int, default=2, help='workers do gunicorn (padrão: 2)')
+    parser.add_argument('--threads', type=int, default=4, help='threads por worker do gunicorn (padrão: 4)')
+    parser.add_argument('--rotas', help='mistura de rotas, ex.: pesquisa=60,detalhes_imovel=40')
+    parser.add_argument('--sem-cache', action='store_true', help='desliga o cache de páginas (PAGINAS_CACHE_TTL=0)')
+    parser.add_argument('--semente', type=int, default=42, help='semente dos dados e da mistura (padrão: 42)')
+    parser.add_argument('--saida', metavar='ARQUIVO', help='grava o resultado em JSON (padrão: imprime)')
+    parser.add_argument('--comparar', metavar='ARQUIVO', help='resultado anterior (JSON) para comparação')
+    parser.add_argument('--manter', action='store_true', help='não apaga a pasta temporária (banco e log)')
+    args = parser.parse_args()
+
+    args.pesos = dict(PESOS_PADRAO)
+    if args.rotas:
+        args.pesos = {}
+        for parte in args.rotas.split(','):
+            nome, _, peso = parte.partition('=')
+            if nome not in PESOS_PADRAO:
+                parser.error(f"rota desconhecida: {nome} (opções: {', '.join(PESOS_PADRAO)})")
+            args.pesos[nome] = float(peso or 1)
+    return args
+
+
+# ----- DADOS -----
+
+def semear(app, args):
+    """
+    Cria o esquema e insere os dados gerados. Retorna o que os clientes precisam saber:
+    ids dos imóveis ativos e e-mails dos usuários.
+    """
+    from database import get_db, inicializar_banco
+    from extras import EXTRAS
+    from geo import geohash
+
+    rnd = random.Random(args.semente)
+    postgres = bool(app.config.get('DATABASE_URL'))
+    ph = '%s' if postgres else '?'
+    fotos_disponiveis = sorted(
+        nome for nome in os.listdir(os.path.join(PASTA_APP, app.config['UPLOAD_FOLDER']))
+        if nome.lower().endswith(('.jpg', '.jpeg', '.png', '.webp')) and nome != 'default.jpg'
+    ) or ['default.jpg']
+
+    with app.app_context():
+        inicializar_banco()
+        db = get_db()
+        cur = db.cursor()
+        cur.execute('SELECT COUNT(*) AS total FROM usuarios')
+        if cur.fetchone()['total']:
+            raise SystemExit('O banco já tem usuários: use um banco vazio para o teste de carga.')
+
+        cur.execute(
+            f'INSERT INTO usuarios (nome, email, senha, telefone, tipo_usuario) VALUES ({ph}, {ph}, {ph}, {ph}, {ph})',
+            ('Admin Carga', ADMIN_EMAIL, SENHA, '86999990000', 'admin')
+        )
+        emails = [f'usuario{u}@carga.exemplo.com' for u in range(args.usuarios)]
+        cur.executemany(
+            f'INSERT INTO usuarios (nome, email, senha, telefone, tipo_usuario) VALUES ({ph}, {ph}, {ph}, {ph}, {ph})',
+            [(f'Usuário {u}', email, SENHA, f'8699{u:07d}', 'anunciante') for u, email in enumerate(emails)]
+        )
+        cur.execute("SELECT id FROM usuarios WHERE tipo_usuario = 'anunciante' ORDER BY id")
+        donos = [r['id'] for r in cur.fetchall()]
+
+        linhas = []
+        for dono in donos:
+            for _ in range(args.imoveis):
+                latitude = CENTRO[0] + rnd.uniform(-ESPALHAMENTO, ESPALHAMENTO)
+                longitude = CENTRO[1] + rnd.uniform(-ESPALHAMENTO, ESPALHAMENTO)
+                tipo = rnd.choice(TIPOS)
+                extras = sum(bit for _, _, bit in EXTRAS if rnd.random() < 0.4)
+                linhas.append((
+                    rnd.choice(RUAS), rnd.choice(BAIRROS), str(rnd.randint(1, 2000)), '64200-000',
+                    float(rnd.randrange(250, 2500, 10)), rnd.randint(1, 4), rnd.randint(1, 3), extras,
+                    f'{tipo.capitalize()} para estudantes, perto das universidades.', tipo, dono,
+                    0 if rnd.random() < 0.1 else 1, latitude, longitude, geohash(latitude, longitude),
+                ))
+        for inicio in range(0, len(linhas), 1000):
+            cur.executemany(
+                'INSERT INTO imoveis (endereco, bairro, numero, cep, valor, quartos, banheiros, extras, '
+                'descricao, tipo, usuario_id, ativo, latitude, longitude, geohash) '
+                f"VALUES ({', '.join([ph] * 15)})",
+                linhas[inicio:inicio + 1000]
+            )
+
+        cur.execute('SELECT id FROM imoveis ORDER BY id')
+        todos = [r['id'] for r in cur.fetchall()]
+        cur.executemany(
+            f'INSERT INTO fotos (imovel_id, posicao, caminho) VALUES ({ph}, {ph}, {ph})',
+            [(imovel, posicao, rnd.choice(fotos_disponiveis)) for imovel in todos for posicao in range(args.fotos)]
+        )
+        cur.executemany(
+            f'INSERT INTO click_counts (event_name, count) VALUES ({ph}, {ph}) ON CONFLICT (event_name) DO NOTHING',
+            [(f'evento_carga_{i}', rnd.randint(0, 5000)) for i in range(args.cliques)]
+        )
+        cur.execute('SELECT id FROM imoveis WHERE ativo = 1 ORDER BY id')
+        ativos = [r['id'] for r in cur.fetchall()]
+        db.commit()
+        if not postgres:
+            db.execute('ANALYZE')
+        else:
+            cur.execute('ANALYZE')
+        db.commit()
+
+    return {'imoveis': ativos, 'emails': emails, 'total_imoveis': len(todos)}
+
+
+# ----- SERVIDOR -----
+
+def porta_livre():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def subir_servidor(env, porta, args, log):
+    processo = subprocess.Popen(
+        [sys.executable, '-m', 'gunicorn', '--workers', str(args.workers), '--threads', str(args.threads),
+         '--bind', f'127.0.0.1:{porta}', 'app:app'],
+        cwd=PASTA_APP, env=env, stdout=log, stderr=subprocess.STDOUT,
+    )
+    prazo = time.monotonic() + 60
+    while time.monotonic() < prazo:
+        if processo.poll() is not None:
+            raise SystemExit(f'O gunicorn encerrou ao subir (veja {log.name}).')
+        try:
+            conexao = http.client.HTTPConnection('127.0.0.1', porta, timeout=5)
+            conexao.request('GET', '/')
+            conexao.getresponse().read()
+            conexao.close()
+            return processo
+        except OSError:
+            time.sleep(0.2)
+    processo.terminate()
+    raise SystemExit(f'O gunicorn não respondeu em 60 s (veja {log.name}).')
+
+
+def parar_servidor(processo):
+    processo.send_signal(signal.SIGTERM)
+    try:
+        processo.wait(timeout=30)
+    except subprocess.TimeoutExpired:
+        processo.kill()
+
+
+# ----- CLIENTES -----
+
+class Cliente:
+    """
+    Uma conexão keep-alive com o servidor (http.client reconecta sozinho se ela cair).
+    """
+
+    def __init__(self, porta):
+        self.conexao = http.client.HTTPConnection('127.0.0.1', porta, timeout=30)
+
+    def requisitar(self, metodo, caminho, corpo=None, cabecalhos=None):
+        """
+        Retorna (status, cookie de sessão recebido ou None).
+        """
+        try:
+            self.conexao.request(metodo, caminho, body=corpo, headers=cabecalhos or {})
+            resposta = self.conexao.getresponse()
+            resposta.read()
+        except (OSError, http.client.HTTPException):
+            self.conexao.close()
+            raise
+        cookie = resposta.getheader('Set-Cookie')
+        return resposta.status, cookie.split(';', 1)[0] if cookie else None
+
+
+def entrar(porta, email):
+    """
+    Faz login e retorna o cookie de sessão.
+    """
+    status, cookie = Cliente(porta).requisitar(
+        'POST', '/login', urlencode({'email': email, 'senha': SENHA}),
+        {'Content-Type': 'application/x-www-form-urlencoded'}
+    )
+    if status != 302 or not cookie:
+        raise SystemExit(f'Login de {email} falhou (status {status}).')
+    return cookie
+
+
+def montar_requisicao(rota, rnd, dados):
+    """
+    (metodo, caminho, corpo, cabeçalhos) de uma requisição sorteada para a rota.
+    """
+    if rota == 'pesquisa':
+        return 'GET', '/pesquisa?' + urlencode(rnd.choice(PESQUISAS), doseq=True), None, {}
+    if rota == 'detalhes_imovel':
+        return 'GET', f"/detalhes_imovel/{rnd.choice(dados['imoveis'])}", None, {}
+    if rota == 'track_click':
+        corpo = json.dumps({'event_name': 'contact_anunciante_click'})
+        return 'POST', '/track_click', corpo, {'Content-Type': 'application/json'}
+    if rota == 'login':
+        corpo = urlencode({'email': rnd.choice(dados['emails']), 'senha': SENHA})
+        return 'POST', '/login', corpo, {'Content-Type': 'application/x-www-form-urlencoded'}
+    if rota == 'admin':
+        return 'GET', '/admin/', None, {'Cookie': dados['cookie_admin']}
+    raise ValueError(rota)
+
+
+def disparar(porta, dados, args):
+    """
+    Roda os clientes pelo aquecimento + duração. Retorna {rota: [(segundos, ok), ...]}
+    só com as requisições feitas depois do aquecimento.
+    """
+    rotas = list(args.pesos)
+    pesos = [args.pesos[r] for r in rotas]
+    inicio = time.perf_counter()
+    fim_aquecimento = inicio + args.aquecimento
+    fim = fim_aquecimento + args.duracao
+    por_cliente = [{rota: [] for rota in rotas} for _ in range(args.clientes)]
+
+    def trabalhar(indice):
+        rnd = random.Random(args.semente * 1000 + indice)
+        cliente = Cliente(porta)
+        amostras = por_cliente[indice]
+        while True:
+            antes = time.perf_counter()
+            if antes >= fim:
+                break
+            rota = rnd.choices(rotas, pesos)[0]
+            metodo, caminho, corpo, cabecalhos = montar_requisicao(rota, rnd, dados)
+            try:
+                status, _ = cliente.requisitar(metodo, caminho, corpo, cabecalhos)
+                ok = status == STATUS_ESPERADO.get(rota, 200)
+            except (OSError, http.client.HTTPException):
+                ok = False
+            depois = time.perf_counter()
+            if antes >= fim_aquecimento:
+                amostras[rota].append((depois - antes, ok))
+
+    threads = [threading.Thread(target=trabalhar, args=(i,), daemon=True) for i in range(args.clientes)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    return {rota: [a for amostras in por_cliente for a in amostras[rota]] for rota in rotas}
+
+
+# ----- RELATÓRIO -----
+
+def percentil(ordenadas, p):
+    if not ordenadas:
+        return None
+    return ordenadas[max(0, math.ceil(p / 100 * len(ordenadas)) - 1)]
+
+
+def resumir(amostras, duracao):
+    latencias = sorted(segundos * 1000 for segundos, _ in amostras)
+    def ms(valor):
+        return round(valor, 2) if valor is not None else None
+    return {
+        'requisicoes': len(amostras),
+        'erros': sum(1 for _, ok in amostras if not ok),
+        'vazao_rps': round(len(amostras) / duracao, 1),
+        'p50_ms': ms(percentil(latencias, 50)),
+        'p95_ms': ms(percentil(latencias, 95)),
+        'p99_ms': ms(percentil(latencias, 99)),
+        'media_ms': ms(sum(latencias) / len(latencias)) if latencias else None,
+        'max_ms': ms(latencias[-1]) if latencias else None,
+    }
+
+
+def versao_do_codigo():
+    try:
+        commit = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=PASTA_APP,
+                                capture_output=True, text=True, check=True).stdout.strip()
+        alterado = subprocess.run(['git', 'status', '--porcelain', '--untracked-files=no'], cwd=PASTA_APP,
+                                  capture_output=True, text=True, check=True).stdout.strip()
+        return commit + ('-alterado' if alterado else '')
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def imprimir_tabela(resultado, base=None):
+    def variacao(atual, anterior):
+        if atual is None or not anterior:
+            return ''
+        return f' ({(atual - anterior) / anterior * 100:+.0f}%)'
+
+    print(f"{'rota':18} {'req':>7} {'erros':>6} {'req/s':>16} {'p50 ms':>9} {'p95 ms':>18} {'p99 ms':>18}")
+    for rota, r in resultado['rotas'].items():
+        b = (base or {}).get('rotas', {}).get(rota, {})
+        print(f"{rota:18} {r['requisicoes']:>7} {r['erros']:>6} "
+              f"{str(r['vazao_rps']) + variacao(r['vazao_rps'], b.get('vazao_rps')):>16} "
+              f"{str(r['p50_ms']):>9} "
+              f"{str(r['p95_ms']) + variacao(r['p95_ms'], b.get('p95_ms')):>18} "
+              f"{str(r['p99_ms']) + variacao(r['p99_ms'], b.get('p99_ms')):>18}")
+    if base:
+        print(f"Comparado com {base['meta'].get('commit')} ({base['meta'].get('data')}).")
+
+
+def main():
+    args = ler_argumentos()
+    pasta = tempfile.mkdtemp(prefix='medir-desempenho-')
+
+    # O app lê a configuração do ambiente ao ser importado: o do gunicorn e o deste
+    # processo (usado para semear o banco) precisam apontar para o mesmo banco
+    env = dict(os.environ, EMAIL_TRANSPORTE='arquivo', EMAIL_PASTA=os.path.join(pasta, 'emails'))
+    if args.postgres:
+        env['DATABASE_URL'] = args.postgres
+    else:
+        env.pop('DATABASE_URL', None)
+        env['DATABASE'] = os.path.join(pasta, 'banco.db')
+    if args.sem_cache:
+        env['PAGINAS_CACHE_TTL'] = '0'
+    os.environ.pop('DATABASE_URL', None)
+    os.environ.update(env)
+    sys.path.insert(0, PASTA_APP)
+    from app import app
+    logging.getLogger().setLevel(logging.WARNING)  # Só os avisos do app durante a semeadura
+
+    print(f"Gerando {args.usuarios} usuários com {args.imoveis} imóveis cada...")
+    antes = time.perf_counter()
+    dados = semear(app, args)
+    print(f"Banco pronto em {time.perf_counter() - antes:.1f} s ({dados['total_imoveis']} imóveis).")
+
+    porta = porta_livre()
+    with open(os.path.join(pasta, 'gunicorn.log'), 'w') as log:
+        processo = subir_servidor(env, porta, args, log)
+        try:
+            dados['cookie_admin'] = entrar(porta, ADMIN_EMAIL)
+            print(f"Medindo {args.clientes} clientes por {args.duracao:g} s "
+                  f"(+{args.aquecimento:g} s de aquecimento)...")
+            amostras = disparar(porta, dados, args)
+        finally:
+            parar_servidor(processo)
+
+    resultado = {
+        'meta': {
+            'commit': versao_do_codigo(),
+            'data': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+            'banco': 'postgresql' if args.postgres else 'sqlite',
+            'usuarios': args.usuarios,
+            'imoveis': dados['total_imoveis'],
+            'fotos_por_imovel': args.fotos,
+            'clientes': args.clientes,
+            'duracao_s': args.duracao,
+            'aquecimento_s': args.aquecimento,
+            'workers': args.workers,
+            'threads': args.threads,
+            'cache_paginas': not args.sem_cache,
+            'rotas': args.pesos,
+            'python': platform.python_version(),
+        },
+        'rotas': {rota: resumir(a, args.duracao) for rota, a in amostras.items()},
+        'total': resumir([x for a in amostras.values() for x in a], args.duracao),
+    }
+
+    base = None
+    if args.comparar:
+        with open(args.comparar, encoding='utf-8') as f:
+            base = json.load(f)
+    imprimir_tabela(resultado, base)
+    if args.saida:
+        with open(args.saida, 'w', encoding='utf-8') as f:
+            json.dump(resultado, f, indent=2, ensure_ascii=False)
+        print(f"Resultado gravado em {args.saida}.")
+    else:
+        print(json.dumps(resultado, indent=2, ensure_ascii=False))
+
+    if args.manter:
+        print(f"Banco e log do gunicorn em {pasta}.")
+    else:
+        shutil.rmtree(pasta, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
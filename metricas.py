@@ -0,0 +1,162 @@
+# metricas.py
+# Contagem de acessos por rota, consolidada em baldes por hora e por dia no banco.
+
+import atexit
+import itertools
+import logging
+import os
+import threading
+from datetime import datetime, timedelta
+
+from database import get_db
+
+log = logging.getLogger(__name__)
+
+
+class ContadorAcessos:
+    """
+    Conta acessos por rota dentro do worker e consolida os números no banco.
+
+    - registrar() não usa lock: cada rota tem um itertools.count, e next() é atômico
+      no CPython. O valor é lido pela própria thread de consolidação com next(), que
+      também soma 1; esse incremento extra é descontado em `_lidos`.
+    - A cada `intervalo` segundos os acessos novos são somados em acessos_hora,
+      acessos_dia e acessos_total (UPSERT aditivo, seguro entre workers do gunicorn).
+    """
+
+    def __init__(self, app, intervalo=60.0):
+        self.app = app
+        self.intervalo = intervalo
+
+        self._contadores = {}  # rota -> itertools.count()
+        self._lidos = {}  # rota -> valor do contador já consolidado (só a thread de consolidação mexe)
+        self._nao_gravados = {}  # rota -> acessos lidos cuja gravação falhou
+        self._parar = threading.Event()
+        self._gravar_lock = threading.Lock()  # Serializa a thread e o encerramento, nunca registrar()
+        self._thread = threading.Thread(target=self._executar, name='contador-acessos', daemon=True)
+        self._thread.start()
+
+    def registrar(self, rota):
+        contador = self._contadores.get(rota)
+        if contador is None:
+            contador = self._contadores.setdefault(rota, itertools.count())
+        next(contador)
+
+    def _coletar(self):
+        """
+        Retorna {rota: acessos desde a última coleta}.
+        """
+        novos = dict(self._nao_gravados)
+        self._nao_gravados = {}
+        for rota, contador in list(self._contadores.items()):
+            atual = next(contador)
+            quantidade = atual - self._lidos.get(rota, 0)
+            self._lidos[rota] = atual + 1  # Desconta o next() da própria leitura
+            if quantidade:
+                novos[rota] = novos.get(rota, 0) + quantidade
+        return novos
+
+    def _executar(self):
+        while not self._parar.wait(self.intervalo):
+            self.gravar()
+
+    def gravar(self):
+        """
+        Soma os acessos coletados nos baldes da hora e do dia atuais e no total da rota.
+        """
+        with self._gravar_lock:
+            novos = self._coletar()
+            if not novos:
+                return
+            agora = datetime.now()
+            hora = agora.replace(minute=0, second=0, microsecond=0)
+            dia = agora.date()
+            try:
+                with self.app.app_context():
+                    db = get_db()
+                    ph = "%s" if self.app.config.get('DATABASE_URL') else "?"
+                    cur = db.cursor()
+                    linhas = sorted(novos.items())  # Ordem fixa evita deadlock entre workers no PostgreSQL
+                    cur.executemany(
+                        f"""
+                        INSERT INTO acessos_hora (rota, hora, total) VALUES ({ph}, {ph}, {ph})
+                        ON CONFLICT (rota, hora) DO UPDATE SET total = acessos_hora.total + excluded.total
+                        """, [(rota, hora, n) for rota, n in linhas]
+                    )
+                    cur.executemany(
+                        f"""
+                        INSERT INTO acessos_dia (rota, dia, total) VALUES ({ph}, {ph}, {ph})
+                        ON CONFLICT (rota, dia) DO UPDATE SET total = acessos_dia.total + excluded.total
+                        """, [(rota, dia, n) for rota, n in linhas]
+                    )
+                    cur.executemany(
+                        f"""
+                        INSERT INTO acessos_total (rota, total) VALUES ({ph}, {ph})
+                        ON CONFLICT (rota) DO UPDATE SET total = acessos_total.total + excluded.total
+                        """, linhas
+                    )
+                    db.commit()
+            except Exception:
+                log.exception("Erro ao gravar acessos")
+                self._nao_gravados = novos  # Tenta de novo na próxima consolidação
+
+    def encerrar(self):
+        """
+        Para a thread e grava os acessos pendentes. Chamado na saída do processo.
+        """
+        self._parar.set()
+        self._thread.join(timeout=self.intervalo)
+        self.gravar()
+
+
+# Um contador por processo: após o fork, cada worker do gunicorn cria o seu
+_contador = None
+_contador_pid = None
+_contador_lock = threading.Lock()
+
+def obter_contador(app):
+    """
+    Retorna o contador de acessos deste processo, criando-o no primeiro uso.
+    """
+    global _contador, _contador_pid
+    if _contador is None or _contador_pid != os.getpid():
+        with _contador_lock:
+            if _contador is None or _contador_pid != os.getpid():
+                _contador = ContadorAcessos(app, intervalo=app.config['METRICAS_INTERVALO'])
+                _contador_pid = os.getpid()
+                atexit.register(_contador.encerrar)
+    return _contador
+
+# ----- LEITURA DOS BALDES (painel admin) -----
+
+def resumo_acessos(db, postgres, dias=14, horas=24):
+    """
+    Lê os totais e as séries já consolidadas. O custo depende só do número de rotas
+    e do tamanho da janela, não da quantidade de acessos.
+    """
+    ph = "%s" if postgres else "?"
+    cur = db.cursor()
+    cur.execute('SELECT rota, total FROM acessos_total ORDER BY total DESC')
+    por_rota = [(r['rota'], r['total']) for r in cur.fetchall()]
+
+    agora = datetime.now()
+    desde_dia = (agora - timedelta(days=dias - 1)).date()
+    cur.execute(
+        f'SELECT dia, SUM(total) AS total FROM acessos_dia WHERE dia >= {ph} GROUP BY dia ORDER BY dia',
+        (desde_dia,)
+    )
+    por_dia = [(str(r['dia'])[:10], r['total']) for r in cur.fetchall()]
+
+    desde_hora = (agora - timedelta(hours=horas - 1)).replace(minute=0, second=0, microsecond=0)
+    cur.execute(
+        f'SELECT hora, SUM(total) AS total FROM acessos_hora WHERE hora >= {ph} GROUP BY hora ORDER BY hora',
+        (desde_hora,)
+    )
+    por_hora = [(str(r['hora'])[11:16], r['total']) for r in cur.fetchall()]
+
+    return {
+        'por_rota': por_rota,
+        'por_dia': por_dia,
+        'por_hora': por_hora,
+        'pagina_inicial': dict(por_rota).get('index', 0),
+    }
@@ -0,0 +1,95 @@
+# migrar_imagens.py
+# Move as fotos antigas (salvas pelo nome do arquivo enviado) para o armazenamento por
+# conteúdo (cas/ab/<sha256>.ext), reescreve a tabela fotos e recalcula as referências.
+# Pode ser rodado mais de uma vez: fotos já migradas são mantidas.
+#
+# Uso:
+#   python migrar_imagens.py                      -> migra e mantém os arquivos antigos
+#   python migrar_imagens.py --remover-originais  -> migra e apaga os arquivos antigos
+import glob
+import hashlib
+import os
+import sys
+from collections import Counter
+
+from app import app
+from database import get_db
+from imagens import (PASTA_CONTEUDO, EXTENSOES_IMAGEM, e_conteudo, salvar_conteudo,
+                     gerar_derivados, remover_arquivos)
+
+
+def _ja_migrado(caminho, pasta):
+    """
+    True se o conteúdo do arquivo já está no armazenamento por conteúdo.
+    """
+    sha = hashlib.sha256()
+    with open(caminho, 'rb') as f:
+        for bloco in iter(lambda: f.read(64 * 1024), b''):
+            sha.update(bloco)
+    digest = sha.hexdigest()
+    return bool(glob.glob(os.path.join(pasta, PASTA_CONTEUDO, digest[:2], digest + '.*')))
+
+
+def migrar(remover_originais=False):
+    with app.app_context():
+        pasta = app.config['UPLOAD_FOLDER']
+        ph = "%s" if app.config.get('DATABASE_URL') else "?"
+        db = get_db()
+        cur = db.cursor()
+
+        cur.execute('SELECT imovel_id, posicao, caminho FROM fotos')
+        fotos = [(r['imovel_id'], r['posicao'], r['caminho']) for r in cur.fetchall()]
+
+        novos_nomes = {}  # nome antigo -> caminho por conteúdo
+        referencias = Counter()
+        alterados = set()
+        for imovel_id, posicao, nome in fotos:
+            if not e_conteudo(nome) and nome not in novos_nomes:
+                origem = os.path.join(pasta, nome)
+                if os.path.isfile(origem):
+                    with open(origem, 'rb') as f:
+                        caminho, novo = salvar_conteudo(f, nome, pasta)
+                    if novo:
+                        try:
+                            gerar_derivados(caminho, pasta)
+                        except Exception as e:
+                            print(f"Erro ao gerar derivados de {caminho}: {e}")
+                    novos_nomes[nome] = caminho
+                    print(f"{nome} -> {caminho}")
+                else:
+                    novos_nomes[nome] = nome  # Arquivo que não existe no disco: fica como está
+            migrado = novos_nomes.get(nome, nome)
+            if e_conteudo(migrado):
+                referencias[migrado] += 1
+            if migrado != nome:
+                cur.execute(f'UPDATE fotos SET caminho = {ph} WHERE imovel_id = {ph} AND posicao = {ph}',
+                            (migrado, imovel_id, posicao))
+                alterados.add(imovel_id)
+
+        # As referências são recalculadas do zero a partir da tabela fotos
+        cur.execute('DELETE FROM imagens')
+        cur.executemany(
+            f'INSERT INTO imagens (caminho, referencias) VALUES ({ph}, {ph})',
+            sorted(referencias.items())
+        )
+        db.commit()
+        print(f"{len(alterados)} imóvel(is) atualizado(s), {len(referencias)} foto(s) no armazenamento por conteúdo.")
+
+        if remover_originais:
+            # Olha o disco, e não só o que foi migrado agora, para funcionar também
+            # quando o script já tinha sido rodado antes sem --remover-originais
+            cur.execute('SELECT DISTINCT caminho FROM fotos')
+            em_uso = {r['caminho'] for r in cur.fetchall()}
+            antigos = [
+                nome for nome in sorted(os.listdir(pasta))
+                if os.path.splitext(nome)[1].lower() in EXTENSOES_IMAGEM
+                and nome not in em_uso
+                and os.path.isfile(os.path.join(pasta, nome))
+                and _ja_migrado(os.path.join(pasta, nome), pasta)
+            ]
+            remover_arquivos(antigos, pasta)
+            print(f"{len(antigos)} arquivo(s) antigo(s) removido(s).")
+
+
+if __name__ == '__main__':
+    migrar(remover_originais='--remover-originais' in sys.argv)
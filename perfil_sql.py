@@ -0,0 +1,406 @@
+# perfil_sql.py
+# Perfil das consultas SQL: get_db entrega a conexão dentro de ConexaoPerfilada, que mede
+# cada comando e o agrupa pela "impressão" (o SQL sem valores literais). Daí saem:
+#   - as consultas que mais somam tempo no worker (top-N global);
+#   - as requisições que mais gastaram tempo em SQL, com as suas consultas principais;
+#   - o registro das consultas lentas (acima de PERFIL_SQL_LENTA_MS), com o plano do EXPLAIN;
+#   - os possíveis N+1: a mesma impressão repetida PERFIL_SQL_N_MAIS_1 vezes numa requisição.
+#
+# Como em telemetria.py, cada worker grava um retrato em PERFIL_SQL_PASTA/<pid>.json; o
+# relatório (em /admin/consultas ou em relatorio_sql.py) junta os retratos de todos.
+
+import atexit
+import heapq
+import logging
+import os
+import re
+import threading
+import time
+from collections import deque
+from datetime import datetime
+
+from flask import g
+
+from telemetria import gravar_json, ler_json
+
+log = logging.getLogger(__name__)
+
+# ----- IMPRESSÃO DAS CONSULTAS -----
+
+_COMENTARIOS = re.compile(r'--[^\n]*|/\*.*?\*/', re.S)
+_TEXTOS = re.compile(r"'(?:[^']|'')*'")
+_NUMEROS = re.compile(r'\b\d+(?:\.\d+)?\b')
+_PARAMETROS = re.compile(r'%s|\?')
+_LISTAS = re.compile(r'\(\s*\?(?:\s*,\s*\?)+\s*\)')  # IN (?, ?, ?) -> IN (...)
+_VALORES = re.compile(r'(VALUES\s*\([^()]*\))(?:\s*,\s*\([^()]*\))+', re.I)  # VALUES (..), (..) -> VALUES (..)
+_ESPACOS = re.compile(r'\s+')
+
+# SQL -> impressão. Quase todo SQL da aplicação é texto fixo, então o cache fica pequeno;
+# se passar do limite (SQL montado com valores), recomeça do zero
+_impressoes = {}
+_MAX_IMPRESSOES_CACHE = 2000
+
+
+def impressao_sql(sql):
+    """
+    O SQL sem comentários, textos, números e placeholders, com os espaços normalizados:
+    "SELECT * FROM imoveis WHERE id = 5" e "... WHERE id = ?" têm a mesma impressão.
+    """
+    impressao = _impressoes.get(sql)
+    if impressao is None:
+        texto = _COMENTARIOS.sub(' ', sql)
+        texto = _TEXTOS.sub('?', texto)
+        texto = _NUMEROS.sub('?', texto)
+        texto = _PARAMETROS.sub('?', texto)
+        texto = _LISTAS.sub('(...)', texto)
+        texto = _VALORES.sub(r'\1', texto)
+        impressao = _ESPACOS.sub(' ', texto).strip()
+        if len(_impressoes) >= _MAX_IMPRESSOES_CACHE:
+            _impressoes.clear()
+        _impressoes[sql] = impressao
+    return impressao
+
+
+# ----- CONEXÃO E CURSOR MEDIDOS -----
+
+class CursorPerfilado:
+    """
+    Cursor que mede execute/executemany. O resto (fetch*, iteração, rowcount,
+    copy_expert, itersize...) vai direto para o cursor original.
+    """
+
+    __slots__ = ('_cursor', '_perfil', '_postgres')
+
+    def __init__(self, cursor, perfil, postgres):
+        object.__setattr__(self, '_cursor', cursor)
+        object.__setattr__(self, '_perfil', perfil)
+        object.__setattr__(self, '_postgres', postgres)
+
+    def execute(self, sql, params=()):
+        inicio = time.perf_counter()
+        resultado = self._cursor.execute(sql, params)
+        self._perfil.registrar(sql, time.perf_counter() - inicio, self._cursor, params, self._postgres)
+        return self if resultado is self._cursor else resultado  # sqlite3 devolve o próprio cursor
+
+    def executemany(self, sql, lista_params):
+        inicio = time.perf_counter()
+        resultado = self._cursor.executemany(sql, lista_params)
+        self._perfil.registrar(sql, time.perf_counter() - inicio, self._cursor, None, self._postgres)
+        return self if resultado is self._cursor else resultado
+
+    def __iter__(self):
+        return iter(self._cursor)
+
+    def __enter__(self):
+        self._cursor.__enter__()
+        return self
+
+    def __exit__(self, *excecao):
+        return self._cursor.__exit__(*excecao)
+
+    def __getattr__(self, nome):
+        return getattr(self._cursor, nome)
+
+    def __setattr__(self, nome, valor):
+        setattr(self._cursor, nome, valor)
+
+
+class ConexaoPerfilada:
+    """
+    Conexão devolvida por get_db: cursores medidos e os atalhos execute/executemany do
+    sqlite3 passando por eles. A conexão original fica em `conexao` (close_db a usa).
+    """
+
+    __slots__ = ('conexao', '_perfil', '_postgres')
+
+    def __init__(self, conexao, perfil, postgres):
+        object.__setattr__(self, 'conexao', conexao)
+        object.__setattr__(self, '_perfil', perfil)
+        object.__setattr__(self, '_postgres', postgres)
+
+    def cursor(self, *args, **kwargs):
+        return CursorPerfilado(self.conexao.cursor(*args, **kwargs), self._perfil, self._postgres)
+
+    def execute(self, sql, params=()):
+        return self.cursor().execute(sql, params)
+
+    def executemany(self, sql, lista_params):
+        return self.cursor().executemany(sql, lista_params)
+
+    def __getattr__(self, nome):
+        return getattr(self.conexao, nome)
+
+    def __setattr__(self, nome, valor):
+        setattr(self.conexao, nome, valor)
+
+
+# ----- PERFIL DO WORKER -----
+
+class PerfilSQL:
+    """
+    Tempos das consultas deste worker. registrar() é chamado a cada comando; o que é
+    por requisição fica em g.perfil_sql e é analisado em finalizar_requisicao().
+    """
+
+    def __init__(self, pasta, intervalo=10.0, lenta_ms=100.0, n_mais_1=10, top=20,
+                 explicar_a_cada=300.0, max_impressoes=1000, retencao=86400):
+        self.pasta = pasta
+        self.intervalo = intervalo
+        self.lenta = lenta_ms / 1000
+        self.n_mais_1 = n_mais_1
+        self.top = top
+        self.explicar_a_cada = explicar_a_cada
+        self.max_impressoes = max_impressoes
+        self.retencao = retencao
+        self.pid = os.getpid()
+        self.desde = datetime.now().isoformat(timespec='seconds')
+
+        self._lock = threading.Lock()
+        self._consultas = {}  # impressão -> [chamadas, tempo total, tempo máximo]
+        self._lentas = deque(maxlen=top)
+        self._suspeitas = deque(maxlen=top)
+        self._requisicoes = []  # heap (tempo em SQL, sequência, resumo): as `top` mais lentas
+        self._sequencia = 0
+        self._planos = {}  # impressão -> (instante do EXPLAIN, plano)
+        self._parar = threading.Event()
+        os.makedirs(pasta, exist_ok=True)
+        self._thread = threading.Thread(target=self._executar, name='perfil-sql', daemon=True)
+        self._thread.start()
+
+    def registrar(self, sql, duracao, cursor, params, postgres):
+        impressao = impressao_sql(sql)
+        with self._lock:
+            estatistica = self._consultas.get(impressao)
+            if estatistica is None:
+                if len(self._consultas) >= self.max_impressoes:
+                    impressao = '(outras)'  # Limita a memória se o SQL vier montado com valores
+                estatistica = self._consultas.setdefault(impressao, [0, 0.0, 0.0])
+            estatistica[0] += 1
+            estatistica[1] += duracao
+            if duracao > estatistica[2]:
+                estatistica[2] = duracao
+        try:
+            estado = g._get_current_object()  # Um acesso ao proxy em vez de um por atributo
+        except RuntimeError:
+            estado = None  # Fora de um contexto da aplicação
+        if estado is not None:
+            estado.db_consultas = getattr(estado, 'db_consultas', 0) + 1  # Lido pela telemetria
+            por_requisicao = getattr(estado, 'perfil_sql', None)
+            if por_requisicao is None:
+                por_requisicao = estado.perfil_sql = {}
+            atual = por_requisicao.get(impressao)
+            if atual is None:
+                por_requisicao[impressao] = [1, duracao]
+            else:
+                atual[0] += 1
+                atual[1] += duracao
+        if duracao >= self.lenta:
+            self._registrar_lenta(sql, impressao, duracao, cursor, params, postgres)
+
+    def _registrar_lenta(self, sql, impressao, duracao, cursor, params, postgres):
+        agora = time.monotonic()
+        ultimo = self._planos.get(impressao)
+        if ultimo is None or agora - ultimo[0] >= self.explicar_a_cada:
+            # Um EXPLAIN por impressão a cada `explicar_a_cada` s: sob carga, uma consulta
+            # lenta não vira o dobro de consultas
+            plano = explicar(cursor.connection, sql, params, postgres) if params is not None else None
+            self._planos[impressao] = (agora, plano)
+        else:
+            plano = ultimo[1]
+        log.warning("Consulta lenta (%.1f ms): %s", duracao * 1000, impressao,
+                    extra={'duracao_sql_ms': round(duracao * 1000, 2), 'plano': plano})
+        with self._lock:
+            self._lentas.append({
+                'quando': datetime.now().isoformat(timespec='seconds'),
+                'duracao_ms': round(duracao * 1000, 2),
+                'impressao': impressao,
+                'plano': plano,
+            })
+
+    def finalizar_requisicao(self, endpoint, caminho):
+        """
+        Fecha o perfil da requisição: aponta possíveis N+1 e guarda a requisição se
+        ela estiver entre as que mais gastaram tempo em SQL.
+        """
+        consultas = g.pop('perfil_sql', None)
+        if not consultas:
+            return
+        endpoint = endpoint or 'nao_encontrada'
+        quando = datetime.now().isoformat(timespec='seconds')
+        tempo = sum(t for _, t in consultas.values())
+        for impressao, (chamadas, tempo_impressao) in consultas.items():
+            if chamadas >= self.n_mais_1:
+                log.warning("Possível N+1: %dx %s", chamadas, impressao, extra={'chamadas': chamadas})
+                with self._lock:
+                    self._suspeitas.append({
+                        'quando': quando,
+                        'endpoint': endpoint,
+                        'caminho': caminho,
+                        'impressao': impressao,
+                        'chamadas': chamadas,
+                        'tempo_ms': round(tempo_impressao * 1000, 2),
+                    })
+        with self._lock:
+            if len(self._requisicoes) >= self.top and tempo <= self._requisicoes[0][0]:
+                return
+            principais = sorted(consultas.items(), key=lambda item: item[1][1], reverse=True)[:5]
+            resumo = {
+                'quando': quando,
+                'endpoint': endpoint,
+                'caminho': caminho,
+                'tempo_ms': round(tempo * 1000, 2),
+                'consultas': sum(n for n, _ in consultas.values()),
+                'principais': [{'impressao': i, 'chamadas': n, 'tempo_ms': round(t * 1000, 2)}
+                               for i, (n, t) in principais],
+            }
+            self._sequencia += 1
+            if len(self._requisicoes) >= self.top:
+                heapq.heapreplace(self._requisicoes, (tempo, self._sequencia, resumo))
+            else:
+                heapq.heappush(self._requisicoes, (tempo, self._sequencia, resumo))
+
+    def retrato(self):
+        with self._lock:
+            return {
+                'pid': self.pid,
+                'desde': self.desde,
+                'consultas': {i: list(e) for i, e in self._consultas.items()},
+                'lentas': list(self._lentas),
+                'suspeitas': list(self._suspeitas),
+                'requisicoes': [resumo for _, _, resumo in self._requisicoes],
+            }
+
+    # ----- Retratos entre workers -----
+
+    def _executar(self):
+        while not self._parar.wait(self.intervalo):
+            self.gravar()
+
+    def gravar(self):
+        """
+        Grava o retrato deste worker e apaga os retratos parados há mais de `retencao`
+        segundos (workers que já terminaram: os vivos regravam a cada `intervalo`).
+        """
+        try:
+            gravar_json(os.path.join(self.pasta, f'{self.pid}.json'), self.retrato())
+            limite = time.time() - self.retencao
+            for nome in os.listdir(self.pasta):
+                caminho = os.path.join(self.pasta, nome)
+                if nome.endswith('.json') and os.path.getmtime(caminho) < limite:
+                    os.remove(caminho)
+        except Exception:
+            log.exception("Erro ao gravar o perfil SQL")
+
+    def relatorio(self):
+        """
+        Relatório de todos os workers, com os números deste ao vivo.
+        """
+        return ler_relatorio(self.pasta, self.top, atual=self.retrato())
+
+    def encerrar(self):
+        self._parar.set()
+        self._thread.join(timeout=self.intervalo)
+        self.gravar()
+
+
+def explicar(conexao, sql, params, postgres):
+    """
+    Plano da consulta (EXPLAIN no PostgreSQL, EXPLAIN QUERY PLAN no SQLite), sem executá-la.
+    No PostgreSQL roda dentro de um SAVEPOINT: se falhar, a transação da requisição segue.
+    """
+    comando = sql.lstrip()[:6].upper()
+    if comando not in ('SELECT', 'UPDATE', 'DELETE', 'INSERT') and not comando.startswith('WITH'):
+        return None
+    cur = conexao.cursor()
+    try:
+        if postgres:
+            cur.execute('SAVEPOINT perfil_sql')
+            try:
+                cur.execute('EXPLAIN ' + sql, params)
+                plano = '\n'.join(r[0] for r in cur.fetchall())
+            except Exception:
+                cur.execute('ROLLBACK TO SAVEPOINT perfil_sql')
+                raise
+            cur.execute('RELEASE SAVEPOINT perfil_sql')
+        else:
+            cur.execute('EXPLAIN QUERY PLAN ' + sql, params)
+            plano = '\n'.join(r[3] for r in cur.fetchall())
+        return plano
+    except Exception as e:
+        return f'(EXPLAIN falhou: {e})'
+    finally:
+        cur.close()
+
+
+def ler_relatorio(pasta, top=20, atual=None):
+    """
+    Junta os retratos gravados em `pasta` (e o retrato `atual`, no lugar do arquivo do
+    mesmo pid): consultas somadas entre workers e as listas mais recentes/mais lentas.
+    """
+    retratos = {}
+    if os.path.isdir(pasta):
+        for nome in os.listdir(pasta):
+            if nome.endswith('.json'):
+                retrato = ler_json(os.path.join(pasta, nome))
+                if retrato:
+                    retratos[retrato.get('pid')] = retrato
+    if atual:
+        retratos[atual['pid']] = atual
+
+    consultas = {}
+    for retrato in retratos.values():
+        for impressao, (chamadas, total, maximo) in retrato.get('consultas', {}).items():
+            soma = consultas.setdefault(impressao, [0, 0.0, 0.0])
+            soma[0] += chamadas
+            soma[1] += total
+            soma[2] = max(soma[2], maximo)
+
+    def juntar(chave, ordem):
+        itens = [item for retrato in retratos.values() for item in retrato.get(chave, ())]
+        return sorted(itens, key=lambda item: item[ordem], reverse=True)[:top]
+
+    return {
+        'workers': len(retratos),
+        'desde': min((r.get('desde', '') for r in retratos.values()), default=None),
+        'consultas': [
+            {
+                'impressao': impressao,
+                'chamadas': chamadas,
+                'tempo_total_ms': round(total * 1000, 2),
+                'tempo_medio_ms': round(total * 1000 / chamadas, 3),
+                'tempo_max_ms': round(maximo * 1000, 2),
+            }
+            for impressao, (chamadas, total, maximo)
+            in sorted(consultas.items(), key=lambda item: item[1][1], reverse=True)[:top]
+        ],
+        'requisicoes': juntar('requisicoes', 'tempo_ms'),
+        'lentas': juntar('lentas', 'quando'),
+        'suspeitas_n_mais_1': juntar('suspeitas', 'quando'),
+    }
+
+
+# Um perfil por processo: após o fork, cada worker do gunicorn cria o seu
+_perfil = None
+_perfil_pid = None
+_perfil_lock = threading.Lock()
+
+def obter_perfil(app):
+    """
+    Retorna o perfil SQL deste processo, criando-o no primeiro uso.
+    """
+    global _perfil, _perfil_pid
+    if _perfil is None or _perfil_pid != os.getpid():
+        with _perfil_lock:
+            if _perfil is None or _perfil_pid != os.getpid():
+                config = app.config
+                _perfil = PerfilSQL(
+                    config['PERFIL_SQL_PASTA'],
+                    intervalo=config['PERFIL_SQL_INTERVALO'],
+                    lenta_ms=config['PERFIL_SQL_LENTA_MS'],
+                    n_mais_1=config['PERFIL_SQL_N_MAIS_1'],
+                    top=config['PERFIL_SQL_TOP'],
+                    explicar_a_cada=config['PERFIL_SQL_EXPLICAR_A_CADA'],
+                )
+                _perfil_pid = os.getpid()
+                atexit.register(_perfil.encerrar)
+    return _perfil
@@ -0,0 +1,257 @@
+# pool.py
+# Pool de conexões PostgreSQL por processo (cada worker do gunicorn tem o seu).
+
+import threading
+import time
+from collections import deque
+
+import psycopg2
+import psycopg2.extensions
+import psycopg2.extras
+
+
+class PoolEsgotadoError(ConnectionError):
+    """
+    Nenhuma conexão ficou livre dentro do tempo limite de espera.
+    """
+
+
+# Marca de "ainda sem conexão" para quem está na fila de espera
+_AGUARDANDO = object()
+
+
+class _Espera:
+    """
+    Lugar na fila de espera: devolver() preenche `conexao` e dispara o evento.
+    """
+
+    def __init__(self):
+        self.evento = threading.Event()
+        self.conexao = _AGUARDANDO
+
+
+class PoolConexoes:
+    """
+    Mantém conexões abertas com o PostgreSQL e as empresta a cada requisição.
+
+    - min_conexoes são abertas na criação; o pool cresce sob demanda até max_conexoes.
+    - obter() espera no máximo `timeout` segundos por uma conexão livre.
+    - Conexões ociosas há mais de `ping_apos` segundos são testadas com SELECT 1 antes de sair.
+    - Conexões com mais de `max_usos` empréstimos ou `max_idade` segundos são recicladas.
+    """
+
+    def __init__(self, dsn, min_conexoes=1, max_conexoes=10, timeout=5.0,
+                 max_usos=500, max_idade=1800, ping_apos=30, cursor_factory=psycopg2.extras.DictCursor):
+        self.dsn = dsn
+        self.min_conexoes = min_conexoes
+        self.max_conexoes = max_conexoes
+        self.timeout = timeout
+        self.max_usos = max_usos
+        self.max_idade = max_idade
+        self.ping_apos = ping_apos
+        self.cursor_factory = cursor_factory
+
+        self._lock = threading.Lock()
+        self._ociosas = deque()  # LIFO: as conexões usadas por último são as mais "quentes"
+        self._info = {}  # id(conexão) -> {'criada': ..., 'usos': ..., 'devolvida': ...}
+        self._fila = deque()  # Requisições esperando uma conexão, em ordem de chegada
+        self._total = 0  # conexões abertas + conexões sendo abertas
+        self._fechado = False
+        self._stats = {
+            'emprestimos': 0,
+            'espera_total': 0.0,
+            'espera_max': 0.0,
+            'timeouts': 0,
+            'criadas': 0,
+            'recicladas': 0,
+            'descartadas': 0,
+        }
+
+        for _ in range(min_conexoes):
+            conn = self._abrir()
+            with self._lock:
+                self._total += 1
+                self._ociosas.append(conn)
+
+    # ----- Ciclo de vida das conexões -----
+
+    def _abrir(self):
+        """
+        Abre uma conexão nova. Chamado fora do lock; o registro é feito em seguida.
+        """
+        conn = psycopg2.connect(self.dsn)
+        # O cursor DictCursor (ou subclasse) permite acessar os resultados como dicionários (row['nome'])
+        conn.cursor_factory = self.cursor_factory
+        agora = time.monotonic()
+        with self._lock:
+            self._info[id(conn)] = {'criada': agora, 'usos': 0, 'devolvida': agora}
+            self._stats['criadas'] += 1
+        return conn
+
+    def _fechar(self, conn):
+        """
+        Encerra a conexão e esquece seus metadados. Deve ser chamado com o lock.
+        """
+        self._info.pop(id(conn), None)
+        try:
+            conn.close()
+        except Exception:
+            pass
+
+    def _expirada(self, conn, agora):
+        info = self._info[id(conn)]
+        return info['usos'] >= self.max_usos or agora - info['criada'] >= self.max_idade
+
+    def _saudavel(self, conn, agora):
+        """
+        Verificação feita no empréstimo. O SELECT 1 só é feito se a conexão ficou
+        ociosa tempo suficiente para o servidor ou a rede terem derrubado ela.
+        """
+        if conn.closed:
+            return False
+        if conn.get_transaction_status() != psycopg2.extensions.TRANSACTION_STATUS_IDLE:
+            return False
+        if agora - self._info[id(conn)]['devolvida'] < self.ping_apos:
+            return True
+        try:
+            cur = conn.cursor()
+            cur.execute('SELECT 1')
+            cur.close()
+            conn.rollback()
+            return True
+        except psycopg2.Error:
+            return False
+
+    # ----- API pública -----
+
+    def obter(self):
+        """
+        Empresta uma conexão do pool, abrindo uma nova se houver espaço.
+        Quem chega com o pool cheio entra numa fila (FIFO) e recebe a próxima conexão
+        devolvida. Levanta PoolEsgotadoError se nada chegar dentro de `timeout`.
+        """
+        inicio = time.monotonic()
+        with self._lock:
+            if self._fechado:
+                raise PoolEsgotadoError("O pool de conexões foi fechado.")
+            if self._ociosas and not self._fila:
+                conn = self._ociosas.pop()
+            elif self._total < self.max_conexoes:
+                self._total += 1  # Reserva a vaga antes de abrir fora do lock
+                conn = None
+            else:
+                espera = _Espera()
+                self._fila.append(espera)
+                conn = _AGUARDANDO
+
+        if conn is _AGUARDANDO:
+            espera.evento.wait(self.timeout)
+            with self._lock:
+                if espera.conexao is _AGUARDANDO:
+                    self._fila.remove(espera)
+                    self._stats['timeouts'] += 1
+                    raise PoolEsgotadoError(
+                        f"Nenhuma conexão livre em {self.timeout}s (máximo de {self.max_conexoes}).")
+                conn = espera.conexao  # None: ganhamos a vaga de uma conexão descartada
+            if conn is None and self._fechado:
+                with self._lock:
+                    self._total -= 1
+                raise PoolEsgotadoError("O pool de conexões foi fechado.")
+
+        agora = time.monotonic()
+        if conn is not None and (self._expirada(conn, agora) or not self._saudavel(conn, agora)):
+            with self._lock:
+                if self._expirada(conn, agora):
+                    self._stats['recicladas'] += 1
+                else:
+                    self._stats['descartadas'] += 1
+                self._fechar(conn)
+            conn = None
+
+        if conn is None:
+            try:
+                conn = self._abrir()
+            except Exception:
+                with self._lock:
+                    self._total -= 1
+                    self._repassar(None)
+                raise
+
+        espera_s = time.monotonic() - inicio
+        with self._lock:
+            self._info[id(conn)]['usos'] += 1
+            self._stats['emprestimos'] += 1
+            self._stats['espera_total'] += espera_s
+            self._stats['espera_max'] = max(self._stats['espera_max'], espera_s)
+        return conn
+
+    def _repassar(self, conn):
+        """
+        Entrega a conexão (ou, com None, uma vaga livre) ao primeiro da fila.
+        Retorna False se ninguém estava esperando. Deve ser chamado com o lock.
+        """
+        if not self._fila:
+            return False
+        espera = self._fila.popleft()
+        if conn is None:
+            self._total += 1  # A vaga passa a pertencer a quem estava esperando
+        espera.conexao = conn
+        espera.evento.set()
+        return True
+
+    def devolver(self, conn):
+        """
+        Devolve a conexão ao pool. Transações deixadas abertas são revertidas;
+        conexões quebradas, expiradas ou devolvidas após fechar o pool são encerradas.
+        """
+        manter = not conn.closed
+        if manter and conn.get_transaction_status() != psycopg2.extensions.TRANSACTION_STATUS_IDLE:
+            try:
+                conn.rollback()
+            except psycopg2.Error:
+                manter = False
+
+        agora = time.monotonic()
+        with self._lock:
+            if manter and not self._fechado and not self._expirada(conn, agora):
+                self._info[id(conn)]['devolvida'] = agora
+                if not self._repassar(conn):
+                    self._ociosas.append(conn)
+            else:
+                if not manter:
+                    self._stats['descartadas'] += 1
+                elif not self._fechado:
+                    self._stats['recicladas'] += 1
+                self._total -= 1
+                self._fechar(conn)
+                if not self._fechado:
+                    self._repassar(None)
+
+    def fechar(self):
+        """
+        Fecha as conexões ociosas; as emprestadas são fechadas quando voltarem.
+        """
+        with self._lock:
+            self._fechado = True
+            while self._ociosas:
+                self._total -= 1
+                self._fechar(self._ociosas.pop())
+            while self._repassar(None):
+                pass
+
+    def estatisticas(self):
+        """
+        Retorna um retrato do pool para monitoramento.
+        """
+        with self._lock:
+            ociosas = len(self._ociosas)
+            stats = dict(self._stats)
+            stats.update(
+                em_uso=self._total - ociosas,
+                ociosas=ociosas,
+                total=self._total,
+                min_conexoes=self.min_conexoes,
+                max_conexoes=self.max_conexoes,
+                espera_media=(stats['espera_total'] / stats['emprestimos']) if stats['emprestimos'] else 0.0,
+            )
+        return stats
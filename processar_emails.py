@@ -0,0 +1,39 @@
+# processar_emails.py
+# Envia a caixa de saída de e-mails (emails.py) num processo separado do servidor web.
+# Útil com EMAILS_ENVIAR=0 nos workers web: o limite de EMAILS_POR_MINUTO passa a valer
+# para o sistema todo, e não por worker.
+#
+# Uso:
+#   python processar_emails.py                  -> envia até Ctrl+C / SIGTERM
+#   python processar_emails.py --repetir-falhas -> devolve à fila os e-mails que falharam
+import signal
+import sys
+import threading
+
+from app import app
+from database import get_db
+from emails import criar_envio, profundidade_caixa, repetir_falhas
+
+
+def enviar():
+    envio = criar_envio(app)
+    parar = threading.Event()
+    signal.signal(signal.SIGTERM, lambda *_: parar.set())
+    print(f"Enviando a caixa de saída de e-mails ({app.config['EMAIL_TRANSPORTE']}).")
+    try:
+        while not parar.wait(60):
+            with app.app_context():
+                print(f"Caixa de saída: {profundidade_caixa(get_db())} | Processo: {envio.estatisticas()}")
+    except KeyboardInterrupt:
+        pass
+    print("Encerrando: esperando o lote em andamento...")
+    envio.encerrar()
+
+
+if __name__ == '__main__':
+    if '--repetir-falhas' in sys.argv:
+        with app.app_context():
+            total = repetir_falhas(get_db(), bool(app.config.get('DATABASE_URL')))
+        print(f"{total} e-mail(s) devolvido(s) à fila.")
+    else:
+        enviar()
@@ -0,0 +1,47 @@
+# processar_tarefas.py
+# Consome a fila de tarefas (tarefas.py) num processo separado do servidor web.
+# Útil com TAREFAS_TRABALHADORES=0 nos workers web, para que uploads pesados não
+# disputem CPU com as requisições.
+#
+# Uso:
+#   python processar_tarefas.py [trabalhadores]  -> consome a fila até Ctrl+C / SIGTERM
+#   python processar_tarefas.py --repetir-falhas -> devolve à fila as tarefas que falharam
+import signal
+import sys
+import threading
+
+from app import app
+from database import get_db
+from tarefas import FilaTarefas, profundidade_fila, repetir_falhas
+
+
+def consumir(trabalhadores):
+    fila = FilaTarefas(
+        app,
+        trabalhadores=trabalhadores,
+        intervalo=app.config['TAREFAS_INTERVALO'],
+        max_tentativas=app.config['TAREFAS_MAX_TENTATIVAS'],
+        espera_base=app.config['TAREFAS_ESPERA_BASE'],
+        travada_apos=app.config['TAREFAS_TRAVADA_APOS'],
+    )
+    parar = threading.Event()
+    signal.signal(signal.SIGTERM, lambda *_: parar.set())
+    print(f"Consumindo a fila de tarefas com {trabalhadores} trabalhador(es).")
+    try:
+        while not parar.wait(60):
+            with app.app_context():
+                print(f"Fila: {profundidade_fila(get_db())} | Processo: {fila.estatisticas()}")
+    except KeyboardInterrupt:
+        pass
+    print("Encerrando: esperando as tarefas em execução...")
+    fila.encerrar()
+
+
+if __name__ == '__main__':
+    if '--repetir-falhas' in sys.argv:
+        with app.app_context():
+            total = repetir_falhas(get_db(), bool(app.config.get('DATABASE_URL')))
+        print(f"{total} tarefa(s) devolvida(s) à fila.")
+    else:
+        argumentos = [a for a in sys.argv[1:] if a.isdigit()]
+        consumir(int(argumentos[0]) if argumentos else max(app.config['TAREFAS_TRABALHADORES'], 1))
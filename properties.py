@@ -1,58 +1,368 @@
 # properties.py
 
-from flask import Blueprint, render_template, request, redirect, url_for, session, jsonify, current_app, flash
-from werkzeug.utils import secure_filename
-import os
+from flask import (Blueprint, render_template, request, redirect, url_for, session, jsonify, current_app, flash, g,
+                   stream_with_context)
 import json
-from database import get_db
-from auth import login_required  # Importa o decorador de login
+import math
+import re
+from database import get_db, somente_leitura
+from imagens import receber_upload, publicar_conteudo, descartar_recebidos, trava_conteudo, tem_derivados, adicionar_fotos, excluir_fotos, fotos_do_imovel, remover_arquivos, url_foto
+from tarefas import enfileirar, acordar_fila
+from cache_paginas import cache_publico, etiquetar, invalidar_paginas
+from geo import (PONTOS_REFERENCIA, BITS_GEOHASH, caixa_do_raio, caixa_do_tile, centro_da_caixa,
+                 coordenadas_validas, faixas_geohash, geohash)
+from extras import chave_valida, mascara_das_chaves, mascara_dos_textos, textos_da_mascara
+from api_json import para_json, codificar_cursor, ler_cursor, comprimir_gzip
+from auth import login_required, obter_identidade  # Importa o decorador de login
 
 # Cria um Blueprint para as rotas de gerenciamento de imóveis
 bp = Blueprint('properties', __name__, url_prefix='/')
 
 # ----- ROTAS DE PÁGINAS DE IMÓVEIS -----
 
-@bp.route('/pesquisa')
-def pesquisa():
+# Valores aceitos pelos filtros da pesquisa. Os extras chegam sem acento pela URL
+# (chaves de extras.EXTRAS) e viram a máscara de bits de imoveis.extras.
+TIPOS_PESQUISA = ('apartamento', 'kitnet', 'casa')
+
+# Consultas das páginas do imóvel e do anunciante (também usadas por verificar_indices.py)
+SQL_DETALHES_IMOVEL = """
+    SELECT imoveis.*, usuarios.nome AS dono, usuarios.telefone AS telefone_dono
+    FROM imoveis
+    JOIN usuarios ON usuarios.id = imoveis.usuario_id
+    WHERE imoveis.id = ?
+"""
+SQL_MEUS_IMOVEIS = """
+    SELECT id, endereco, bairro, valor, tipo,
+           (SELECT caminho FROM fotos WHERE fotos.imovel_id = imoveis.id ORDER BY posicao LIMIT 1) AS capa,
+           ativo
+    FROM imoveis WHERE usuario_id = ?
+"""
+# Só o dono altera: nada acontece se o imóvel não for do usuário
+SQL_EXCLUIR_IMOVEL = 'DELETE FROM imoveis WHERE id = ? AND usuario_id = ? RETURNING id'
+SQL_MUDAR_ATIVO = 'UPDATE imoveis SET ativo = ? WHERE id = ? AND usuario_id = ?'
+
+
+def _ler_numero(valor, conversor):
     """
-    Exibe a página de pesquisa de imóveis, listando todos os imóveis ativos.
+    Converte um parâmetro da URL em número, ignorando valores vazios ou inválidos.
     """
-    db = get_db()
-    rows = db.execute(
-        """
-        SELECT id, tipo, endereco, quartos, valor, inclusos, imagem
-        FROM imoveis
-        WHERE ativo = 1
+    if valor is None or not str(valor).strip():
+        return None
+    try:
+        return conversor(str(valor).replace(',', '.'))
+    except ValueError:
+        return None
+
+
+def _ler_coordenadas(latitude, longitude):
+    """
+    Lê um par latitude/longitude (da URL ou do formulário). Retorna (None, None) se
+    faltar um dos dois ou se estiverem fora da faixa válida.
+    """
+    latitude, longitude = _ler_numero(latitude, float), _ler_numero(longitude, float)
+    if not coordenadas_validas(latitude, longitude):
+        return None, None
+    return latitude, longitude
+
+
+def _ler_filtro_geografico(args):
+    """
+    Busca por proximidade: ?perto=<ponto de referência> ou ?lat=&lng= (ex.: localização
+    do navegador), com ?raio= em km. Retorna {'latitude', 'longitude', 'raio_km'} ou None.
+    """
+    if args.get('perto') in PONTOS_REFERENCIA:
+        _, latitude, longitude = PONTOS_REFERENCIA[args['perto']]
+    else:
+        latitude, longitude = _ler_coordenadas(args.get('lat'), args.get('lng'))
+        if latitude is None:
+            return None
+    raio = _ler_numero(args.get('raio'), float) or current_app.config['PESQUISA_RAIO_PADRAO']
+    raio = max(0.1, min(raio, current_app.config['PESQUISA_RAIO_MAX']))
+    return {'latitude': latitude, 'longitude': longitude, 'raio_km': raio}
+
+
+def _ler_filtros_pesquisa(args):
+    """
+    Lê os filtros da pesquisa a partir da query string (request.args).
+    """
+    return {
+        'busca': (args.get('busca') or '').strip(),
+        'min_valor': _ler_numero(args.get('min_valor'), float),
+        'max_valor': _ler_numero(args.get('max_valor'), float),
+        'tipos': [t for t in args.getlist('tipo') if t in TIPOS_PESQUISA],
+        'quartos': _ler_numero(args.get('quartos'), int),
+        'extras': [e for e in args.getlist('extras') if chave_valida(e)],
+        'perto': args.get('perto') if args.get('perto') in PONTOS_REFERENCIA else '',
+        'geo': _ler_filtro_geografico(args),
+    }
+
+
+def _ler_caixa(args):
+    """
+    Área do mapa em ?sul=&norte=&oeste=&leste= (graus). Retorna (sul, norte, oeste, leste)
+    ou None se faltar algum lado ou a área for inválida.
+    """
+    caixa = tuple(_ler_numero(args.get(lado), float) for lado in ('sul', 'norte', 'oeste', 'leste'))
+    if None in caixa:
+        return None
+    sul, norte, oeste, leste = caixa
+    if not (-90 <= sul < norte <= 90 and -180 <= oeste < leste <= 180):
+        return None
+    return caixa
+
+
+def _ler_limite(args):
+    """
+    Tamanho da página pedido via ?limite=, limitado por PESQUISA_MAX_POR_PAGINA.
+    """
+    limite = _ler_numero(args.get('limite'), int) or current_app.config['PESQUISA_POR_PAGINA']
+    return max(1, min(limite, current_app.config['PESQUISA_MAX_POR_PAGINA']))
+
+
+# Parâmetros da URL que mudam a página de pesquisa (os demais não entram na chave do cache)
+PARAMETROS_PESQUISA = ('busca', 'min_valor', 'max_valor', 'tipo', 'quartos', 'extras',
+                       'perto', 'lat', 'lng', 'raio',
+                       'limite', 'apos_valor', 'apos_relevancia', 'apos_distancia', 'apos_id')
+
+
+def _consulta_textual(busca, postgres):
+    """
+    Converte o texto digitado numa consulta do índice de texto: todas as palavras
+    precisam aparecer, cada uma como prefixo ("parna" encontra "Parnaíba").
+    Só letras e números passam, para que aspas, parênteses etc. não quebrem a sintaxe.
+    Retorna None se não sobrar nenhuma palavra.
+    """
+    termos = re.findall(r'\w+', busca.lower())
+    if not termos:
+        return None
+    if postgres:
+        return ' & '.join(f'{t}:*' for t in termos)
+    return ' '.join(f'"{t}"*' for t in termos)
+
+
+def _filtro_geografico(geo, postgres):
+    """
+    Partes do SQL da busca por proximidade: (origem, params da origem, condições,
+    params das condições, expressão da distância em km, params da expressão).
+    Raio: imóveis a até geo['raio_km'] do ponto. Com geo['caixa'] = (sul, norte, oeste,
+    leste), os imóveis dessa área do mapa; o ponto é o centro dela.
+    """
+    param_placeholder = "%s" if postgres else "?"
+    caixa = geo.get('caixa')
+    if postgres:
+        # earth_box usa o índice GiST; o teste exato vem depois
+        origem = f'imoveis CROSS JOIN ll_to_earth({param_placeholder}, {param_placeholder}) AS centro(ponto)'
+        params_origem = [geo['latitude'], geo['longitude']]
+        distancia = 'earth_distance(centro.ponto, ll_to_earth(imoveis.latitude, imoveis.longitude)) / 1000.0'
+        params_distancia = []
+        condicoes = ['imoveis.latitude IS NOT NULL AND imoveis.longitude IS NOT NULL',
+                     f'earth_box(centro.ponto, {param_placeholder}) @> ll_to_earth(imoveis.latitude, imoveis.longitude)']
+        params = [geo['raio_km'] * 1000]
+    else:
+        # O R*Tree conduz a consulta (CROSS JOIN fixa a ordem no SQLite) filtrando pela caixa;
+        # a distância exata é calculada só para os imóveis dentro dela
+        origem = 'imoveis_geo CROSS JOIN imoveis ON imoveis.id = imoveis_geo.id'
+        params_origem = []
+        distancia = f'distancia_km({param_placeholder}, {param_placeholder}, imoveis.latitude, imoveis.longitude)'
+        params_distancia = [geo['latitude'], geo['longitude']]
+        sul, norte, oeste, leste = caixa or caixa_do_raio(geo['latitude'], geo['longitude'], geo['raio_km'])
+        condicoes = [f'imoveis_geo.max_lat >= {param_placeholder} AND imoveis_geo.min_lat <= {param_placeholder}',
+                     f'imoveis_geo.max_lon >= {param_placeholder} AND imoveis_geo.min_lon <= {param_placeholder}']
+        params = [sul, norte, oeste, leste]
+    if caixa:
+        condicoes.append(f'imoveis.latitude BETWEEN {param_placeholder} AND {param_placeholder}')
+        condicoes.append(f'imoveis.longitude BETWEEN {param_placeholder} AND {param_placeholder}')
+        params.extend(caixa)
+    else:
+        condicoes.append(f'{distancia} <= {param_placeholder}')
+        params.extend([*params_distancia, geo['raio_km']])
+    return origem, params_origem, condicoes, params, distancia, params_distancia
+
+
+def _montar_pesquisa(filtros, limite, apos, postgres):
+    """
+    Monta o SQL de uma página da pesquisa. Retorna (sql, params).
+    - Sem busca textual nem por proximidade: ordem por (valor, id), paginada por chave
+      com apos_valor/apos_id.
+    - Com busca textual: ordem por relevância (índice FTS5 / tsvector), paginada por
+      chave com apos_relevancia/apos_id. A relevância é "menor = melhor" nos dois bancos.
+    - Com busca por proximidade (com ou sem texto): ordem pela distância em km
+      (índice R*Tree / GiST), paginada por chave com apos_distancia/apos_id.
+    """
+    param_placeholder = "%s" if postgres else "?"
+
+    condicoes = ['ativo = 1', 'valor IS NOT NULL']
+    params = []
+    if filtros['min_valor'] is not None:
+        condicoes.append(f'valor >= {param_placeholder}')
+        params.append(filtros['min_valor'])
+    if filtros['max_valor'] is not None:
+        condicoes.append(f'valor <= {param_placeholder}')
+        params.append(filtros['max_valor'])
+    if filtros['tipos']:
+        condicoes.append(f"tipo IN ({', '.join([param_placeholder] * len(filtros['tipos']))})")
+        params.extend(filtros['tipos'])
+    if filtros['quartos'] is not None:
+        condicoes.append(f'quartos >= {param_placeholder}')
+        params.append(filtros['quartos'])
+    if filtros['extras']:
+        # Todos os extras pedidos: os bits deles precisam estar ligados
+        mascara = mascara_das_chaves(filtros['extras'])
+        condicoes.append(f'(extras & {param_placeholder}) = {param_placeholder}')
+        params.extend([mascara, mascara])
+
+    # A capa do card é a primeira foto (busca pela chave primária de fotos)
+    colunas = ('imoveis.id, imoveis.tipo, imoveis.endereco, imoveis.quartos, imoveis.valor, imoveis.extras, '
+               '(SELECT caminho FROM fotos WHERE fotos.imovel_id = imoveis.id ORDER BY posicao LIMIT 1) AS capa, '
+               'imoveis.latitude, imoveis.longitude')
+    consulta = _consulta_textual(filtros['busca'], postgres) if filtros['busca'] else None
+    geo = filtros.get('geo')
+
+    if consulta is None and geo is None:
+        if apos.get('apos_valor') is not None and apos.get('apos_id') is not None:
+            # Equivale a (valor, id) > (apos_valor, apos_id), escrito de forma que o índice
+            # (valor, id) dos imóveis ativos seja usado como intervalo
+            condicoes.append(
+                f'valor >= {param_placeholder} AND (valor > {param_placeholder} OR id > {param_placeholder})')
+            params.extend([apos['apos_valor'], apos['apos_valor'], apos['apos_id']])
+        sql = f"""
+            SELECT {colunas}
+            FROM imoveis
+            WHERE {' AND '.join(condicoes)}
+            ORDER BY valor, id
+            LIMIT {param_placeholder}
         """
-    ).fetchall()
+        return sql, (*params, limite + 1)
+
+    origem = 'imoveis'
+    params_origem = []
+    params_colunas = []
+    condicoes_indice = []  # Condições dos índices de texto/espaciais, na frente das demais
+    params_indice = []
+    if geo is not None:
+        origem, params_origem, condicoes_indice, params_indice, ordem, params_colunas = \
+            _filtro_geografico(geo, postgres)
+        chave = 'distancia'
+    if consulta is not None:
+        if postgres:
+            origem += f" CROSS JOIN to_tsquery('portugues_sem_acento', {param_placeholder}) AS q(consulta)"
+            params_origem.append(consulta)
+            condicoes_indice.append('imoveis.busca @@ q.consulta')
+            relevancia = '-ts_rank(imoveis.busca, q.consulta)::float8'
+        else:
+            if geo is None:
+                origem = 'imoveis_busca JOIN imoveis ON imoveis.id = imoveis_busca.rowid'
+            else:
+                # Ordem por distância: o R*Tree conduz e o FTS5 só confere cada imóvel
+                origem += ' JOIN imoveis_busca ON imoveis_busca.rowid = imoveis.id'
+            condicoes_indice.append(f'imoveis_busca MATCH {param_placeholder}')
+            params_indice.append(consulta)
+            relevancia = 'imoveis_busca.rank'  # bm25 com os pesos configurados em database.py
+        if geo is None:
+            ordem, chave = relevancia, 'relevancia'
+
+    depois = ''
+    params_depois = ()
+    if apos.get(f'apos_{chave}') is not None and apos.get('apos_id') is not None:
+        depois = (f'WHERE {chave} > {param_placeholder} '
+                  f'OR ({chave} = {param_placeholder} AND id > {param_placeholder})')
+        params_depois = (apos[f'apos_{chave}'], apos[f'apos_{chave}'], apos['apos_id'])
+    sql = f"""
+        SELECT * FROM (
+            SELECT {colunas}, {ordem} AS {chave}
+            FROM {origem}
+            WHERE {' AND '.join(condicoes_indice + condicoes)}
+        ) AS resultados
+        {depois}
+        ORDER BY {chave}, id
+        LIMIT {param_placeholder}
+    """
+    return sql, (*params_colunas, *params_origem, *params_indice, *params, *params_depois, limite + 1)
+
+
+def _buscar_imoveis(db, filtros, limite, apos):
+    """
+    Busca uma página de imóveis ativos aplicando os filtros direto no SQL.
+    A paginação é por chave: a próxima página começa depois do último imóvel exibido,
+    então o custo não cresce com o número da página.
+    Retorna a lista de imóveis e os parâmetros da URL da próxima página, ou None.
+    """
+    sql, params = _montar_pesquisa(filtros, limite, apos, bool(current_app.config.get('DATABASE_URL')))
+    cur = db.cursor()
+    # Busca um registro a mais para saber se existe próxima página
+    cur.execute(sql, params)
+    rows = cur.fetchall()
+
     imoveis = []
-    for r in rows:
+    for r in rows[:limite]:
         imoveis.append({
             'id': r['id'],
             'tipo': r['tipo'],
             'quartos': r['quartos'],
             'valor': r['valor'],
             'endereco': r['endereco'],
-            'inclusos': r['inclusos'].split(',') if r['inclusos'] else [],
-            'imagens': r['imagem'].split(',') if r['imagem'] else ['default.jpg'],
+            'inclusos': textos_da_mascara(r['extras']),
+            'capa': r['capa'] or 'default.jpg',
+            'latitude': r['latitude'],
+            'longitude': r['longitude'],
+            'distancia': r['distancia'] if 'distancia' in r.keys() else None,
         })
-    return render_template('pesquisa.html', imoveis=imoveis)
+
+    proximo = None
+    if len(rows) > limite:
+        ultimo = rows[limite - 1]
+        if 'distancia' in ultimo.keys():
+            proximo = {'apos_distancia': ultimo['distancia'], 'apos_id': ultimo['id']}
+        elif 'relevancia' in ultimo.keys():
+            proximo = {'apos_relevancia': ultimo['relevancia'], 'apos_id': ultimo['id']}
+        else:
+            proximo = {'apos_valor': ultimo['valor'], 'apos_id': ultimo['id']}
+    return imoveis, proximo
+
+
+@bp.route('/pesquisa')
+@somente_leitura
+@cache_publico(PARAMETROS_PESQUISA)
+def pesquisa():
+    """
+    Exibe a página de pesquisa de imóveis ativos, filtrada e paginada no servidor.
+    """
+    etiquetar('imoveis')
+    filtros = _ler_filtros_pesquisa(request.args)
+    limite = _ler_limite(request.args)
+    apos = {
+        'apos_valor': _ler_numero(request.args.get('apos_valor'), float),
+        'apos_relevancia': _ler_numero(request.args.get('apos_relevancia'), float),
+        'apos_distancia': _ler_numero(request.args.get('apos_distancia'), float),
+        'apos_id': _ler_numero(request.args.get('apos_id'), int),
+    }
+
+    db = get_db()
+    imoveis, proximo = _buscar_imoveis(db, filtros, limite, apos)
+
+    # Mantém os filtros atuais nos links de paginação
+    args_pagina = request.args.to_dict(flat=False)
+    for chave in apos:
+        args_pagina.pop(chave, None)
+    proxima_url = None
+    if proximo:
+        proxima_url = url_for('properties.pesquisa', **args_pagina, **proximo)
+    primeira_url = url_for('properties.pesquisa', **args_pagina) if apos['apos_id'] is not None else None
+
+    return render_template('pesquisa.html', imoveis=imoveis, filtros=filtros,
+                           proxima_url=proxima_url, primeira_url=primeira_url,
+                           pontos_referencia=PONTOS_REFERENCIA)
 
 
 @bp.route('/detalhes_imovel/<int:id>')
+@somente_leitura
+@cache_publico()
 def detalhes_imovel(id):
     """
     Exibe os detalhes de um imóvel específico.
     """
     db = get_db()
-    r = db.execute(
-        """
-        SELECT imoveis.*, usuarios.nome AS dono, usuarios.telefone AS telefone_dono
-        FROM imoveis
-        JOIN usuarios ON usuarios.id = imoveis.usuario_id
-        WHERE imoveis.id = ?
-        """, (id,)
-    ).fetchone()
+    r = db.execute(SQL_DETALHES_IMOVEL, (id,)).fetchone()
 
     if not r:
         flash('Imóvel não encontrado.', 'danger')
@@ -60,9 +370,11 @@ def detalhes_imovel(id):
         return redirect(url_for('properties.pesquisa'))
 
     apt = dict(r)
-    apt['inclusos'] = apt['inclusos'].split(',') if apt['inclusos'] else []
-    apt['imagens'] = apt['imagem'].split(
-        ',') if apt['imagem'] else ['default.jpg']
+    apt['inclusos'] = textos_da_mascara(apt['extras'])
+    apt['imagens'] = fotos_do_imovel(db, id)
+    # Nome/telefone do dono e fotos ainda em processamento também aparecem na página
+    etiquetar(f'imovel:{id}', f"usuario:{apt['usuario_id']}",
+              *(f'imagem:{nome}' for nome in apt['imagens']))
 
     return render_template(
         'apt.html',
@@ -72,9 +384,62 @@ def detalhes_imovel(id):
         usuario_logado=session.get('usuario_id')
     )
 
+@bp.route('/mapa')
+@cache_publico()
+def mapa():
+    """
+    Mapa com todos os imóveis ativos, carregados por tile de /api/mapa/.
+    """
+    return render_template('mapa.html')
+
 # ----- GERENCIAMENTO DE IMÓVEIS (ANUNCIANTES) -----
 
 
+# Colunas de imoveis preenchidas no cadastro (além de usuario_id), na ordem de converter_imovel
+COLUNAS_CADASTRO = ('endereco', 'bairro', 'numero', 'cep', 'complemento', 'valor', 'quartos', 'banheiros',
+                    'extras', 'outros', 'descricao', 'tipo', 'latitude', 'longitude', 'geohash')
+
+
+def _extras_e_outros(outros, inclusos):
+    """
+    (máscara dos extras, texto de `outros`): o que não é um extra conhecido vai para `outros`.
+    """
+    extras, outros_inclusos = mascara_dos_textos(inclusos)
+    return extras, ', '.join(filter(None, [outros or '', *outros_inclusos]))
+
+
+def converter_imovel(campos, inclusos):
+    """
+    Converte os campos do cadastro (do formulário ou de uma linha importada por
+    imoveis_em_lote.py) nos valores de COLUNAS_CADASTRO, como tupla.
+    Levanta ValueError com a mensagem do primeiro campo inválido.
+    """
+    def numero(nome, conversor):
+        valor = campos.get(nome)
+        try:
+            convertido = conversor(str(valor).strip().replace(',', '.'))
+        except (TypeError, ValueError):
+            raise ValueError(f'{nome} inválido: {valor!r}')
+        if not math.isfinite(convertido):
+            raise ValueError(f'{nome} inválido: {valor!r}')
+        return convertido
+
+    valor = numero('valor', float)
+    quartos = numero('quartos', int)
+    banheiros = numero('banheiros', int)
+    if campos.get('tipo') not in TIPOS_PESQUISA:
+        raise ValueError(f"tipo inválido: {campos.get('tipo')!r}")
+    # Posição (opcional); sem ela o imóvel não aparece na busca por proximidade nem no mapa
+    latitude, longitude = _ler_coordenadas(campos.get('latitude'), campos.get('longitude'))
+    return (
+        *[campos.get(k) for k in ('endereco', 'bairro', 'numero', 'cep', 'complemento')],
+        valor, quartos, banheiros,
+        *_extras_e_outros(campos.get('outros'), inclusos),
+        campos.get('descricao') or '', campos['tipo'],
+        latitude, longitude, geohash(latitude, longitude),
+    )
+
+
 @bp.route('/cadastro_imovel', methods=['GET', 'POST'])
 @login_required
 def cadastro_imovel():
@@ -82,11 +447,10 @@ def cadastro_imovel():
     Permite que anunciantes cadastrem novos imóveis.
     Verifica se o usuário logado é um 'anunciante'.
     """
-    db = get_db()
     user_id = session.get('usuario_id')
-    tipo = db.execute('SELECT tipo_usuario FROM usuarios WHERE id = ?',
-                      (user_id,)).fetchone()[0]
-    if tipo != 'anunciante':
+    # Tipo lido do banco, não do cache por worker (pode estar até USUARIO_CACHE_TTL atrasado)
+    g.usuario = obter_identidade(user_id, atual=True)
+    if not g.usuario or g.usuario['tipo_usuario'] != 'anunciante':
         flash('Apenas anunciantes podem cadastrar imóveis.', 'warning')
         return redirect(url_for('index'))  # Redireciona para a página inicial
 
@@ -94,55 +458,86 @@ def cadastro_imovel():
         data = request.form.to_dict()
         inclusos = request.form.getlist('inclusos')
         files = request.files.getlist('fotos')
-        nomes = []
-        for f in files:
-            if f.filename:
-                fn = secure_filename(f.filename)
-                path = os.path.join(current_app.config['UPLOAD_FOLDER'], fn)
-                f.save(path)
-                nomes.append(fn)
-        if not nomes:
-            nomes = ['default.jpg']  # Imagem padrão se nenhuma for enviada
-
         try:
-            db.execute(
-                '''INSERT INTO imoveis (endereco, bairro, numero, cep, complemento,
-                                        valor, quartos, banheiros, inclusos,
-                                        outros, descricao, imagem, tipo, usuario_id)
-                   VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)''',
-                (*[data.get(k) for k in ['endereco', 'bairro', 'numero', 'cep', 'complemento']],
-                 # Converte valor para float
-                 float(data['valor'].replace(',', '.')),
-                 int(data['quartos']), int(data['banheiros']),
-                 ','.join(inclusos), data.get(
-                     'outros', ''), data.get('descricao', ''),
-                 ','.join(nomes), data['tipo'], user_id)
-            )
-            db.commit()
-            flash('Imóvel cadastrado com sucesso!', 'success')
-            return redirect(url_for('properties.meus_imoveis'))
-        except Exception as e:
+            # Valor e quartos com vírgula ou ponto; a posição vem do mapa do formulário.
+            # Conferido antes de gravar as fotos: um formulário recusado não deixa arquivos.
+            valores = converter_imovel(data, inclusos)
+        except ValueError as e:
             flash(f'Erro ao cadastrar imóvel: {e}', 'danger')
-            current_app.logger.error(
-                f"Erro ao cadastrar imóvel: {e}")  # Loga o erro
+            current_app.logger.error(f"Erro ao cadastrar imóvel: {e}")  # Loga o erro
+            return render_template('cadastro_imovel.html')
+
+        # Cópia e hash das fotos fora da trava: um upload grande não segura os demais
+        recebidos = []
+        try:
+            for f in files:
+                if f.filename:
+                    recebidos.append(receber_upload(f))
+        except Exception:
+            descartar_recebidos(recebidos)
+            raise
+
+        novas = []
+        # Uma exclusão simultânea não apaga as fotos reaproveitadas até o commit (imagens.py)
+        with trava_conteudo():
+            nomes = []
+            try:
+                for temporario, digest, nome_arquivo in recebidos:
+                    # Nome pelo hash do conteúdo: fotos iguais são gravadas uma vez só.
+                    # Só o arquivo original é gravado aqui; os derivados ficam para a fila.
+                    fn, nova = publicar_conteudo(temporario, digest, nome_arquivo)
+                    if nova:
+                        novas.append(fn)
+                    nomes.append(fn)
+            except Exception:
+                descartar_recebidos(recebidos)
+                raise
+            # Sem fotos o anúncio mostra default.jpg (fotos_do_imovel)
+
+            db = get_db()
+            try:
+                # Tamanhos de card/galeria/tela cheia em WebP e JPEG, sem EXIF (imagens.py).
+                # Até ficarem prontos, o anúncio mostra "Processando foto..." no lugar da foto.
+                # Vale também para fotos reaproveitadas ainda sem derivados (a tarefa é idempotente).
+                for fn in dict.fromkeys(nomes):
+                    if not tem_derivados(fn):
+                        enfileirar(db, 'derivados', {'imagem': fn})
+                invalidar_paginas(db, 'imoveis')
+                imovel_id = db.execute(
+                    f'''INSERT INTO imoveis ({', '.join(COLUNAS_CADASTRO)}, usuario_id)
+                        VALUES ({', '.join(['?'] * (len(COLUNAS_CADASTRO) + 1))})
+                        RETURNING id''',
+                    (*valores, user_id)
+                ).fetchone()[0]
+                adicionar_fotos(db, imovel_id, nomes)
+                db.commit()
+                acordar_fila()
+                flash('Imóvel cadastrado com sucesso!', 'success')
+                return redirect(url_for('properties.meus_imoveis'))
+            except Exception as e:
+                db.rollback()
+                flash(f'Erro ao cadastrar imóvel: {e}', 'danger')
+                current_app.logger.error(
+                    f"Erro ao cadastrar imóvel: {e}")  # Loga o erro
+        # Fotos gravadas agora e que ficaram sem imóvel (fora da trava: remover_arquivos a usa)
+        remover_arquivos(novas)
     return render_template('cadastro_imovel.html')
 
 
 @bp.route('/meus_imoveis')
+@somente_leitura
 @login_required
 def meus_imoveis():
     """
     Exibe a lista de imóveis cadastrados pelo usuário logado.
     """
     db = get_db()
-    rows = db.execute(
-        'SELECT id, endereco, bairro, valor, tipo, imagem, ativo FROM imoveis WHERE usuario_id = ?',
-        (session['usuario_id'],)
-    ).fetchall()
+    rows = db.execute(SQL_MEUS_IMOVEIS, (session['usuario_id'],)).fetchall()
     return render_template('meus_imoveis.html', imoveis=rows)
 
 
 @bp.route('/editar_imovel/<int:id>', methods=['GET'])
+@somente_leitura
 @login_required
 def editar_imovel(id):
     """
@@ -167,10 +562,13 @@ def excluir_imovel(id):
     """
     db = get_db()
     # Só permite exclusão se o imóvel pertence ao usuário logado
-    cursor = db.execute('DELETE FROM imoveis WHERE id = ? AND usuario_id = ?',
-                        (id, session['usuario_id']))
+    excluidos = db.execute(SQL_EXCLUIR_IMOVEL, (id, session['usuario_id'])).fetchall()
+    orfas = excluir_fotos(db, [r['id'] for r in excluidos])
+    if excluidos:
+        invalidar_paginas(db, 'imoveis', f'imovel:{id}')
     db.commit()
-    if cursor.rowcount > 0:
+    remover_arquivos(orfas)
+    if excluidos:
         flash('Imóvel excluído com sucesso!', 'success')
     else:
         flash('Imóvel não encontrado ou você não tem permissão para excluí-lo.', 'danger')
@@ -184,8 +582,9 @@ def parar_anuncio(id):
     Desativa um anúncio de imóvel. Apenas o proprietário pode desativá-lo.
     """
     db = get_db()
-    cursor = db.execute('UPDATE imoveis SET ativo = 0 WHERE id = ? AND usuario_id = ?',
-                        (id, session['usuario_id']))
+    cursor = db.execute(SQL_MUDAR_ATIVO, (0, id, session['usuario_id']))
+    if cursor.rowcount > 0:
+        invalidar_paginas(db, 'imoveis', f'imovel:{id}')
     db.commit()
     if cursor.rowcount > 0:
         flash('Anúncio desativado com sucesso!', 'success')
@@ -201,8 +600,9 @@ def ativar_anuncio(id):
     Ativa um anúncio de imóvel. Apenas o proprietário pode ativá-lo.
     """
     db = get_db()
-    cursor = db.execute('UPDATE imoveis SET ativo = 1 WHERE id = ? AND usuario_id = ?',
-                        (id, session['usuario_id']))
+    cursor = db.execute(SQL_MUDAR_ATIVO, (1, id, session['usuario_id']))
+    if cursor.rowcount > 0:
+        invalidar_paginas(db, 'imoveis', f'imovel:{id}')
     db.commit()
     if cursor.rowcount > 0:
         flash('Anúncio ativado com sucesso!', 'success')
@@ -212,8 +612,222 @@ def ativar_anuncio(id):
 
 # ----- ROTAS API JSON -----
 
+# Parâmetros da URL que mudam a resposta de /api/imoveis/proximos
+PARAMETROS_PROXIMOS = PARAMETROS_PESQUISA + ('sul', 'norte', 'oeste', 'leste')
+
+
+@bp.route('/api/imoveis/proximos')
+@somente_leitura
+@cache_publico(PARAMETROS_PROXIMOS)
+def api_imoveis_proximos():
+    """
+    API pública dos imóveis ativos perto de um ponto (?perto= ou ?lat=&lng=, com ?raio=
+    em km) ou dentro de uma área do mapa (?sul=&norte=&oeste=&leste=), do mais próximo
+    ao mais distante (na área, do centro dela). Aceita os filtros da pesquisa e pagina
+    com os parâmetros devolvidos em 'proximo'.
+    """
+    etiquetar('imoveis')
+    filtros = _ler_filtros_pesquisa(request.args)
+    caixa = _ler_caixa(request.args)
+    if caixa:
+        latitude, longitude, raio = centro_da_caixa(*caixa)
+        filtros['geo'] = {'latitude': latitude, 'longitude': longitude, 'raio_km': raio, 'caixa': caixa}
+    elif filtros['geo'] is None:
+        return jsonify({'erro': 'Informe perto, lat e lng ou a área (sul, norte, oeste, leste)'}), 400
+    limite = _ler_numero(request.args.get('limite'), int) or current_app.config['PESQUISA_POR_PAGINA']
+    limite = max(1, min(limite, current_app.config['PESQUISA_MAX_PROXIMOS']))
+    apos = {
+        'apos_distancia': _ler_numero(request.args.get('apos_distancia'), float),
+        'apos_id': _ler_numero(request.args.get('apos_id'), int),
+    }
+
+    imoveis, proximo = _buscar_imoveis(get_db(), filtros, limite, apos)
+    return jsonify({
+        'imoveis': [{
+            'id': apt['id'],
+            'tipo': apt['tipo'],
+            'endereco': apt['endereco'],
+            'quartos': apt['quartos'],
+            'valor': apt['valor'],
+            'latitude': apt['latitude'],
+            'longitude': apt['longitude'],
+            'distancia_km': round(apt['distancia'], 3),
+            'url': url_for('properties.detalhes_imovel', id=apt['id']),
+        } for apt in imoveis],
+        'proximo': proximo,
+    })
+
+
+# Campos de cada imóvel na resposta de /api/imoveis, escolhidos via ?campos= (ou ?fields=)
+CAMPOS_API = {
+    'id': lambda r: r['id'],
+    'tipo': lambda r: r['tipo'],
+    'endereco': lambda r: r['endereco'],
+    'quartos': lambda r: r['quartos'],
+    'valor': lambda r: r['valor'],
+    'inclusos': lambda r: textos_da_mascara(r['extras']),
+    'foto': lambda r: url_foto(r['capa']),
+    'latitude': lambda r: r['latitude'],
+    'longitude': lambda r: r['longitude'],
+    'distancia_km': lambda r: round(r['distancia'], 3),  # Só na busca por proximidade
+    'url': lambda r: url_for('properties.detalhes_imovel', id=r['id']),
+}
+# Chaves de paginação guardadas no cursor (as mesmas apos_* da página de pesquisa)
+CHAVES_CURSOR = ('apos_valor', 'apos_relevancia', 'apos_distancia', 'apos_id')
+# Parâmetros da URL que mudam a resposta de /api/imoveis: os filtros da pesquisa,
+# com o cursor no lugar dos apos_*
+PARAMETROS_API = tuple(p for p in PARAMETROS_PESQUISA if p not in CHAVES_CURSOR) + ('campos', 'fields', 'cursor')
+# Linhas lidas do banco por vez ao montar a resposta
+LOTE_API = 50
+
+
+def _ler_campos_api(args, geo):
+    """
+    Campos pedidos, na ordem de CAMPOS_API. Retorna (campos, desconhecidos).
+    Sem ?campos=, todos (distancia_km só na busca por proximidade).
+    """
+    pedidos = [c.strip() for c in (args.get('campos') or args.get('fields') or '').split(',') if c.strip()]
+    if not pedidos:
+        return [c for c in CAMPOS_API if geo is not None or c != 'distancia_km'], []
+    desconhecidos = [c for c in pedidos if c not in CAMPOS_API]
+    return [c for c in CAMPOS_API if c in pedidos], desconhecidos
+
+
+def _partes_api(cur, campos, geo, limite):
+    """
+    Gera o JSON de /api/imoveis em pedaços, um por lote de linhas do cursor, sem montar
+    a lista inteira de imóveis em memória. O SQL traz limite + 1 linhas: a sobra indica
+    que existe próxima página.
+    """
+    extrair = [(c, CAMPOS_API[c] if geo is not None or c != 'distancia_km' else (lambda r: None))
+               for c in campos]
+    yield b'{"imoveis":['
+    enviados = 0
+    ultimo = None
+    while enviados < limite:
+        rows = cur.fetchmany(min(LOTE_API, limite - enviados))
+        if not rows:
+            break
+        itens = [para_json({c: f(r) for c, f in extrair}) for r in rows]
+        yield (b',' if enviados else b'') + b','.join(itens)
+        enviados += len(rows)
+        ultimo = rows[-1]
+
+    proximo = None
+    if enviados == limite and cur.fetchone() is not None:
+        if geo is not None:
+            chave = 'distancia'
+        elif 'relevancia' in ultimo.keys():
+            chave = 'relevancia'
+        else:
+            chave = 'valor'
+        proximo = codificar_cursor({f'apos_{chave}': ultimo[chave], 'apos_id': ultimo['id']})
+    yield b'],"proximo":' + para_json(proximo) + b'}'
+
+
+@bp.route('/api/imoveis')
+@somente_leitura
+@comprimir_gzip
+@cache_publico(PARAMETROS_API, anonima=True)
+def api_imoveis():
+    """
+    API pública de pesquisa, somente leitura: os filtros de /pesquisa, ?campos=id,valor,...
+    para escolher os campos e ?cursor= com o valor de 'proximo' da página anterior.
+    Páginas de até API_STREAMING_ACIMA imóveis ficam no cache de páginas e respondem
+    304 com If-None-Match; as maiores são enviadas aos poucos. Gzip se o cliente aceitar.
+    """
+    etiquetar('imoveis')
+    filtros = _ler_filtros_pesquisa(request.args)
+    campos, desconhecidos = _ler_campos_api(request.args, filtros['geo'])
+    if desconhecidos or not campos:
+        return jsonify({'erro': f"Campos desconhecidos: {', '.join(desconhecidos)}",
+                        'campos': list(CAMPOS_API)}), 400
+    limite = _ler_numero(request.args.get('limite'), int) or current_app.config['PESQUISA_POR_PAGINA']
+    limite = max(1, min(limite, current_app.config['API_MAX_POR_PAGINA']))
+    apos = {}
+    if request.args.get('cursor'):
+        apos = ler_cursor(request.args['cursor'], CHAVES_CURSOR)
+        if apos is None:
+            return jsonify({'erro': 'Cursor inválido'}), 400
+
+    sql, params = _montar_pesquisa(filtros, limite, apos, bool(current_app.config.get('DATABASE_URL')))
+    cur = get_db().cursor()
+    cur.execute(sql, params)
+    partes = _partes_api(cur, campos, filtros['geo'], limite)
+    if limite > current_app.config['API_STREAMING_ACIMA']:
+        # stream_with_context mantém a requisição (e a conexão do banco) até o fim do envio
+        return current_app.response_class(stream_with_context(partes), mimetype='application/json')
+    return current_app.response_class(b''.join(partes), mimetype='application/json')
+
+
+# Zoom máximo dos tiles do mapa (o mesmo dos tiles do OpenStreetMap)
+MAPA_ZOOM_MAX = 19
+# Cada tile é dividido em 2**MAPA_DIVISOES células de longitude (e o dobro de latitude,
+# no máximo): os imóveis de uma mesma célula viram um único marcador
+MAPA_DIVISOES = 2
+
+
+def _montar_tile(z, x, y, postgres):
+    """
+    Monta o SQL que agrupa os imóveis ativos do tile pelas células do geohash: para
+    cada célula, a quantidade, o centro (média das posições) e a faixa de preço.
+    A consulta lê só o índice idx_imoveis_mapa, nos intervalos de geohash que cobrem
+    o tile. Retorna (sql, params).
+    """
+    param_placeholder = "%s" if postgres else "?"
+    sul, norte, oeste, leste = caixa_do_tile(z, x, y)
+    # Células de agrupamento e, para a busca no índice, células maiores que o tile
+    bits = min(2 * (z + MAPA_DIVISOES), BITS_GEOHASH)
+    faixas = faixas_geohash(sul, norte, oeste, leste, max(2 * (z - 1), 0))
+    celula = f'geohash / {1 << (BITS_GEOHASH - bits)}'
+    sql = f"""
+        SELECT {celula} AS celula, COUNT(*) AS quantidade,
+               AVG(latitude) AS latitude, AVG(longitude) AS longitude,
+               MIN(valor) AS valor_min, MAX(valor) AS valor_max, MIN(id) AS id
+        FROM imoveis
+        WHERE ativo = 1 AND geohash IS NOT NULL
+          AND ({' OR '.join([f'(geohash >= {param_placeholder} AND geohash < {param_placeholder})'] * len(faixas))})
+          AND latitude >= {param_placeholder} AND latitude < {param_placeholder}
+          AND longitude >= {param_placeholder} AND longitude < {param_placeholder}
+        GROUP BY {celula}
+    """
+    params = [limite for faixa in faixas for limite in faixa] + [sul, norte, oeste, leste]
+    return sql, params
+
+
+@bp.route('/api/mapa/<int:z>/<int:x>/<int:y>.json')
+@somente_leitura
+@cache_publico(anonima=True)
+def api_mapa_tile(z, x, y):
+    """
+    API pública dos marcadores do mapa de imóveis, por tile (z/x/y como nos tiles do
+    OpenStreetMap). Imóveis próximos vêm agrupados; um grupo de um imóvel só traz o
+    id e o link. Cada tile fica no cache de páginas até algum imóvel mudar.
+    """
+    if z > MAPA_ZOOM_MAX or x >= 1 << z or y >= 1 << z:
+        return jsonify({'erro': 'Tile inválido'}), 404
+    etiquetar('imoveis')
+    sql, params = _montar_tile(z, x, y, bool(current_app.config.get('DATABASE_URL')))
+    cur = get_db().cursor()
+    cur.execute(sql, params)
+    grupos = []
+    for r in cur.fetchall():
+        grupo = {
+            'quantidade': r['quantidade'],
+            'latitude': r['latitude'],
+            'longitude': r['longitude'],
+            'valor_min': r['valor_min'],
+            'valor_max': r['valor_max'],
+        }
+        if r['quantidade'] == 1:
+            grupo['id'] = r['id']
+            grupo['url'] = url_for('properties.detalhes_imovel', id=r['id'])
+        grupos.append(grupo)
+    return jsonify({'grupos': grupos})
+
 
 @bp.route('/api/imovel/<int:id>')
+@somente_leitura
 @login_required
 def api_get_imovel(id):
     """
@@ -238,10 +852,12 @@ def api_get_imovel(id):
         'valor': imovel['valor'],
         'quartos': imovel['quartos'],
         'banheiros': imovel['banheiros'],
-        'inclusos': imovel['inclusos'].split(',') if imovel['inclusos'] else [],
+        'inclusos': textos_da_mascara(imovel['extras']),
         'outros': imovel['outros'],
         'descricao': imovel['descricao'],
-        'fotos': imovel['imagem'].split(',') if imovel['imagem'] else []
+        'fotos': [f for f in fotos_do_imovel(db, id) if f != 'default.jpg'],
+        'latitude': imovel['latitude'],
+        'longitude': imovel['longitude']
     })
 
 
@@ -262,11 +878,14 @@ def atualizar_imovel(id):
     except json.JSONDecodeError:
         return jsonify({'erro': 'Erro ao decodificar JSON'}), 400
 
+    # Como no cadastro: extras que não são conhecidos vão para `outros`
+    extras, outros = _extras_e_outros(dados.get('outros'), dados.get('inclusos', []))
+
     db = get_db()
     cursor = db.execute('''
         UPDATE imoveis
         SET tipo = ?, endereco = ?, bairro = ?, numero = ?, cep = ?, complemento = ?, valor = ?,
-            quartos = ?, banheiros = ?, inclusos = ?, outros = ?, descricao = ?
+            quartos = ?, banheiros = ?, extras = ?, outros = ?, descricao = ?
         WHERE id = ? AND usuario_id = ?
     ''', (
         dados.get('tipo'),
@@ -278,12 +897,14 @@ def atualizar_imovel(id):
         dados.get('valor'),
         dados.get('quartos'),
         dados.get('banheiros'),
-        ','.join(dados.get('inclusos', [])),
-        dados.get('outros'),
+        extras,
+        outros,
         dados.get('descricao'),
         id,
         session['usuario_id']
     ))
+    if cursor.rowcount > 0:
+        invalidar_paginas(db, 'imoveis', f'imovel:{id}')
     db.commit()
     if cursor.rowcount > 0:
         return jsonify({'mensagem': 'Imóvel atualizado com sucesso!'}), 200
@@ -0,0 +1,57 @@
+# relatorio_sql.py
+# Relatório do perfil das consultas SQL (perfil_sql.py), juntando os retratos que os
+# workers gravam em PERFIL_SQL_PASTA. É o mesmo conteúdo de /admin/consultas.
+#
+# Uso:
+#   python relatorio_sql.py             -> tabelas no terminal
+#   python relatorio_sql.py --top 50    -> mais linhas em cada tabela
+#   python relatorio_sql.py --json      -> o relatório em JSON (para guardar ou comparar)
+import argparse
+import json
+
+from app import app
+from perfil_sql import ler_relatorio
+
+
+def _encurtar(texto, largura=90):
+    return texto if len(texto) <= largura else texto[:largura - 3] + '...'
+
+
+def imprimir(relatorio):
+    print(f"Workers: {relatorio['workers']} | Desde: {relatorio['desde'] or '-'}")
+
+    print('\nConsultas que mais somam tempo:')
+    print(f"{'total ms':>10} {'chamadas':>9} {'média ms':>9} {'máx ms':>9}  consulta")
+    for c in relatorio['consultas']:
+        print(f"{c['tempo_total_ms']:>10.1f} {c['chamadas']:>9} {c['tempo_medio_ms']:>9.2f} "
+              f"{c['tempo_max_ms']:>9.1f}  {_encurtar(c['impressao'])}")
+
+    print('\nRequisições que mais gastaram tempo em SQL:')
+    for r in relatorio['requisicoes']:
+        print(f"{r['tempo_ms']:>10.1f} ms  {r['consultas']:>4} consulta(s)  {r['endpoint']} {r['caminho']} ({r['quando']})")
+        for p in r['principais']:
+            print(f"{'':>14}{p['tempo_ms']:>8.1f} ms {p['chamadas']:>4}x  {_encurtar(p['impressao'], 70)}")
+
+    print('\nConsultas lentas:')
+    for l in relatorio['lentas']:
+        print(f"{l['quando']}  {l['duracao_ms']:.1f} ms  {_encurtar(l['impressao'])}")
+        for linha in (l['plano'] or '').splitlines():
+            print(f"    {linha}")
+
+    print('\nPossíveis N+1:')
+    for s in relatorio['suspeitas_n_mais_1']:
+        print(f"{s['quando']}  {s['chamadas']}x ({s['tempo_ms']:.1f} ms)  {s['endpoint']} {s['caminho']}: "
+              f"{_encurtar(s['impressao'], 60)}")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Relatório do perfil das consultas SQL.')
+    parser.add_argument('--top', type=int, default=app.config['PERFIL_SQL_TOP'], help='linhas por tabela')
+    parser.add_argument('--json', action='store_true', help='imprime o relatório em JSON')
+    args = parser.parse_args()
+
+    relatorio = ler_relatorio(app.config['PERFIL_SQL_PASTA'], args.top)
+    if args.json:
+        print(json.dumps(relatorio, ensure_ascii=False, indent=2))
+    else:
+        imprimir(relatorio)
@@ -1,11 +1,24 @@
 document.addEventListener("DOMContentLoaded", () => {
     const mainImg = document.getElementById("current-img");
+    const mainSource = mainImg.closest("picture")?.querySelector("source");
     const thumbs = document.querySelectorAll(".thumbs img");
 
     thumbs.forEach((thumb) => {
         thumb.addEventListener("click", () => {
-            const newSrc = thumb.getAttribute("src");
-            mainImg.setAttribute("src", newSrc);
+            // As fotos vêm em <picture> com srcset (WebP + JPEG): copiamos as listas de
+            // tamanhos e o atributo sizes da foto principal escolhe o tamanho de galeria
+            const thumbSource = thumb.closest("picture")?.querySelector("source");
+            if (mainSource && thumbSource) {
+                mainSource.setAttribute("srcset", thumbSource.getAttribute("srcset"));
+            } else if (mainSource) {
+                mainSource.removeAttribute("srcset"); // <source> sem srcset é ignorado
+            }
+            if (thumb.hasAttribute("srcset")) {
+                mainImg.setAttribute("srcset", thumb.getAttribute("srcset"));
+            } else {
+                mainImg.removeAttribute("srcset");
+            }
+            mainImg.setAttribute("src", thumb.getAttribute("src"));
         });
     });
 });
@@ -0,0 +1,29 @@
+// localizacao.js
+// Mapa do cadastro de imóvel: o clique marca a posição gravada em latitude/longitude,
+// usada na busca por proximidade da pesquisa.
+document.addEventListener('DOMContentLoaded', function () {
+  const elemento = document.getElementById('mapaLocalizacao');
+  const latitude = document.getElementById('latitudeInput');
+  const longitude = document.getElementById('longitudeInput');
+  if (!elemento || !latitude || !longitude || typeof L === 'undefined') {
+    return;
+  }
+
+  const parnaiba = [-2.9086316915186963, -41.76884957507456];
+  const map = L.map(elemento).setView(parnaiba, 14);
+  L.tileLayer('https://{s}.tile.openstreetmap.org/{z}/{x}/{y}.png', {
+    attribution: '© OpenStreetMap contributors'
+  }).addTo(map);
+
+  let marcador = null;
+  map.on('click', function (evento) {
+    const posicao = evento.latlng;
+    if (marcador) {
+      marcador.setLatLng(posicao);
+    } else {
+      marcador = L.marker(posicao).addTo(map);
+    }
+    latitude.value = posicao.lat.toFixed(6);
+    longitude.value = posicao.lng.toFixed(6);
+  });
+});
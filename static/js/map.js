@@ -1,15 +1,30 @@
 // map.js
 document.addEventListener("DOMContentLoaded", () => {
-  const coords = [-2.9086316915186963, -41.76884957507456]; // Parnaíba, PI
-  const map = L.map('map').setView(coords, 17);
+  const elemento = document.getElementById('map');
+  if (!elemento) {
+    return;
+  }
+  const latitude = parseFloat(elemento.dataset.latitude);
+  const longitude = parseFloat(elemento.dataset.longitude);
+  const temPosicao = !isNaN(latitude) && !isNaN(longitude);
+  // Sem posição cadastrada mostra a cidade, sem marcador
+  const coords = temPosicao ? [latitude, longitude] : [-2.9086316915186963, -41.76884957507456]; // Parnaíba, PI
+  const map = L.map(elemento).setView(coords, temPosicao ? 17 : 13);
 
   L.tileLayer('https://{s}.tile.openstreetmap.org/{z}/{x}/{y}.png', {
     attribution: '© OpenStreetMap contributors'
   }).addTo(map);
 
+  if (!temPosicao) {
+    return;
+  }
+
+  // textContent: o endereço é texto do anunciante, não HTML
+  const popup = document.createElement('span');
+  popup.textContent = elemento.dataset.endereco || 'Imóvel';
   L.marker(coords)
     .addTo(map)
-    .bindPopup('Condomínio em Parnaíba')
+    .bindPopup(popup)
     .openPopup();
 
   L.circle(coords, {
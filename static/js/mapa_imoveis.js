@@ -0,0 +1,121 @@
+// mapa_imoveis.js
+// Mapa com todos os imóveis ativos. Os marcadores vêm agrupados pelo servidor, um
+// JSON por tile (/api/mapa/z/x/y.json): mover o mapa só busca os tiles que faltam.
+document.addEventListener('DOMContentLoaded', function () {
+  const elemento = document.getElementById('mapaImoveis');
+  if (!elemento || typeof L === 'undefined') {
+    return;
+  }
+  // URL do tile 0/0/0, usada como modelo para os demais
+  const modelo = elemento.dataset.tiles;
+  const ZOOM_MAX = 19;
+
+  const map = L.map(elemento).setView([-2.9086316915186963, -41.76884957507456], 13); // Parnaíba, PI
+  L.tileLayer('https://{s}.tile.openstreetmap.org/{z}/{x}/{y}.png', {
+    maxZoom: ZOOM_MAX,
+    attribution: '© OpenStreetMap contributors'
+  }).addTo(map);
+
+  const camada = L.layerGroup().addTo(map);
+  const carregados = new Map(); // 'z/x/y' -> Promise com os grupos do tile
+  let zoomDesenhado = null;
+  let geracao = 0; // Muda quando a camada é limpa: tiles que chegarem depois são descartados
+  const desenhados = new Set();
+
+  function urlDoTile(z, x, y) {
+    return modelo.replace('/0/0/0.json', `/${z}/${x}/${y}.json`);
+  }
+
+  function formatarValor(valor) {
+    return 'R$ ' + Number(valor).toLocaleString('pt-BR', { minimumFractionDigits: 2, maximumFractionDigits: 2 });
+  }
+
+  function popup(grupo) {
+    const conteudo = document.createElement('div');
+    if (grupo.quantidade === 1) {
+      const link = document.createElement('a');
+      link.href = grupo.url;
+      link.textContent = `${formatarValor(grupo.valor_min)} - ver imóvel`;
+      conteudo.appendChild(link);
+    } else {
+      const faixa = grupo.valor_min === grupo.valor_max
+        ? formatarValor(grupo.valor_min)
+        : `${formatarValor(grupo.valor_min)} a ${formatarValor(grupo.valor_max)}`;
+      conteudo.textContent = `${grupo.quantidade} imóveis, ${faixa}. Aproxime para ver cada um.`;
+    }
+    return conteudo;
+  }
+
+  function desenhar(grupos) {
+    grupos.forEach(function (grupo) {
+      const posicao = [grupo.latitude, grupo.longitude];
+      let marcador;
+      if (grupo.quantidade === 1) {
+        marcador = L.marker(posicao);
+      } else {
+        const tamanho = Math.min(24 + 6 * Math.log2(grupo.quantidade), 60);
+        marcador = L.marker(posicao, {
+          icon: L.divIcon({
+            className: 'grupo-mapa',
+            html: String(grupo.quantidade),
+            iconSize: [tamanho, tamanho]
+          })
+        });
+        marcador.on('dblclick', function () {
+          map.setView(posicao, Math.min(map.getZoom() + 2, ZOOM_MAX));
+        });
+      }
+      marcador.bindPopup(popup(grupo)).addTo(camada);
+    });
+  }
+
+  function atualizar() {
+    const z = Math.min(Math.round(map.getZoom()), ZOOM_MAX);
+    if (z !== zoomDesenhado) {
+      camada.clearLayers();
+      desenhados.clear();
+      zoomDesenhado = z;
+      geracao++;
+    }
+    const limites = map.getBounds();
+    const n = Math.pow(2, z);
+    const tileX = (lng) => Math.floor((lng + 180) / 360 * n);
+    const tileY = (lat) => {
+      const rad = lat * Math.PI / 180;
+      return Math.floor((1 - Math.log(Math.tan(rad) + 1 / Math.cos(rad)) / Math.PI) / 2 * n);
+    };
+    const limitar = (v) => Math.max(0, Math.min(n - 1, v));
+    const x0 = limitar(tileX(limites.getWest())), x1 = limitar(tileX(limites.getEast()));
+    const y0 = limitar(tileY(limites.getNorth())), y1 = limitar(tileY(limites.getSouth()));
+
+    const desta = geracao;
+    for (let x = x0; x <= x1; x++) {
+      for (let y = y0; y <= y1; y++) {
+        const chave = `${z}/${x}/${y}`;
+        if (desenhados.has(chave)) {
+          continue;
+        }
+        desenhados.add(chave);
+        if (!carregados.has(chave)) {
+          carregados.set(chave, fetch(urlDoTile(z, x, y))
+            .then(resposta => resposta.ok ? resposta.json() : { grupos: [] })
+            .then(dados => dados.grupos)
+            .catch(function (erro) {
+              console.error('Erro ao carregar o mapa:', erro);
+              carregados.delete(chave);
+              return [];
+            }));
+        }
+        carregados.get(chave).then(function (grupos) {
+          // O zoom pode ter mudado enquanto o tile carregava
+          if (geracao === desta) {
+            desenhar(grupos);
+          }
+        });
+      }
+    }
+  }
+
+  map.on('moveend', atualizar);
+  atualizar();
+});
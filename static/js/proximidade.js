@@ -0,0 +1,40 @@
+// proximidade.js
+// Filtro "Perto de" da pesquisa: com "Minha localização" preenche lat/lng com a posição do navegador.
+document.addEventListener('DOMContentLoaded', function () {
+  const perto = document.getElementById('pertoSelect');
+  const lat = document.getElementById('latInput');
+  const lng = document.getElementById('lngInput');
+  if (!perto || !lat || !lng) {
+    return;
+  }
+
+  perto.addEventListener('change', function () {
+    lat.value = '';
+    lng.value = '';
+    if (perto.value !== 'minha') {
+      return;
+    }
+    if (!navigator.geolocation) {
+      alert('Seu navegador não informa a localização.');
+      perto.value = '';
+      return;
+    }
+    navigator.geolocation.getCurrentPosition(
+      function (posicao) {
+        lat.value = posicao.coords.latitude.toFixed(6);
+        lng.value = posicao.coords.longitude.toFixed(6);
+      },
+      function () {
+        alert('Não foi possível obter a sua localização.');
+        perto.value = '';
+      }
+    );
+  });
+
+  // "minha" não é um ponto de referência: só lat/lng vão na URL
+  perto.form.addEventListener('submit', function () {
+    if (perto.value === 'minha') {
+      perto.disabled = true;
+    }
+  });
+});
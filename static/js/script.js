@@ -129,105 +129,30 @@ document.addEventListener('DOMContentLoaded', () => {
 });
 
 
-// static/js/pesquisa_filtros.js (NOVA VERSÃO PARA NOVOS FILTROS)
+// Filtros da página de pesquisa: a filtragem e a paginação acontecem no servidor,
+// aqui apenas reenviamos o formulário quando algum filtro muda.
 
 document.addEventListener('DOMContentLoaded', () => {
-    const searchInput = document.getElementById('searchInput');
-    const cardContainer = document.getElementById('cardContainer');
-    const allCards = Array.from(cardContainer.querySelectorAll('.card')); // Captura todos os cards uma vez
-
-    // Elementos do filtro de Valor
-    const minValorInput = document.getElementById('minValor');
-    const maxValorInput = document.getElementById('maxValor');
-
-    // Elementos do filtro de Tipo
-    const tipoCheckboxes = document.querySelectorAll('input[name="tipo"]');
+    const filtrosForm = document.getElementById('filtrosForm');
+    if (!filtrosForm) return; // Não estamos na página de pesquisa
 
-    // Elementos do filtro de Quartos (Slider)
+    const searchInput = document.getElementById('searchInput');
     const quartosSlider = document.getElementById('quartosSlider');
     const quartosValueSpan = document.getElementById('quartosValue');
 
-    // Elementos do filtro de Extras
-    const extrasCheckboxes = document.querySelectorAll('input[name="extras"]');
+    // Checkboxes, valores e slider enviam ao mudar
+    filtrosForm.querySelectorAll('input[type="checkbox"], input[type="number"], input[type="range"]')
+        .forEach(input => input.addEventListener('change', () => filtrosForm.requestSubmit()));
 
-    // --- Event Listeners ---
-    searchInput.addEventListener('input', applyFilters); // 'input' para capturar mudanças em tempo real
-    minValorInput.addEventListener('input', applyFilters);
-    maxValorInput.addEventListener('input', applyFilters);
-    tipoCheckboxes.forEach(checkbox => checkbox.addEventListener('change', applyFilters));
+    // Atualiza o span do slider enquanto ele é arrastado
     quartosSlider.addEventListener('input', () => {
-        quartosValueSpan.textContent = quartosSlider.value; // Atualiza o span do slider
-        applyFilters(); // Aplica os filtros ao mover o slider
+        quartosValueSpan.textContent = quartosSlider.value;
     });
-    extrasCheckboxes.forEach(checkbox => checkbox.addEventListener('change', applyFilters));
-
-    // --- Função Principal de Filtragem ---
-    function applyFilters() {
-        const searchTerm = searchInput.value.toLowerCase().trim();
-
-        // Valores de filtro
-        const minValor = parseFloat(minValorInput.value) || 0; // Garante que é um número, ou 0
-        const maxValor = parseFloat(maxValorInput.value) || Infinity; // Garante que é um número, ou infinito
-
-        const selectedTipos = Array.from(tipoCheckboxes)
-                                .filter(checkbox => checkbox.checked)
-                                .map(checkbox => checkbox.value.toLowerCase());
-
-        const minQuartos = parseInt(quartosSlider.value); // Valor do slider
-
-        const selectedExtras = Array.from(extrasCheckboxes)
-                                .filter(checkbox => checkbox.checked)
-                                .map(checkbox => checkbox.value.toLowerCase());
-
-        allCards.forEach(card => {
-            const cardTipo = card.dataset.tipo.toLowerCase();
-            const cardQuartos = parseInt(card.dataset.quartos);
-            const cardValor = parseFloat(card.dataset.valor);
-            const cardEndereco = card.dataset.endereco.toLowerCase();
-            const cardInclusos = card.dataset.extras ? card.dataset.extras.toLowerCase().split(',') : [];
-
-            let matches = true; // Assume que o card corresponde, e desabilita se não
-
-            // 1. Filtro por Busca (Endereço)
-            if (searchTerm && !cardEndereco.includes(searchTerm)) {
-                matches = false;
-            }
-
-            // 2. Filtro por Valor
-            if (matches && (cardValor < minValor || cardValor > maxValor)) {
-                matches = false;
-            }
-
-            // 3. Filtro por Tipo
-            if (matches && selectedTipos.length > 0 && !selectedTipos.includes(cardTipo)) {
-                matches = false;
-            }
-
-            // 4. Filtro por Quartos (Mínimo de Quartos do Slider)
-            if (matches && cardQuartos < minQuartos) {
-                matches = false;
-            }
-
-            // 5. Filtro por Extras (TODOS os selecionados devem estar presentes)
-            if (matches && selectedExtras.length > 0) {
-                const allExtrasPresent = selectedExtras.every(selectedExtra => cardInclusos.includes(selectedExtra));
-                if (!allExtrasPresent) {
-                    matches = false;
-                }
-            }
-
-            // Exibe ou esconde o card
-            if (matches) {
-                card.style.display = 'flex'; // Ou 'block', dependendo do seu CSS de card
-            } else {
-                card.style.display = 'none';
-            }
-        });
-    }
-
-    // Inicializa o valor do span do slider
-    quartosValueSpan.textContent = quartosSlider.value;
 
-    // Aplica os filtros na carga inicial da página
-    applyFilters();
-});
\ No newline at end of file
+    // Busca por endereço: espera o usuário parar de digitar antes de enviar
+    let buscaTimer;
+    searchInput.addEventListener('input', () => {
+        clearTimeout(buscaTimer);
+        buscaTimer = setTimeout(() => filtrosForm.requestSubmit(), 500);
+    });
+});
@@ -0,0 +1,274 @@
+# tarefas.py
+# Fila de tarefas em segundo plano guardada no banco (tabela tarefas), consumida por um
+# pool de threads em cada worker (ou pelo processar_tarefas.py, como processo separado).
+
+import atexit
+import json
+import logging
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from flask import current_app
+
+from database import get_db
+
+log = logging.getLogger(__name__)
+
+# tipo -> função que processa a carga da tarefa (registrada com @tarefa)
+_tipos = {}
+
+
+def tarefa(tipo):
+    """
+    Registra a função que processa as tarefas do `tipo`. Ela recebe a carga (dict)
+    e roda dentro de um app context. Como uma tarefa pode rodar mais de uma vez
+    (nova tentativa, worker que morreu no meio), a função deve poder ser repetida.
+    """
+    def registrar(funcao):
+        _tipos[tipo] = funcao
+        return funcao
+    return registrar
+
+
+def enfileirar(db, tipo, carga, atraso=0):
+    """
+    Insere uma tarefa na fila. Não faz commit: a tarefa entra na mesma transação de
+    quem a criou, então só é vista pelos consumidores se essa transação for confirmada.
+    Depois do commit, chame acordar_fila() para começar na hora neste worker.
+    """
+    ph = "%s" if current_app.config.get('DATABASE_URL') else "?"
+    agora = time.time()
+    db.cursor().execute(
+        f'INSERT INTO tarefas (tipo, carga, disponivel_em, criada_em) VALUES ({ph}, {ph}, {ph}, {ph})',
+        (tipo, json.dumps(carga), agora + atraso, agora)
+    )
+
+
+def _sql_reservar(postgres):
+    """
+    UPDATE que reserva a próxima tarefa disponível (parâmetros: agora, agora).
+    Também usado por verificar_indices.py.
+    """
+    ph = "%s" if postgres else "?"
+    return f"""
+        UPDATE tarefas SET estado = 'processando', iniciada_em = {ph}, tentativas = tentativas + 1
+        WHERE id = (
+            SELECT id FROM tarefas WHERE estado = 'pendente' AND disponivel_em <= {ph}
+            ORDER BY disponivel_em, id LIMIT 1{' FOR UPDATE SKIP LOCKED' if postgres else ''}
+        )
+        RETURNING id, tipo, carga, tentativas
+    """
+
+
+class FilaTarefas:
+    """
+    Consome a tabela tarefas com um pool de `trabalhadores` threads.
+
+    - Uma thread despachante reserva tarefas pendentes (UPDATE ... RETURNING, com
+      FOR UPDATE SKIP LOCKED no PostgreSQL, então vários workers podem consumir a mesma
+      fila) e só reserva quando há uma thread livre: no máximo `trabalhadores` tarefas
+      rodam ao mesmo tempo neste processo.
+    - Tarefas concluídas são apagadas. Em caso de erro a tarefa volta para a fila após
+      espera_base * 2^(tentativas - 1) segundos; depois de `max_tentativas` fica como
+      'falhou', com a mensagem de erro, até ser repetida (processar_tarefas.py --repetir-falhas).
+    - Tarefas em 'processando' há mais de `travada_apos` segundos voltam para a fila.
+    """
+
+    def __init__(self, app, trabalhadores=2, intervalo=5.0, max_tentativas=5,
+                 espera_base=10, travada_apos=600):
+        self.app = app
+        self.trabalhadores = trabalhadores
+        self.intervalo = intervalo
+        self.max_tentativas = max_tentativas
+        self.espera_base = espera_base
+        self.travada_apos = travada_apos
+
+        self._vagas = threading.Semaphore(trabalhadores)
+        self._executor = ThreadPoolExecutor(max_workers=trabalhadores, thread_name_prefix='tarefa')
+        self._lock = threading.Lock()
+        self._stats = {'em_execucao': 0, 'concluidas': 0, 'erros': 0, 'falhas_definitivas': 0}
+        self._acordar = threading.Event()
+        self._parar = threading.Event()
+        self._thread = threading.Thread(target=self._executar, name='fila-tarefas', daemon=True)
+        self._thread.start()
+
+    def acordar(self):
+        self._acordar.set()
+
+    def _executar(self):
+        while not self._parar.is_set():
+            self._recuperar_travadas()
+            while not self._parar.is_set() and self._vagas.acquire(blocking=False):
+                tarefa = self._reservar()
+                if tarefa is None:
+                    self._vagas.release()
+                    break
+                with self._lock:
+                    self._stats['em_execucao'] += 1
+                self._executor.submit(self._rodar, tarefa)
+            self._acordar.wait(self.intervalo)
+            self._acordar.clear()
+
+    def _reservar(self):
+        """
+        Marca a próxima tarefa disponível como 'processando' e a retorna (ou None).
+        """
+        postgres = bool(self.app.config.get('DATABASE_URL'))
+        agora = time.time()
+        try:
+            with self.app.app_context():
+                db = get_db()
+                cur = db.cursor()
+                cur.execute(_sql_reservar(postgres), (agora, agora))
+                linha = cur.fetchone()
+                db.commit()
+                return dict(linha) if linha else None
+        except Exception:
+            log.exception("Erro ao reservar tarefa")
+            return None
+
+    def _recuperar_travadas(self):
+        ph = "%s" if self.app.config.get('DATABASE_URL') else "?"
+        agora = time.time()
+        try:
+            with self.app.app_context():
+                db = get_db()
+                db.cursor().execute(
+                    f"""
+                    UPDATE tarefas SET estado = 'pendente', disponivel_em = {ph}
+                    WHERE estado = 'processando' AND iniciada_em < {ph}
+                    """, (agora, agora - self.travada_apos)
+                )
+                db.commit()
+        except Exception:
+            log.exception("Erro ao recuperar tarefas travadas")
+
+    def _rodar(self, tarefa):
+        ph = "%s" if self.app.config.get('DATABASE_URL') else "?"
+        try:
+            with self.app.app_context():
+                db = get_db()
+                try:
+                    funcao = _tipos.get(tarefa['tipo'])
+                    if funcao is None:
+                        raise LookupError(f"Tipo de tarefa desconhecido: {tarefa['tipo']}")
+                    funcao(json.loads(tarefa['carga']))
+                except Exception as e:
+                    db.rollback()
+                    self._registrar_erro(db, ph, tarefa, e)
+                else:
+                    db.cursor().execute(f'DELETE FROM tarefas WHERE id = {ph}', (tarefa['id'],))
+                    db.commit()
+                    with self._lock:
+                        self._stats['concluidas'] += 1
+        except Exception:
+            # Falha ao falar com o banco: a tarefa fica em 'processando' e é recuperada depois
+            log.exception("Erro ao finalizar a tarefa %s", tarefa['id'])
+        finally:
+            with self._lock:
+                self._stats['em_execucao'] -= 1
+            self._vagas.release()
+            self._acordar.set()  # Há uma thread livre: procura a próxima tarefa
+
+    def _registrar_erro(self, db, ph, tarefa, erro):
+        tentativas = tarefa['tentativas']
+        log.warning("Erro na tarefa %s (%s), tentativa %s: %s", tarefa['id'], tarefa['tipo'], tentativas, erro)
+        cur = db.cursor()
+        if tentativas >= self.max_tentativas:
+            cur.execute(
+                f"UPDATE tarefas SET estado = 'falhou', erro = {ph} WHERE id = {ph}",
+                (str(erro), tarefa['id'])
+            )
+            chave = 'falhas_definitivas'
+        else:
+            espera = self.espera_base * 2 ** (tentativas - 1)
+            cur.execute(
+                f"UPDATE tarefas SET estado = 'pendente', disponivel_em = {ph}, erro = {ph} WHERE id = {ph}",
+                (time.time() + espera, str(erro), tarefa['id'])
+            )
+            chave = 'erros'
+        db.commit()
+        with self._lock:
+            self._stats[chave] += 1
+
+    def encerrar(self):
+        """
+        Para de reservar tarefas e espera as que estão rodando. Chamado na saída do processo.
+        """
+        self._parar.set()
+        self._acordar.set()
+        self._thread.join(timeout=self.intervalo)
+        self._executor.shutdown(wait=True)
+
+    def estatisticas(self):
+        with self._lock:
+            stats = dict(self._stats)
+        stats['trabalhadores'] = self.trabalhadores
+        return stats
+
+
+def profundidade_fila(db):
+    """
+    Quantidade de tarefas em cada estado e a idade (segundos) da pendente mais antiga.
+    """
+    cur = db.cursor()
+    cur.execute('SELECT estado, COUNT(*) AS total FROM tarefas GROUP BY estado')
+    fila = {'pendente': 0, 'processando': 0, 'falhou': 0}
+    fila.update({r['estado']: r['total'] for r in cur.fetchall()})
+    cur.execute("SELECT MIN(criada_em) AS criada_em FROM tarefas WHERE estado = 'pendente'")
+    mais_antiga = cur.fetchone()['criada_em']
+    fila['espera_max'] = round(time.time() - mais_antiga, 1) if mais_antiga else 0.0
+    return fila
+
+
+def repetir_falhas(db, postgres):
+    """
+    Devolve à fila as tarefas que esgotaram as tentativas. Retorna quantas foram.
+    """
+    ph = "%s" if postgres else "?"
+    cur = db.cursor()
+    cur.execute(
+        f"UPDATE tarefas SET estado = 'pendente', tentativas = 0, disponivel_em = {ph} WHERE estado = 'falhou'",
+        (time.time(),)
+    )
+    db.commit()
+    return cur.rowcount
+
+
+# Uma fila por processo: após o fork, cada worker do gunicorn cria a sua
+_fila = None
+_fila_pid = None
+_fila_lock = threading.Lock()
+
+def obter_fila(app):
+    """
+    Retorna o consumidor de tarefas deste processo, criando-o no primeiro uso.
+    Com TAREFAS_TRABALHADORES = 0 o processo não consome tarefas e retorna None.
+    """
+    global _fila, _fila_pid
+    if app.config['TAREFAS_TRABALHADORES'] <= 0:
+        return None
+    if _fila is None or _fila_pid != os.getpid():
+        with _fila_lock:
+            if _fila is None or _fila_pid != os.getpid():
+                _fila = FilaTarefas(
+                    app,
+                    trabalhadores=app.config['TAREFAS_TRABALHADORES'],
+                    intervalo=app.config['TAREFAS_INTERVALO'],
+                    max_tentativas=app.config['TAREFAS_MAX_TENTATIVAS'],
+                    espera_base=app.config['TAREFAS_ESPERA_BASE'],
+                    travada_apos=app.config['TAREFAS_TRAVADA_APOS'],
+                )
+                _fila_pid = os.getpid()
+                atexit.register(_fila.encerrar)
+    return _fila
+
+def acordar_fila():
+    """
+    Avisa o consumidor deste worker que há tarefas novas (use depois do commit).
+    """
+    fila = obter_fila(current_app._get_current_object())
+    if fila:
+        fila.acordar()
@@ -0,0 +1,273 @@
+# telemetria.py
+# Métricas das requisições (latência, status, tamanho da resposta, espera pela conexão e
+# consultas por requisição) no formato de texto do Prometheus, servidas em /metrics.
+#
+# Cada worker do gunicorn soma as suas medições em memória e grava um retrato a cada
+# TELEMETRIA_INTERVALO segundos em TELEMETRIA_PASTA/<pid>.json. O /metrics de qualquer
+# worker junta os retratos de todos, então o Prometheus vê o total do servidor.
+
+import atexit
+import json
+import logging
+import os
+import threading
+from bisect import bisect_left
+
+try:
+    import fcntl  # Só em Unix: sem ele os retratos de workers encerrados não são consolidados
+except ImportError:
+    fcntl = None
+
+log = logging.getLogger(__name__)
+
+# nome -> (tipo, ajuda, rótulos, limites dos baldes dos histogramas)
+METRICAS = {
+    'http_requisicoes_total': (
+        'counter', 'Requisições respondidas, por rota, método e status.', ('endpoint', 'metodo', 'status'), None),
+    'http_duracao_segundos': (
+        'histogram', 'Tempo entre o início e o fim do processamento da requisição.', ('endpoint',),
+        (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)),
+    'http_resposta_bytes': (
+        'histogram', 'Tamanho do corpo da resposta (já comprimido, se for o caso).', ('endpoint',),
+        (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304)),
+    'db_conexao_espera_segundos': (
+        'histogram', 'Tempo para obter a conexão com o banco (pool no PostgreSQL).', ('endpoint',),
+        (0.0001, 0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0, 5.0)),
+    'db_consultas_por_requisicao': (
+        'histogram', 'Comandos SQL executados durante a requisição.', ('endpoint',),
+        (0, 1, 2, 3, 5, 10, 20, 50, 100)),
+}
+
+
+# Histogramas por rota, na ordem em que Telemetria guarda cada série
+HISTOGRAMAS_ROTA = ('http_duracao_segundos', 'http_resposta_bytes',
+                    'db_conexao_espera_segundos', 'db_consultas_por_requisicao')
+_LIMITES_DURACAO, _LIMITES_BYTES, _LIMITES_ESPERA, _LIMITES_CONSULTAS = (METRICAS[n][3] for n in HISTOGRAMAS_ROTA)
+
+
+class Telemetria:
+    """
+    Medições deste worker, somadas em memória. O custo por requisição fica em poucos
+    microssegundos; o trabalho de juntar e formatar é feito só no /metrics.
+    """
+
+    def __init__(self, pasta, intervalo=5.0):
+        self.pasta = pasta
+        self.intervalo = intervalo
+        self.pid = os.getpid()
+
+        self._lock = threading.Lock()
+        self._requisicoes = {}  # (endpoint, método, status) -> total
+        # endpoint -> um histograma por nome em HISTOGRAMAS_ROTA, cada um
+        # [contagem de cada balde..., +Inf, soma]
+        self._series = {}
+        self._parar = threading.Event()
+        os.makedirs(pasta, exist_ok=True)
+        self._thread = threading.Thread(target=self._executar, name='telemetria', daemon=True)
+        self._thread.start()
+
+    def registrar_requisicao(self, endpoint, metodo, status, duracao, tamanho, espera_db, consultas):
+        """
+        Tudo sob um único lock e sem laços: uma busca binária por histograma.
+        """
+        endpoint = endpoint or 'nao_encontrada'
+        chave = (endpoint, metodo, status)
+        with self._lock:
+            self._requisicoes[chave] = self._requisicoes.get(chave, 0) + 1
+            series = self._series.get(endpoint)
+            if series is None:
+                series = self._series[endpoint] = [[0] * (len(METRICAS[nome][3]) + 2) for nome in HISTOGRAMAS_ROTA]
+            h_duracao, h_bytes, h_espera, h_consultas = series
+            h_duracao[bisect_left(_LIMITES_DURACAO, duracao)] += 1  # bisect_left: valor igual ao limite entra no balde (le)
+            h_duracao[-1] += duracao
+            if tamanho is not None:  # Respostas em streaming não têm tamanho conhecido
+                h_bytes[bisect_left(_LIMITES_BYTES, tamanho)] += 1
+                h_bytes[-1] += tamanho
+            if espera_db is not None:  # Só quando a requisição usou o banco
+                h_espera[bisect_left(_LIMITES_ESPERA, espera_db)] += 1
+                h_espera[-1] += espera_db
+                h_consultas[bisect_left(_LIMITES_CONSULTAS, consultas)] += 1
+                h_consultas[-1] += consultas
+
+    def retrato(self):
+        """
+        Cópia das medições, no formato gravado em <pid>.json.
+        """
+        with self._lock:
+            return {
+                'contadores': [['http_requisicoes_total', [e, m, str(s)], v]
+                               for (e, m, s), v in self._requisicoes.items()],
+                'histogramas': [[nome, [endpoint], list(baldes)]
+                                for endpoint, series in self._series.items()
+                                for nome, baldes in zip(HISTOGRAMAS_ROTA, series)
+                                if any(baldes)],  # Sem observações (ex.: rota que nunca usou o banco)
+            }
+
+    # ----- Retratos entre workers -----
+
+    def _executar(self):
+        while not self._parar.wait(self.intervalo):
+            self.gravar()
+
+    def gravar(self):
+        """
+        Grava o retrato deste worker (troca atômica do arquivo) e consolida os de workers
+        que já terminaram, para a pasta não crescer a cada reinício de worker.
+        """
+        try:
+            gravar_json(os.path.join(self.pasta, f'{self.pid}.json'), self.retrato())
+            if fcntl:
+                self._consolidar_encerrados()
+        except Exception:
+            log.exception("Erro ao gravar telemetria")
+
+    def _consolidar_encerrados(self):
+        with open(os.path.join(self.pasta, '.lock'), 'a') as trava:
+            fcntl.flock(trava, fcntl.LOCK_EX)  # Um worker consolida por vez
+            encerrados = [nome for nome in os.listdir(self.pasta)
+                          if nome.endswith('.json') and nome[:-5].isdigit() and not _vivo(int(nome[:-5]))]
+            if not encerrados:
+                return
+            caminho_total = os.path.join(self.pasta, 'encerrados.json')
+            retratos = [ler_json(caminho_total)] + [ler_json(os.path.join(self.pasta, n)) for n in encerrados]
+            gravar_json(caminho_total, _somar(retratos))
+            for nome in encerrados:
+                os.remove(os.path.join(self.pasta, nome))
+
+    def exportar(self):
+        """
+        Texto no formato do Prometheus com a soma deste worker (ao vivo) e dos retratos
+        gravados pelos outros.
+        """
+        retratos = [self.retrato()]
+        with open(os.path.join(self.pasta, '.lock'), 'a') as trava:
+            if fcntl:
+                fcntl.flock(trava, fcntl.LOCK_SH)  # Sem consolidação no meio da leitura (contaria duas vezes)
+            for nome in os.listdir(self.pasta):
+                if nome.endswith('.json') and nome != f'{self.pid}.json':
+                    retratos.append(ler_json(os.path.join(self.pasta, nome)))
+        return formatar_prometheus(_somar(retratos))
+
+    def encerrar(self):
+        """
+        Para a thread e grava o último retrato. Chamado na saída do processo.
+        """
+        self._parar.set()
+        self._thread.join(timeout=self.intervalo)
+        self.gravar()
+
+
+def _vivo(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True  # Existe, mas é de outro usuário
+    return True
+
+
+def gravar_json(caminho, dados):
+    """
+    Grava num temporário e troca de uma vez: quem lê nunca vê o arquivo pela metade.
+    """
+    temporario = f'{caminho}.{os.getpid()}.tmp'
+    with open(temporario, 'w', encoding='utf-8') as f:
+        json.dump(dados, f)
+    os.replace(temporario, caminho)
+
+
+def ler_json(caminho):
+    """
+    Retrato gravado (vazio se o arquivo sumiu ou está corrompido).
+    """
+    try:
+        with open(caminho, encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def _somar(retratos):
+    contadores = {}
+    histogramas = {}
+    for retrato in retratos:
+        for nome, rotulos, valor in retrato.get('contadores', ()):
+            chave = (nome, tuple(rotulos))
+            contadores[chave] = contadores.get(chave, 0) + valor
+        for nome, rotulos, baldes in retrato.get('histogramas', ()):
+            chave = (nome, tuple(rotulos))
+            atual = histogramas.get(chave)
+            if atual is None or len(atual) != len(baldes):  # Limites mudaram entre versões: fica o mais novo
+                histogramas[chave] = list(baldes)
+            else:
+                histogramas[chave] = [a + b for a, b in zip(atual, baldes)]
+    return {
+        'contadores': [[n, list(r), v] for (n, r), v in contadores.items()],
+        'histogramas': [[n, list(r), b] for (n, r), b in histogramas.items()],
+    }
+
+
+# ----- Formato de texto do Prometheus -----
+
+def _escapar(valor):
+    return str(valor).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _rotulos(nomes, valores, extra=''):
+    pares = [f'{n}="{_escapar(v)}"' for n, v in zip(nomes, valores)]
+    if extra:
+        pares.append(extra)
+    return '{' + ','.join(pares) + '}' if pares else ''
+
+
+def _numero(valor):
+    return repr(float(valor)) if isinstance(valor, float) else str(valor)
+
+
+def formatar_prometheus(retrato):
+    por_metrica = {}
+    for nome, rotulos, valor in retrato['contadores'] + retrato['histogramas']:
+        por_metrica.setdefault(nome, []).append((tuple(rotulos), valor))
+
+    linhas = []
+    for nome, (tipo, ajuda, nomes_rotulos, limites) in METRICAS.items():
+        series = sorted(por_metrica.get(nome, ()))
+        if not series:
+            continue
+        linhas.append(f'# HELP {nome} {ajuda}')
+        linhas.append(f'# TYPE {nome} {tipo}')
+        for rotulos, valor in series:
+            if tipo == 'counter':
+                linhas.append(f'{nome}{_rotulos(nomes_rotulos, rotulos)} {_numero(valor)}')
+                continue
+            if len(valor) != len(limites) + 2:
+                continue  # Retrato de uma versão com outros baldes
+            acumulado = 0
+            for limite, quantidade in zip((*limites, '+Inf'), valor[:-1]):
+                acumulado += quantidade
+                le = 'le="+Inf"' if limite == '+Inf' else f'le="{_numero(limite)}"'
+                linhas.append(f'{nome}_bucket{_rotulos(nomes_rotulos, rotulos, le)} {acumulado}')
+            linhas.append(f'{nome}_sum{_rotulos(nomes_rotulos, rotulos)} {_numero(valor[-1])}')
+            linhas.append(f'{nome}_count{_rotulos(nomes_rotulos, rotulos)} {acumulado}')
+    return '\n'.join(linhas) + '\n'
+
+
+# Uma instância por processo: após o fork, cada worker do gunicorn cria a sua
+_telemetria = None
+_telemetria_pid = None
+_telemetria_lock = threading.Lock()
+
+def obter_telemetria(app):
+    """
+    Retorna a telemetria deste processo, criando-a no primeiro uso.
+    """
+    global _telemetria, _telemetria_pid
+    if _telemetria is None or _telemetria_pid != os.getpid():
+        with _telemetria_lock:
+            if _telemetria is None or _telemetria_pid != os.getpid():
+                _telemetria = Telemetria(app.config['TELEMETRIA_PASTA'],
+                                         intervalo=app.config['TELEMETRIA_INTERVALO'])
+                _telemetria_pid = os.getpid()
+                atexit.register(_telemetria.encerrar)
+    return _telemetria
@@ -0,0 +1,177 @@
+# verificar_indices.py
+# Verifica se as consultas mais frequentes da aplicação usam índices.
+# Roda EXPLAIN em cada consulta sobre um banco populado e termina com erro (código 1)
+# se alguma delas cair em uma varredura completa da tabela.
+#
+# Uso:
+#   python verificar_indices.py            -> SQLite temporário, criado e populado do zero
+#   DATABASE_URL=... python verificar_indices.py -> PostgreSQL configurado; os dados de
+#                                              teste são inseridos numa transação desfeita no final
+import os
+import re
+import sys
+import tempfile
+
+from app import app
+from database import get_db, close_db, inicializar_banco
+from geo import geohash
+from properties import (_montar_pesquisa, _montar_tile, SQL_DETALHES_IMOVEL, SQL_MEUS_IMOVEIS,
+                        SQL_EXCLUIR_IMOVEL, SQL_MUDAR_ATIVO)
+from admin import SQL_ESTATISTICAS, SQL_SOLICITACOES_EXCLUSAO, SQL_EXCLUIR_IMOVEIS_DO_USUARIO
+from auth import SQL_IDENTIDADE, SQL_LOGIN, SQL_CONTA_POR_EMAIL, SQL_CONTA_POR_ID
+from imagens import SQL_FOTOS_DO_IMOVEL, SQL_EXCLUIR_FOTOS
+from cache_paginas import SQL_INVALIDACOES
+import emails
+import tarefas
+
+
+def consultas_da_aplicacao(postgres):
+    """
+    Consultas quentes e seus parâmetros, com o SQL tirado do próprio código das rotas
+    (constantes SQL_* e funções que montam o SQL), para que uma mudança na consulta real
+    seja verificada. As escritas com '?' têm o marcador trocado por '%s' no PostgreSQL.
+    """
+    return [
+        ('admin: contadores do painel', SQL_ESTATISTICAS, ()),
+        ('admin: solicitações de exclusão', SQL_SOLICITACOES_EXCLUSAO, ()),
+        ('aceitar_exclusao: imóveis do usuário', SQL_EXCLUIR_IMOVEIS_DO_USUARIO, (1,)),
+        ('meus_imoveis', SQL_MEUS_IMOVEIS, (1,)),
+        ('detalhes_imovel', SQL_DETALHES_IMOVEL, (1,)),
+        ('excluir_imovel (dono)', SQL_EXCLUIR_IMOVEL, (1, 1)),
+        ('parar/ativar anúncio (dono)', SQL_MUDAR_ATIVO, (0, 1, 1)),
+        ('fotos do imóvel (galeria)', SQL_FOTOS_DO_IMOVEL.format(ph='?'), (1,)),
+        ('excluir_fotos', SQL_EXCLUIR_FOTOS.format(ids='?, ?'), (1, 2)),
+        ('identidade do usuário logado', SQL_IDENTIDADE.format(ph='?'), (1,)),
+        ('login', SQL_LOGIN.format(ph='?'), ('u1@exemplo.com', 'x')),
+        ('esqueci_senha: conta do e-mail', SQL_CONTA_POR_EMAIL.format(ph='?'), ('u1@exemplo.com',)),
+        ('resetar_senha: conta do token', SQL_CONTA_POR_ID.format(ph='?'), (1,)),
+        ('fila de tarefas: reservar a próxima', tarefas._sql_reservar(postgres), (1e12, 1e12)),
+        ('caixa de saída de e-mails: reservar um lote', emails._sql_reservar(postgres), (1e12, 1e12, 20)),
+        ('cache de páginas: invalidações recentes', SQL_INVALIDACOES.format(ph='?'), (0.0,)),
+    ]
+
+# Filtros da pesquisa cujo SQL é montado pela própria rota (properties._montar_pesquisa),
+# que muda conforme o banco (FTS5 no SQLite, tsvector no PostgreSQL)
+PESQUISAS = (
+    ('pesquisa (primeira página)', {'quartos': 1}, {}),
+    ('pesquisa (próxima página)', {}, {'apos_valor': 500.0, 'apos_id': 10}),
+    ('pesquisa (faixa de valor)', {'min_valor': 300.0, 'max_valor': 600.0}, {}),
+    ('pesquisa (extras)', {'extras': ['agua', 'internet']}, {}),
+    ('pesquisa (texto)', {'busca': 'rua 12'}, {}),
+    ('pesquisa (texto, próxima página)', {'busca': 'rua'}, {'apos_relevancia': -1.0, 'apos_id': 10}),
+    ('pesquisa (perto de um ponto)', {'geo': {'latitude': -2.905, 'longitude': -41.775, 'raio_km': 2}}, {}),
+    ('pesquisa (perto, próxima página)', {'geo': {'latitude': -2.905, 'longitude': -41.775, 'raio_km': 2}},
+     {'apos_distancia': 0.5, 'apos_id': 10}),
+    ('pesquisa (texto e perto)', {'busca': 'rua', 'geo': {'latitude': -2.905, 'longitude': -41.775, 'raio_km': 2}}, {}),
+    ('api: imóveis numa área do mapa',
+     {'geo': {'latitude': -2.91, 'longitude': -41.77, 'raio_km': 3,
+              'caixa': (-2.93, -2.89, -41.79, -41.75)}}, {}),
+)
+
+# Tiles do mapa (z, x, y) sobre Parnaíba, agrupados por properties._montar_tile
+TILES = (
+    ('mapa: tile da cidade', (13, 3145, 4162)),
+    ('mapa: tile aproximado', (17, 50328, 66592)),
+)
+
+# Padrões de varredura completa em cada banco
+VARREDURA_SQLITE = re.compile(r'^SCAN (\w+)$')
+VARREDURA_POSTGRES = re.compile(r'Seq Scan on (\w+)')
+
+
+def posicao(u, i):
+    """
+    Coordenadas espalhadas por uns 20 km ao redor de Parnaíba, com o geohash.
+    """
+    latitude = -2.9 + ((u * 37 + i * 11) % 200 - 100) / 1000
+    longitude = -41.77 + ((u * 53 + i * 29) % 200 - 100) / 1000
+    return latitude, longitude, geohash(latitude, longitude)
+
+
+def popular(db, postgres, usuarios=200, imoveis_por_usuario=10):
+    """
+    Insere usuários, imóveis e fotos de teste.
+    """
+    ph = '%s' if postgres else '?'
+    cur = db.cursor()
+    tipos = ('apartamento', 'kitnet', 'casa')
+    for u in range(usuarios):
+        cur.execute(
+            f'INSERT INTO usuarios (nome, email, senha, tipo_usuario, solicitacao_exclusao) '
+            f'VALUES ({ph}, {ph}, {ph}, {ph}, {ph})'
+            + (' RETURNING id' if postgres else ''),
+            (f'usuario {u}', f'indices-{u}@exemplo.com', 'x', 'anunciante', 1 if u % 50 == 0 else 0)
+        )
+        user_id = cur.fetchone()[0] if postgres else cur.lastrowid
+        cur.executemany(
+            f'INSERT INTO imoveis (endereco, valor, quartos, extras, tipo, usuario_id, ativo, '
+            f'latitude, longitude, geohash) '
+            f'VALUES ({ph}, {ph}, {ph}, {ph}, {ph}, {ph}, {ph}, {ph}, {ph}, {ph})',
+            [(f'Rua {u}, {i}', 200.0 + (u * 7 + i * 13) % 1500, 1 + i % 4, 3 + (i % 4) * 4,
+              tipos[i % 3], user_id, 0 if i % 5 == 0 else 1, *posicao(u, i))
+             for i in range(imoveis_por_usuario)]
+        )
+        cur.execute(
+            f'INSERT INTO fotos (imovel_id, posicao, caminho) '
+            f'SELECT id, 0, {ph} FROM imoveis WHERE usuario_id = {ph}',
+            (f'indices-{u}.jpg', user_id)
+        )
+
+
+def varreduras_completas(db, postgres, sql, params):
+    """
+    Roda EXPLAIN na consulta e retorna as tabelas lidas por varredura completa.
+    """
+    cur = db.cursor()
+    if postgres:
+        cur.execute('EXPLAIN ' + sql.replace('?', '%s'), params)
+        plano = [row[0] for row in cur.fetchall()]
+        return [m.group(1) for linha in plano for m in [VARREDURA_POSTGRES.search(linha)] if m]
+    cur.execute('EXPLAIN QUERY PLAN ' + sql, params)
+    plano = [row[3] for row in cur.fetchall()]
+    return [m.group(1) for linha in plano for m in [VARREDURA_SQLITE.match(linha)] if m]
+
+
+def verificar():
+    postgres = bool(app.config.get('DATABASE_URL'))
+    with app.app_context():
+        if not postgres:
+            # Banco SQLite temporário para não tocar em instance/banco.db
+            app.config['DATABASE'] = os.path.join(tempfile.mkdtemp(), 'indices.db')
+            inicializar_banco()
+        db = get_db()
+        falhas = []
+        try:
+            if postgres:
+                # Com seqscan desligado o planejador só escolhe Seq Scan se não houver índice utilizável
+                db.cursor().execute('SET LOCAL enable_seqscan = off')
+            popular(db, postgres)
+            if not postgres:
+                db.execute('ANALYZE')
+            consultas = consultas_da_aplicacao(postgres)
+            for nome, busca, apos in PESQUISAS:
+                filtros = {'busca': '', 'min_valor': None, 'max_valor': None, 'tipos': [],
+                           'quartos': None, 'extras': [], 'geo': None, **busca}
+                consultas.append((nome, *_montar_pesquisa(filtros, 25, apos, postgres)))
+            for nome, tile in TILES:
+                consultas.append((nome, *_montar_tile(*tile, postgres)))
+            for nome, sql, params in consultas:
+                tabelas = varreduras_completas(db, postgres, sql, params)
+                if tabelas:
+                    falhas.append(nome)
+                    print(f"FALHA  {nome}: varredura completa em {', '.join(tabelas)}")
+                else:
+                    print(f"ok     {nome}")
+        finally:
+            # Nada do que foi inserido deve permanecer no banco
+            db.rollback()
+            close_db()
+    return falhas
+
+
+if __name__ == '__main__':
+    falhas = verificar()
+    if falhas:
+        print(f"{len(falhas)} consulta(s) sem índice.")
+        sys.exit(1)
+    print("Todas as consultas verificadas usam índices.")